@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Журнал входящих и исходящих сообщений в формате JSONL.
+
+Каждое сообщение - одна строка с JSON объектом. Записи пишет фоновый поток в сегменты, сегмент закрывается по
+размеру или по возрасту и сжимается gzip в отдельном потоке. Имя закрытого сегмента содержит время первой и последней
+записи, поэтому при чтении за период лишние сегменты не открываются.
+
+Чтение из консоли: python audit.py [--telegram-id ID] [--since 2023-09-01T00:00] [--until 2023-09-02T00:00]
+"""
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, Union
+
+from config import AUDIT_LOG_DIR, AUDIT_SEGMENT_MAX_BYTES, AUDIT_SEGMENT_MAX_AGE, AUDIT_QUEUE_SIZE, \
+    AUDIT_FLUSH_INTERVAL
+
+DIRECTION_IN = 'in'
+DIRECTION_OUT = 'out'
+
+# audit-начало-pid-номер.jsonl - открытый сегмент, audit-начало-конец-pid-номер.jsonl.gz - закрытый
+_SEGMENT_RE = re.compile(r'^audit-(\d+)(?:-(\d+))?-(\d+)-(\d+)\.jsonl(\.gz)?$')
+
+
+def _to_timestamp(value: Union[datetime, float, int, None]) -> Union[float, None]:
+    """
+    Приводит время к unix timestamp.
+
+    Args:
+        value: datetime или timestamp
+
+    Returns:
+        float: timestamp
+        None: время не передано
+    """
+    if value is None: return None
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+def get_handler_name(handler) -> Union[str, None]:
+    """
+    Получает имя обработчика для журнала.
+
+    Args:
+        handler: функция обработчика
+
+    Returns:
+        str: имя вида модуль.функция
+        None: обработчик не найден
+    """
+    if handler is None: return None
+    return f'{getattr(handler, "__module__", "")}.{getattr(handler, "__qualname__", repr(handler))}'
+
+
+def _is_process_alive(pid: int) -> bool:
+    """
+    Проверяет, работает ли процесс, открытые сегменты работающих процессов не трогаются.
+
+    Args:
+        pid: id процесса
+
+    Returns:
+        bool: True - процесс работает
+    """
+    if pid == os.getpid(): return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+
+class AuditLog:
+    """Класс журнала сообщений с записью в фоновом потоке, ротацией и сжатием сегментов."""
+
+    def __init__(self,
+                 directory: str = AUDIT_LOG_DIR,
+                 max_bytes: int = AUDIT_SEGMENT_MAX_BYTES,
+                 max_age: float = AUDIT_SEGMENT_MAX_AGE,
+                 queue_size: int = AUDIT_QUEUE_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL) -> None:
+        """
+        init метод.
+
+        Args:
+            directory: папка сегментов
+            max_bytes: размер сегмента в байтах, после которого он закрывается
+            max_age: возраст сегмента в секундах, после которого он закрывается
+            queue_size: максимальное количество записей в очереди
+            flush_interval: максимальное время в секундах, которое запись может ждать в очереди
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread: Union[threading.Thread, None] = None
+        self._compressor: Union[ThreadPoolExecutor, None] = None
+        self._file = None
+        self._path: Union[str, None] = None
+        self._opened_at = 0.0
+        self._first_ts: Union[int, None] = None
+        self._last_ts: Union[int, None] = None
+        self._size = 0
+        # Номер сегмента процесса, чтобы сегменты, открытые в одну секунду, не перезаписывали друг друга
+        self._segment_number = 0
+        self.dropped_count = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Получает количество записей в очереди.
+
+        Returns:
+            int: количество записей
+        """
+        return self._queue.qsize()
+
+    def write(self,
+              direction: str,
+              telegram_id: Union[int, None],
+              chat_id: Union[int, None],
+              handler: Union[str, None] = None,
+              latency: Union[float, None] = None,
+              size: int = 0,
+              **extra) -> bool:
+        """
+        Кладёт запись о сообщении в очередь без ожидания.
+
+        Args:
+            direction: in - входящее, out - исходящее
+            telegram_id: telegram id пользователя
+            chat_id: id чата
+            handler: имя обработчика
+            latency: время обработки или отправки в секундах
+            size: размер сообщения в символах
+            **extra: дополнительные поля записи
+
+        Returns:
+            bool: False - очередь заполнена, запись отброшена
+        """
+        if self._thread is None:
+            self.start()
+        record = {'ts': round(time.time(), 3), 'direction': direction, 'telegram_id': telegram_id, 'chat_id': chat_id,
+                  'handler': handler, 'latency_ms': round(latency * 1000, 1) if latency is not None else None,
+                  'size': size}
+        record.update(extra)
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped_count += 1
+            return False
+
+    def start(self) -> None:
+        """
+        Запускает фоновые потоки записи и сжатия, сжимает сегменты, оставшиеся после прошлого запуска.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._thread is not None: return
+            os.makedirs(self._directory, exist_ok=True)
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audit-compressor')
+            # Сегменты ищутся до запуска потока записи, чтобы не принять свой новый сегмент за оставшийся
+            for name in os.listdir(self._directory):
+                match = _SEGMENT_RE.match(name[:-len('.gz.tmp')] if name.endswith('.gz.tmp') else name)
+                # Сегменты работающих процессов (других воркеров) закрывают и сжимают сами эти процессы
+                if not match or match.group(5) or _is_process_alive(int(match.group(3))): continue
+                path = os.path.join(self._directory, name)
+                if name.endswith('.gz.tmp'):
+                    # Сжатие прервано остановкой процесса, несжатый сегмент остался рядом
+                    os.remove(path)
+                elif match.group(2) is not None:
+                    self._compressor.submit(self._compress, path)
+                else:
+                    self._compressor.submit(self._close_segment, path)
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Дописывает записи из очереди, закрывает и сжимает текущий сегмент.
+
+        Returns:
+            None
+        """
+        if self._thread is None: return
+        try:
+            self._queue.put(None, timeout=self._flush_interval * 10)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=self._flush_interval * 10)
+        self._thread = None
+        self._compressor.shutdown(wait=True)
+        self._compressor = None
+
+    def _open_segment(self, ts: int) -> None:
+        """
+        Открывает новый сегмент.
+
+        Args:
+            ts: время первой записи сегмента
+
+        Returns:
+            None
+        """
+        self._segment_number += 1
+        self._path = os.path.join(self._directory, f'audit-{ts}-{os.getpid()}-{self._segment_number}.jsonl')
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._opened_at = time.monotonic()
+        self._first_ts = ts
+        self._last_ts = ts
+        self._size = self._file.tell()
+
+    def _rotate(self) -> None:
+        """
+        Закрывает текущий сегмент, переименовывает его с временем последней записи и отдаёт на сжатие.
+
+        Returns:
+            None
+        """
+        if self._file is None: return
+        self._file.close()
+        closed_path = os.path.join(self._directory,
+                                   f'audit-{self._first_ts}-{self._last_ts}-{os.getpid()}-{self._segment_number}.jsonl')
+        os.replace(self._path, closed_path)
+        try:
+            self._compressor.submit(self._compress, closed_path)
+        except RuntimeError:
+            # При завершении интерпретатора пул потоков останавливается раньше atexit, сжимаем здесь же
+            self._compress(closed_path)
+        self._file = None
+        self._path = None
+
+    @staticmethod
+    def _close_segment(path: str) -> None:
+        """
+        Закрывает открытый сегмент остановленного процесса, время последней записи берётся из времени изменения файла.
+
+        Args:
+            path: путь к сегменту
+
+        Returns:
+            None
+        """
+        match = _SEGMENT_RE.match(os.path.basename(path))
+        start, pid, number = match.group(1), match.group(3), match.group(4)
+        end = max(int(os.path.getmtime(path)) + 1, int(start))
+        closed_path = os.path.join(os.path.dirname(path), f'audit-{start}-{end}-{pid}-{number}.jsonl')
+        os.replace(path, closed_path)
+        AuditLog._compress(closed_path)
+
+    @staticmethod
+    def _compress(path: str) -> None:
+        """
+        Сжимает закрытый сегмент gzip и удаляет несжатый файл.
+
+        Args:
+            path: путь к сегменту
+
+        Returns:
+            None
+        """
+        with open(path, 'rb') as source, gzip.open(path + '.gz.tmp', 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace(path + '.gz.tmp', path + '.gz')
+        os.remove(path)
+
+    def _write_batch(self, batch: list) -> None:
+        """
+        Пишет пачку записей в текущий сегмент, при необходимости открывая новый.
+
+        Args:
+            batch: список записей
+
+        Returns:
+            None
+        """
+        if self._file is not None and (self._size >= self._max_bytes
+                                       or time.monotonic() - self._opened_at >= self._max_age):
+            self._rotate()
+        if self._file is None:
+            self._open_segment(int(batch[0]['ts']))
+
+        data = ''.join(json.dumps(x, ensure_ascii=False, separators=(',', ':'), default=str) + '\n' for x in batch)
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data.encode('utf-8'))
+        self._last_ts = max(self._last_ts, int(batch[-1]['ts']) + 1)
+
+    def _run(self) -> None:
+        """
+        Цикл фонового потока записи.
+
+        Returns:
+            None
+        """
+        while True:
+            try:
+                record = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                # Сегмент без новых записей тоже закрывается по возрасту
+                if self._file is not None and time.monotonic() - self._opened_at >= self._max_age:
+                    self._rotate()
+                continue
+
+            batch = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+            while not stop:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                if stop:
+                    self._rotate()
+            except Exception:
+                import traceback
+                traceback.print_exc(file=sys.__stderr__)
+            if stop:
+                return
+
+
+def iter_segments(directory: str = AUDIT_LOG_DIR,
+                  since: Union[datetime, float, None] = None,
+                  until: Union[datetime, float, None] = None) -> Iterator[str]:
+    """
+    Получает пути сегментов, которые могут содержать записи за период, в порядке начала сегмента.
+
+    Args:
+        directory: папка сегментов
+        since: начало периода
+        until: конец периода
+
+    Yields:
+        str: путь к сегменту
+    """
+    since, until = _to_timestamp(since), _to_timestamp(until)
+    segments = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        match = _SEGMENT_RE.match(name)
+        if not match: continue
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else None
+        if until is not None and start > until: continue
+        if since is not None and end is not None and end < since: continue
+        segments.append((start, name))
+    for start, name in sorted(segments):
+        yield os.path.join(directory, name)
+
+
+def iter_audit_records(directory: str = AUDIT_LOG_DIR,
+                       telegram_id: int = None,
+                       since: Union[datetime, float, None] = None,
+                       until: Union[datetime, float, None] = None) -> Iterator[dict]:
+    """
+    Построчно читает сегменты журнала и отдаёт записи, подходящие под фильтр, файлы целиком в память не загружаются.
+
+    Args:
+        directory: папка сегментов
+        telegram_id: telegram id пользователя
+        since: начало периода
+        until: конец периода
+
+    Yields:
+        dict: запись журнала
+    """
+    since_ts, until_ts = _to_timestamp(since), _to_timestamp(until)
+    needle = str(telegram_id) if telegram_id is not None else None
+    for path in iter_segments(directory, since_ts, until_ts):
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as file:
+                for line in file:
+                    # Строки без нужного id отбрасываются без разбора JSON
+                    if needle is not None and needle not in line: continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if telegram_id is not None and record.get('telegram_id') != telegram_id: continue
+                    if since_ts is not None and record['ts'] < since_ts: continue
+                    if until_ts is not None and record['ts'] > until_ts: continue
+                    yield record
+        except FileNotFoundError:
+            # Сегмент сжали или закрыли во время чтения
+            continue
+
+
+audit_log = AuditLog()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Чтение журнала сообщений')
+    parser.add_argument('--directory', default=AUDIT_LOG_DIR)
+    parser.add_argument('--telegram-id', type=int)
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    arguments = parser.parse_args()
+    for item in iter_audit_records(arguments.directory, arguments.telegram_id, arguments.since, arguments.until):
+        sys.stdout.write(json.dumps(item, ensure_ascii=False) + '\n')
@@ -0,0 +1,5 @@
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
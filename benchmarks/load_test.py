@@ -0,0 +1,751 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Нагрузочный тест бота целиком без токена Telegram, MYSQL и MongoDB.
+
+Поднимается локальная заглушка Bot API на aiohttp: она отдаёт обновления через getUpdates (или бот получает их
+через webhook), принимает sendMessage/sendPhoto и остальные методы с задержкой и долей ответов 429. MYSQL заменяется
+на уровне соединения, поэтому MYSQLDatabase, счётчики запросов, метрики и трассировка работают как обычно, а ответы
+выбираются по имени запроса из data_base.queries. Вместо MongoDB используется MemoryStorage aiogram. Middleware и
+handlers.other подключаются setup_dispatcher без изменений, для запросов расписания добавляется обработчик /schedule.
+
+Запуск из корня проекта: python -m benchmarks.load_test [--updates 5000] [--mode polling|webhook] [--help]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator, Callable, Dict, List, Union
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import web, ClientSession
+
+API_TOKEN = '123456:BENCHMARK'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+FIRST_TELEGRAM_ID = 1000001
+FIRST_NEW_TELEGRAM_ID = 5000001
+GROUPS_COUNT = 20
+FLOOD_SIZE = 10
+STUDENT_ROLE_ID = 1
+
+# Доли видов обновлений в нагрузке, flood - серия из FLOOD_SIZE сообщений одного пользователя
+UPDATES_MIX = {'schedule': 0.5, 'command': 0.25, 'text': 0.1, 'callback': 0.05, 'new_user': 0.05, 'flood': 0.05}
+
+# Методы, которые могут получить ответ 429
+_SEND_METHODS = {'sendMessage', 'sendPhoto', 'sendVideo', 'sendDocument', 'sendSticker', 'sendMediaGroup',
+                 'editMessageText'}
+_MESSAGE_METHODS = _SEND_METHODS - {'sendMediaGroup'}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Получает перцентиль по отсортированному списку.
+
+    Args:
+        values: отсортированный список значений
+        q: перцентиль от 0 до 1
+
+    Returns:
+        float: значение, 0 - список пуст
+    """
+    if not values: return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+class FakeBotAPI:
+    """Класс заглушки Bot API: отдаёт обновления, отвечает на запросы бота и записывает их."""
+
+    def __init__(self, latency: float, retry_after_rate: float, retry_after: int, seed: int = 42) -> None:
+        """
+        init метод.
+
+        Args:
+            latency: средняя задержка ответа в секундах
+            retry_after_rate: доля запросов отправки, получающих ответ 429
+            retry_after: через сколько секунд повторять запрос после ответа 429
+            seed: seed генератора случайных чисел
+        """
+        self._latency = latency
+        self._retry_after_rate = retry_after_rate
+        self._retry_after = retry_after
+        self._random = random.Random(seed)
+        self._updates = deque()
+        self._updates_event = asyncio.Event()
+        self._message_id = 0
+        self._runner: Union[web.AppRunner, None] = None
+        self.calls = Counter()
+        self.retry_after_count = 0
+
+    def put_update(self, update: dict) -> None:
+        """
+        Кладёт обновление в очередь getUpdates.
+
+        Args:
+            update: обновление в виде словаря Bot API
+
+        Returns:
+            None
+        """
+        self._updates.append(update)
+        self._updates_event.set()
+
+    def _make_message(self, data: dict) -> dict:
+        """
+        Собирает объект отправленного сообщения.
+
+        Args:
+            data: параметры запроса
+
+        Returns:
+            dict: сообщение в виде словаря Bot API
+        """
+        self._message_id += 1
+        chat_id = int(data.get('chat_id') or 0)
+        return {'message_id': self._message_id, 'date': int(time.time()), 'from': BOT_USER,
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+                'text': data.get('text', '')}
+
+    async def _get_updates(self, data: dict) -> web.Response:
+        """
+        Отдаёт обновления, если их нет - ждёт новые до timeout секунд, как настоящий long polling.
+
+        Args:
+            data: параметры запроса
+
+        Returns:
+            web.Response: ответ Bot API
+        """
+        limit = int(data.get('limit') or 100)
+        if not self._updates:
+            self._updates_event.clear()
+            try:
+                await asyncio.wait_for(self._updates_event.wait(), timeout=float(data.get('timeout') or 0) or 0.01)
+            except asyncio.TimeoutError:
+                pass
+        updates = [self._updates.popleft() for x in range(min(limit, len(self._updates)))]
+        return web.json_response({'ok': True, 'result': updates})
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        """
+        Отвечает на запрос к Bot API.
+
+        Args:
+            request: запрос
+
+        Returns:
+            web.Response: ответ Bot API
+        """
+        method = request.match_info['method']
+        data = dict(request.query)
+        if request.can_read_body:
+            data.update({k: v for k, v in (await request.post()).items() if isinstance(v, str)})
+        if method == 'getUpdates':
+            return await self._get_updates(data)
+
+        self.calls[method] += 1
+        if self._latency:
+            await asyncio.sleep(self._random.uniform(0.5, 1.5) * self._latency)
+
+        if method in _SEND_METHODS and self._random.random() < self._retry_after_rate:
+            self.retry_after_count += 1
+            return web.json_response({'ok': False, 'error_code': 429,
+                                      'description': f'Too Many Requests: retry after {self._retry_after}',
+                                      'parameters': {'retry_after': self._retry_after}}, status=429)
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method in _MESSAGE_METHODS:
+            result = self._make_message(data)
+        elif method == 'sendMediaGroup':
+            result = [self._make_message(data) for x in json.loads(data.get('media') or '[]')]
+        elif method == 'getWebhookInfo':
+            result = {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def start(self, host: str, port: int) -> None:
+        """
+        Запускает сервер заглушки.
+
+        Args:
+            host: адрес
+            port: порт
+
+        Returns:
+            None
+        """
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self) -> None:
+        """
+        Останавливает сервер заглушки.
+
+        Returns:
+            None
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeCursor:
+    """Класс курсора заглушки MYSQL, поддерживает async with и await, как курсор aiomysql."""
+
+    def __init__(self, database: 'FakeDatabase') -> None:
+        """
+        init метод.
+
+        Args:
+            database: заглушка MYSQL
+        """
+        self._database = database
+        self._rows = []
+        self.rowcount = 0
+
+    async def execute(self, query: str, params=None) -> int:
+        """
+        Выполняет запрос в заглушке.
+
+        Args:
+            query: SQL запрос
+            params: параметры запроса
+
+        Returns:
+            int: количество строк
+        """
+        if self._database.latency:
+            await asyncio.sleep(self._database.latency)
+        self._rows = self._database.execute(query, params)
+        self.rowcount = len(self._rows)
+        return self.rowcount
+
+    async def fetchall(self) -> list:
+        """
+        Отдаёт все оставшиеся строки.
+
+        Returns:
+            list: строки
+        """
+        rows, self._rows = self._rows, []
+        return rows
+
+    async def fetchmany(self, size: int) -> list:
+        """
+        Отдаёт следующие size строк.
+
+        Args:
+            size: количество строк
+
+        Returns:
+            list: строки
+        """
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    async def close(self) -> None:
+        """
+        Ничего не делает.
+
+        Returns:
+            None
+        """
+
+    async def __aenter__(self) -> 'FakeCursor':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+    def __await__(self):
+        async def get_self() -> 'FakeCursor':
+            return self
+        return get_self().__await__()
+
+
+class FakeConnection:
+    """Класс соединения заглушки MYSQL."""
+
+    def __init__(self, database: 'FakeDatabase') -> None:
+        """
+        init метод.
+
+        Args:
+            database: заглушка MYSQL
+        """
+        self._database = database
+        self.last_usage = time.monotonic()
+
+    def cursor(self, *args) -> FakeCursor:
+        """
+        Создаёт курсор.
+
+        Returns:
+            FakeCursor: курсор
+        """
+        return FakeCursor(self._database)
+
+    async def begin(self) -> None:
+        """Ничего не делает."""
+
+    async def commit(self) -> None:
+        """Ничего не делает."""
+
+    async def rollback(self) -> None:
+        """Ничего не делает."""
+
+
+class FakeDatabase:
+    """Класс заглушки MYSQL, отвечающей на запросы из реестра data_base.queries синтетическими таблицами."""
+
+    def __init__(self, users_count: int, pool_size: int, latency: float, access_mode: str) -> None:
+        """
+        init метод.
+
+        Args:
+            users_count: количество зарегистрированных пользователей
+            pool_size: количество соединений, как MYSQL_POOL_MAX_SIZE
+            latency: задержка выполнения запроса в секундах
+            access_mode: режим доступа бота: allow_all или strict
+        """
+        from data_base.queries import QUERIES, GROUP_CONCAT_FIELDS_SEPARATOR
+
+        self._query_names = {sql_request: name for name, sql_request in QUERIES.items()}
+        self._pool = asyncio.Semaphore(pool_size)
+        self.latency = latency
+        self.queries = Counter()
+
+        student_role = GROUP_CONCAT_FIELDS_SEPARATOR.join([str(STUDENT_ROLE_ID), '10', 'student'])
+        # {telegram_id: строка bot_user вместе с ролями и группами}
+        self.users = {}
+        for index in range(users_count):
+            telegram_id = str(FIRST_TELEGRAM_ID + index)
+            self.users[telegram_id] = {
+                'id': index + 1, 'telegram_id': telegram_id, 'telegram_username': f'user{telegram_id}',
+                'first_name': 'Студент', 'last_name': str(index), 'gender': None, 'is_registered': 1,
+                'terms_agree': 1, 'roles': student_role, 'students_groups_ids': str(index % GROUPS_COUNT + 1)}
+        self.settings = [{'name': 'access_mode', 'value': access_mode},
+                         {'name': 'terms_text', 'value': 'Условия пользования'},
+                         {'name': 'all_messages_prefix', 'value': 'None'}]
+        self.schedules = {x: self._make_schedule(x) for x in range(1, GROUPS_COUNT + 1)}
+
+    @staticmethod
+    def _make_schedule(students_group_id: int) -> list:
+        """
+        Собирает строки расписания группы: по 4 пары с понедельника по субботу на обе недели.
+
+        Args:
+            students_group_id: id группы
+
+        Returns:
+            list: строки ответа на запрос schedule.select_by_students_group_id
+        """
+        rows = []
+        for week_type in (0, 1):
+            for day_number in range(1, 7):
+                for number in range(4):
+                    start = timedelta(hours=8, minutes=30) + timedelta(minutes=100 * number)
+                    rows.append({'institution_id': 1, 'schedule_id': len(rows) + students_group_id * 1000,
+                                 'day_number': day_number, 'week_type': week_type, 'pair_start_time': start,
+                                 'pair_close_time': start + timedelta(minutes=90),
+                                 'pair_name': f'Дисциплина {(day_number + number + students_group_id) % 12 + 1}',
+                                 'lecturer_first_name': 'Иван', 'lecturer_last_name': f'Преподаватель {number}',
+                                 'cabinet_name': str(100 + number)})
+        return rows
+
+    @asynccontextmanager
+    async def get_connection(self) -> AsyncIterator[FakeConnection]:
+        """
+        Выдаёт соединение, соединений не больше pool_size, как в пуле aiomysql.
+
+        Yields:
+            FakeConnection: соединение
+        """
+        async with self._pool:
+            yield FakeConnection(self)
+
+    def execute(self, query: str, params) -> list:
+        """
+        Выполняет запрос: запросы реестра отвечают по имени, остальные возвращают пустой ответ.
+
+        Args:
+            query: SQL запрос
+            params: параметры запроса
+
+        Returns:
+            list: строки ответа
+        """
+        name = self._query_names.get(query, 'raw')
+        self.queries[name] += 1
+        telegram_id = params[0] if params else None
+
+        if name == 'bot_user.select_context_by_telegram_id':
+            user = self.users.get(telegram_id)
+            return [dict(user)] if user else []
+        if name == 'bot_user.insert':
+            telegram_id, username, first_name, last_name, gender = params
+            self.users[telegram_id] = {
+                'id': len(self.users) + 1, 'telegram_id': telegram_id, 'telegram_username': username,
+                'first_name': first_name or '', 'last_name': last_name or '', 'gender': gender,
+                'is_registered': 0, 'terms_agree': 0, 'roles': None, 'students_groups_ids': None}
+            return []
+        if name == 'bot_user.update_terms_agree_by_telegram_id':
+            if params[1] in self.users:
+                self.users[params[1]]['terms_agree'] = int(params[0])
+            return []
+        if name == 'setting.select_all': return [dict(x) for x in self.settings]
+        if name == 'schedule.select_by_students_group_id': return self.schedules.get(int(params[0]), [])
+        if name == 'institution.select_invert_week_types': return [{'id': 1, 'invert_week_type': 0}]
+        if name == 'students_group.select_ids': return [{'id': x} for x in self.schedules]
+        if name == 'bot_role.select_all': return [{'id': STUDENT_ROLE_ID, 'name': 'student', 'priority': 10}]
+        if name == 'bot_role.select_priorities': return [{'id': STUDENT_ROLE_ID, 'priority': 10}]
+        if name == 'bot_user_bot_role.select_all':
+            return [{'bot_user_id': x['id'], 'telegram_id': x['telegram_id'], 'bot_role_id': STUDENT_ROLE_ID}
+                    for x in self.users.values() if x['roles']]
+        if name == 'permission.select_all':
+            return [{'allow_command': command, 'deny_command': None, 'for_bot_user_id': None,
+                     'for_bot_role_id': STUDENT_ROLE_ID} for command in ('start', 'schedule')]
+        return []
+
+
+class LatencyRecorder(BaseMiddleware):
+    """Класс Middleware, подключаемого первым: записывает время обработки каждого обновления."""
+
+    def __init__(self, total: int) -> None:
+        """
+        init метод.
+
+        Args:
+            total: сколько обновлений ожидается
+        """
+        super().__init__()
+        self._total = total
+        self._started = {}
+        # {update_id: (время начала, время окончания)}
+        self.finished: Dict[int, tuple] = {}
+        self.done = asyncio.Event()
+
+    async def on_pre_process_update(self, update, data: dict) -> None:
+        """
+        Запоминает время начала обработки.
+
+        Args:
+            update: обновление
+            data: данные
+
+        Returns:
+            None
+        """
+        self._started[update.update_id] = time.perf_counter()
+
+    async def on_post_process_update(self, update, results: list, data: dict) -> None:
+        """
+        Записывает время окончания обработки.
+
+        Args:
+            update: обновление
+            results: результаты обработчиков
+            data: данные
+
+        Returns:
+            None
+        """
+        self.finished[update.update_id] = (self._started.pop(update.update_id), time.perf_counter())
+        if len(self.finished) >= self._total:
+            self.done.set()
+
+
+def make_updates(count: int, users_count: int, seed: int = 1) -> List[tuple]:
+    """
+    Собирает нагрузку из обновлений разных видов в долях UPDATES_MIX.
+
+    Args:
+        count: количество обновлений
+        users_count: количество зарегистрированных пользователей
+        seed: seed генератора случайных чисел
+
+    Returns:
+        list: список вида [(вид, обновление в виде словаря Bot API)]
+    """
+    rnd = random.Random(seed)
+    kinds, weights = list(UPDATES_MIX.keys()), list(UPDATES_MIX.values())
+    updates = []
+    new_telegram_id = FIRST_NEW_TELEGRAM_ID
+
+    def make_message(telegram_id: int, text: str) -> dict:
+        user = {'id': telegram_id, 'is_bot': False, 'first_name': 'Студент', 'username': f'user{telegram_id}',
+                'language_code': 'ru'}
+        message = {'message_id': len(updates) + 1, 'date': int(time.time()), 'from': user,
+                   'chat': {'id': telegram_id, 'type': 'private'}, 'text': text}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    while len(updates) < count:
+        kind = rnd.choices(kinds, weights)[0]
+        telegram_id = FIRST_TELEGRAM_ID + rnd.randrange(users_count)
+        update_id = len(updates) + 1
+        if kind == 'schedule':
+            updates.append((kind, {'update_id': update_id, 'message': make_message(telegram_id, '/schedule')}))
+        elif kind == 'command':
+            updates.append((kind, {'update_id': update_id, 'message': make_message(telegram_id, '/start')}))
+        elif kind == 'text':
+            updates.append((kind, {'update_id': update_id, 'message': make_message(telegram_id, 'Привет')}))
+        elif kind == 'new_user':
+            updates.append((kind, {'update_id': update_id, 'message': make_message(new_telegram_id, '/start')}))
+            new_telegram_id += 1
+        elif kind == 'callback':
+            message = make_message(telegram_id, 'Меню')
+            message['from'] = BOT_USER
+            updates.append((kind, {'update_id': update_id, 'callback_query': {
+                'id': str(update_id), 'from': make_message(telegram_id, '')['from'], 'chat_instance': '1',
+                'data': 'none', 'message': message}}))
+        else:
+            for x in range(min(FLOOD_SIZE, count - len(updates))):
+                updates.append((kind, {'update_id': len(updates) + 1,
+                                       'message': make_message(telegram_id, 'flood %s' % x)}))
+    return updates
+
+
+async def schedule_command(message, user_context) -> None:
+    """
+    Обработчик /schedule нагрузочного теста: отправляет расписание группы пользователя на сегодня.
+
+    Args:
+        message: сообщение
+        user_context: контекст пользователя из AccessControlMiddleware
+
+    Returns:
+        None
+    """
+    from create_custom_objects import schedule_messages
+
+    if not user_context.students_groups_ids:
+        await message.answer('Вы не состоите в группе')
+        return
+    for message_part in await schedule_messages.get_day_message(user_context.students_groups_ids[0]) or []:
+        await message.answer(message_part)
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """
+    Задаёт переменные окружения до импорта config: адрес заглушки Bot API, токен, без сервера метрик и рассылки
+    расписания.
+
+    Args:
+        args: параметры запуска
+
+    Returns:
+        None
+    """
+    os.environ.update({
+        'API_TOKEN': API_TOKEN,
+        'TELEGRAM_API_SERVER': f'http://{args.host}:{args.api_port}',
+        'METRICS_PORT': '0',
+        'SCHEDULE_PUSH_TIME': '',
+        'MYSQL_POOL_MAX_SIZE': str(args.pool_size),
+        'AUDIT_LOG_DIR': os.path.join(tempfile.gettempdir(), 'telegram_edu_bot_benchmark_audit'),
+    })
+
+
+async def replay(updates: List[tuple], rate: float, put: Callable[[dict], None], enqueued_at: dict) -> None:
+    """
+    Отдаёт обновления с заданной частотой.
+
+    Args:
+        updates: обновления
+        rate: обновлений в секунду, 0 - все сразу
+        put: функция, принимающая очередное обновление
+        enqueued_at: словарь, куда записывается время появления каждого обновления
+
+    Returns:
+        None
+    """
+    started = time.perf_counter()
+    for index, (kind, update) in enumerate(updates):
+        if rate:
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        enqueued_at[update['update_id']] = time.perf_counter()
+        put(update)
+
+
+async def feed_webhook(updates: List[tuple], url: str, concurrency: int, rate: float, enqueued_at: dict) -> None:
+    """
+    Отправляет обновления боту через webhook, как Telegram, не больше concurrency запросов одновременно.
+
+    Args:
+        updates: обновления
+        url: адрес webhook бота
+        concurrency: максимум одновременных запросов, как max_connections у Telegram
+        rate: обновлений в секунду, 0 - все сразу
+        enqueued_at: словарь, куда записывается время появления каждого обновления
+
+    Returns:
+        None
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    async with ClientSession() as session:
+        async def post(update: dict) -> None:
+            async with semaphore:
+                async with session.post(url, json=update) as response:
+                    await response.read()
+
+        await replay(updates, rate, lambda update: tasks.append(asyncio.create_task(post(update))), enqueued_at)
+        await asyncio.gather(*tasks)
+
+
+async def run(args: argparse.Namespace) -> None:
+    """
+    Выполняет нагрузочный тест и печатает результаты.
+
+    Args:
+        args: параметры запуска
+
+    Returns:
+        None
+    """
+    from aiogram import Bot, Dispatcher
+    from aiogram.contrib.fsm_storage.memory import MemoryStorage
+    from aiogram.dispatcher.webhook import get_new_configured_app
+
+    from bot import setup_dispatcher
+    from config import WEBHOOK_MAX_CONNECTIONS
+    from create_bot import dp, bot
+    from create_custom_objects import db, install_state, broadcaster, mm
+
+    api = FakeBotAPI(args.api_latency, args.retry_after_rate, args.retry_after)
+    await api.start(args.host, args.api_port)
+
+    fake_db = FakeDatabase(args.users, args.pool_size, args.db_latency, args.access_mode)
+    db._get_sql_connection = fake_db.get_connection
+    dp.storage = dp.middleware.storage = MemoryStorage()
+    install_state.is_installed = True
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+    updates = make_updates(args.updates, args.users)
+    kinds = {update['update_id']: kind for kind, update in updates}
+    recorder = LatencyRecorder(len(updates))
+    # Обработчик и middleware теста подключаются до setup_dispatcher, чтобы быть первыми
+    dp.middleware.setup(recorder)
+    dp.register_message_handler(schedule_command, commands=['schedule'])
+    setup_dispatcher()
+
+    broadcast_task = None
+    if args.broadcast:
+        deliver = await mm.make_broadcast_deliver(await mm.render_message_parts('Рассылка нагрузочного теста'))
+        recipients = [FIRST_TELEGRAM_ID + x % args.users for x in range(args.broadcast)]
+        broadcast_task = asyncio.create_task(broadcaster.run(recipients, deliver))
+
+    enqueued_at = {}
+    started = time.perf_counter()
+    webhook_runner, polling_task = None, None
+    if args.mode == 'webhook':
+        webhook_runner = web.AppRunner(get_new_configured_app(dp, '/webhook'), access_log=None)
+        await webhook_runner.setup()
+        await web.TCPSite(webhook_runner, args.host, args.webhook_port).start()
+        feed_task = asyncio.create_task(feed_webhook(updates, f'http://{args.host}:{args.webhook_port}/webhook',
+                                                     WEBHOOK_MAX_CONNECTIONS, args.rate, enqueued_at))
+    else:
+        polling_task = asyncio.create_task(dp.start_polling(timeout=1, relax=0, limit=100, fast=True))
+        feed_task = asyncio.create_task(replay(updates, args.rate, api.put_update, enqueued_at))
+
+    try:
+        await asyncio.wait_for(recorder.done.wait(), timeout=args.timeout)
+    except asyncio.TimeoutError:
+        print(f'Не дождались обработки за {args.timeout} сек.: обработано {len(recorder.finished)} из '
+              f'{len(updates)}')
+    elapsed = time.perf_counter() - started
+
+    broadcast_report = await broadcast_task if broadcast_task else None
+    await feed_task
+    if polling_task:
+        dp.stop_polling()
+        await polling_task
+    if webhook_runner:
+        await webhook_runner.cleanup()
+    await (await bot.get_session()).close()
+    await api.stop()
+
+    processing = sorted(end - start for start, end in recorder.finished.values())
+    end_to_end = sorted(end - enqueued_at[update_id] for update_id, (start, end) in recorder.finished.items())
+    by_kind = {}
+    for update_id, (start, end) in recorder.finished.items():
+        by_kind.setdefault(kinds[update_id], []).append(end - start)
+
+    print(f'Режим: {args.mode}, обновлений: {len(recorder.finished)}/{len(updates)}, пользователей: {args.users}, '
+          f'частота: {args.rate or "все сразу"}, '
+          f'задержка Bot API: {args.api_latency * 1000:.0f} мс, доля 429: {args.retry_after_rate:.1%}, '
+          f'задержка MYSQL: {args.db_latency * 1000:.1f} мс')
+    print(f'Пропускная способность: {len(recorder.finished) / elapsed:.1f} обновлений/с за {elapsed:.2f} с')
+    print(f'Обработка обновления: p50 {percentile(processing, 0.5) * 1000:.1f} мс | '
+          f'p99 {percentile(processing, 0.99) * 1000:.1f} мс | max {percentile(processing, 1) * 1000:.1f} мс')
+    print(f'От отправки до конца обработки: p50 {percentile(end_to_end, 0.5) * 1000:.1f} мс | '
+          f'p99 {percentile(end_to_end, 0.99) * 1000:.1f} мс')
+    for kind, values in sorted(by_kind.items()):
+        values.sort()
+        print(f'  {kind:<10} {len(values):>6} шт. | p50 {percentile(values, 0.5) * 1000:8.1f} мс | '
+              f'p99 {percentile(values, 0.99) * 1000:8.1f} мс')
+    print(f'SQL запросов: {sum(fake_db.queries.values())} '
+          f'({sum(fake_db.queries.values()) / max(len(recorder.finished), 1):.2f} на обновление)')
+    for name, count in fake_db.queries.most_common(8):
+        print(f'  {name:<45} {count:>8}')
+    print(f'Запросов к Bot API: {sum(api.calls.values())}, ответов 429: {api.retry_after_count}')
+    for method, count in api.calls.most_common():
+        print(f'  {method:<45} {count:>8}')
+    if broadcast_report:
+        print(f'Рассылка: получателей {len(broadcast_report.results)}, сообщений {broadcast_report.messages_count}, '
+              f'{broadcast_report.throughput:.1f} сообщений/с')
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Разбирает параметры запуска.
+
+    Returns:
+        argparse.Namespace: параметры запуска
+    """
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота с заглушками Bot API, MYSQL и MongoDB')
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling')
+    parser.add_argument('--updates', type=int, default=5000, help='количество обновлений')
+    parser.add_argument('--rate', type=float, default=0, help='обновлений в секунду, 0 - все сразу')
+    parser.add_argument('--users', type=int, default=1000, help='количество зарегистрированных пользователей')
+    parser.add_argument('--broadcast', type=int, default=0, help='получателей рассылки во время нагрузки')
+    parser.add_argument('--api-latency', type=float, default=0.03, help='задержка Bot API в секундах')
+    parser.add_argument('--retry-after-rate', type=float, default=0.005, help='доля ответов 429 на отправку')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry_after в ответе 429')
+    parser.add_argument('--db-latency', type=float, default=0.001, help='задержка SQL запроса в секундах')
+    parser.add_argument('--pool-size', type=int, default=10, help='соединений в пуле MYSQL')
+    parser.add_argument('--access-mode', choices=['allow_all', 'strict'], default='allow_all')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--webhook-port', type=int, default=8082)
+    parser.add_argument('--timeout', type=float, default=300, help='максимальное время теста в секундах')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    configure_environment(arguments)
+    from create_bot import loop
+    loop.run_until_complete(run(arguments))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Замер скорости движка разрешений на синтетических таблицах и сверка его результатов с прежним алгоритмом.
+
+Запуск из корня проекта: python -m benchmarks.perms_engine [количество_строк_permission]
+"""
+import asyncio
+import random
+import sys
+import time
+
+from utils.perms_engine import PermsEngine
+
+ROLES_COUNT = 10
+USERS_COUNT = 5000
+COMMANDS_COUNT = 2000
+PERSONAL_PERMS_SHARE = 0.2
+LEGACY_USERS_SAMPLE = 200
+CHECKS_COUNT = 100000
+
+
+class FakeDatabase:
+    """Класс базы данных, отвечающий синтетическими строками таблиц."""
+
+    def __init__(self, perms_count: int) -> None:
+        """
+        init метод.
+
+        Args:
+            perms_count: количество строк в таблице permission
+        """
+        rnd = random.Random(42)
+        self.roles = [{'id': x, 'priority': x * 10} for x in range(1, ROLES_COUNT + 1)]
+        self.users_roles = []
+        for bot_user_id in range(1, USERS_COUNT + 1):
+            for role_id in rnd.sample(range(1, ROLES_COUNT + 1), rnd.randint(1, 3)):
+                self.users_roles.append({'bot_user_id': bot_user_id,
+                                         'telegram_id': str(1000000 + bot_user_id),
+                                         'bot_role_id': role_id})
+        self.perms = []
+        for _ in range(perms_count):
+            command = f'command_{rnd.randrange(COMMANDS_COUNT)}'
+            allow = rnd.random() < 0.7
+            personal = rnd.random() < PERSONAL_PERMS_SHARE
+            self.perms.append({'allow_command': command if allow else None,
+                               'deny_command': None if allow else command,
+                               'for_bot_user_id': rnd.randint(1, USERS_COUNT) if personal else None,
+                               'for_bot_role_id': None if personal else rnd.randint(1, ROLES_COUNT)})
+
+    async def query(self, name: str, params=None) -> list:
+        """
+        Возвращает строки таблицы, к которой обращается именованный запрос.
+
+        Args:
+            name: имя запроса из data_base.queries
+            params: параметры запроса
+
+        Returns:
+            list: список строк
+        """
+        if name == 'permission.select_all': return self.perms
+        if name == 'bot_user_bot_role.select_all': return self.users_roles
+        return self.roles
+
+
+def legacy_resolve(db: FakeDatabase, bot_user_id: int) -> list:
+    """
+    Алгоритм объединения разрешений до появления движка, для сравнения.
+
+    Args:
+        db: синтетическая база данных
+        bot_user_id: id пользователя бота
+
+    Returns:
+        list: список разрешённых команд
+    """
+    roles_ids = [x['bot_role_id'] for x in db.users_roles if x['bot_user_id'] == bot_user_id]
+    roles_priority = {x['id']: x['priority'] for x in db.roles}
+    always_allow, always_deny = [], []
+    roles_allow, roles_deny = {}, {}
+    for line in db.perms:
+        if line['for_bot_user_id'] == bot_user_id:
+            if line['deny_command']:
+                always_deny.append(line['deny_command'])
+            else:
+                always_allow.append(line['allow_command'])
+        elif line['for_bot_role_id'] in roles_ids:
+            role_priority = roles_priority[line['for_bot_role_id']]
+            roles_allow.setdefault(role_priority, [])
+            roles_deny.setdefault(role_priority, [])
+            if line['deny_command']:
+                roles_deny[role_priority].append(line['deny_command'])
+            else:
+                roles_allow[role_priority].append(line['allow_command'])
+    for role_priority in roles_allow:
+        roles_allow[role_priority] = [x for x in roles_allow[role_priority] if x not in always_deny]
+        roles_deny[role_priority] = [x for x in roles_deny[role_priority] if x not in always_allow]
+    final_allow, final_deny = [], []
+    for index, role_priority in enumerate(sorted(roles_allow.keys(), reverse=True)):
+        if index == 0:
+            final_allow.extend(roles_allow[role_priority])
+            final_deny.extend(roles_deny[role_priority])
+            continue
+        final_deny.extend(x for x in roles_deny[role_priority] if x not in final_allow)
+        final_allow.extend(x for x in roles_allow[role_priority] if x not in final_deny)
+    return list(set(final_allow))
+
+
+async def main(perms_count: int) -> int:
+    """
+    Выполняет замеры и печатает результаты.
+
+    Args:
+        perms_count: количество строк в таблице permission
+
+    Returns:
+        int: количество пользователей, для которых движок и прежний алгоритм дали разные разрешения
+    """
+    db = FakeDatabase(perms_count)
+    engine = PermsEngine(db, cache_size=USERS_COUNT)
+    telegram_ids = [1000000 + x for x in range(1, USERS_COUNT + 1)]
+
+    started = time.perf_counter()
+    await engine.get_allowed_commands(telegram_ids[0])
+    load_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for telegram_id in telegram_ids:
+        await engine.get_allowed_commands(telegram_id)
+    cold_time = (time.perf_counter() - started) / len(telegram_ids)
+
+    rnd = random.Random(1)
+    checks = [(rnd.choice(telegram_ids), f'command_{rnd.randrange(COMMANDS_COUNT)}') for _ in range(CHECKS_COUNT)]
+    started = time.perf_counter()
+    for telegram_id, command in checks:
+        await engine.check_access(telegram_id, command)
+    warm_time = (time.perf_counter() - started) / CHECKS_COUNT
+
+    started = time.perf_counter()
+    for bot_user_id in range(1, LEGACY_USERS_SAMPLE + 1):
+        legacy_resolve(db, bot_user_id)
+    legacy_time = (time.perf_counter() - started) / LEGACY_USERS_SAMPLE
+
+    mismatches = 0
+    for bot_user_id in range(1, LEGACY_USERS_SAMPLE + 1):
+        allowed = await engine.get_allowed_commands(1000000 + bot_user_id)
+        if set(allowed or ()) != set(legacy_resolve(db, bot_user_id)):
+            mismatches += 1
+
+    print(f'Строк permission: {perms_count}, пользователей: {USERS_COUNT}, ролей: {ROLES_COUNT}')
+    print(f'Загрузка и построение индексов: {load_time * 1000:.1f} мс')
+    print(f'Первое получение разрешений пользователя: {cold_time * 1e6:.1f} мкс')
+    print(f'check_access из кэша: {warm_time * 1e6:.2f} мкс')
+    print(f'Прежний алгоритм (без учёта SQL запросов): {legacy_time * 1e6:.1f} мкс на пользователя')
+    print(f'Расхождений с прежним алгоритмом: {mismatches} из {LEGACY_USERS_SAMPLE}')
+    return mismatches
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)) else 0)
@@ -10,29 +10,39 @@
 
 """Файл запускающий бота."""
 
-from aiogram.utils import executor
+import ssl
 
-from config import WEBHOOK_URL
+from aiogram.utils.executor import Executor
+
+from config import WEBHOOK_URL, INSTALL_RECHECK_INTERVAL, BOT_RUN_MODE, WEBHOOK_PATH, WEBHOOK_LISTEN_HOST, \
+    WEBHOOK_LISTEN_PORT, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_SSL_CERT, WEBHOOK_SSL_PRIVATE_KEY, POLLING_LIMIT, \
+    POLLING_TIMEOUT, POLLING_RELAX, POLLING_FAST, SHARDING_WORKERS, TRACING_ENABLED, METRICS_PORT
 from create_bot import dp, bot, i18n
+from create_custom_objects import db, install_state, broadcast_jobs, schedule_messages, week_types, scheduler, \
+    cache_versions
 from handlers import other
 from loggers import ConsoleLogger
+from metrics import metrics_server
 from middlewares.access_control import AccessControlMiddleware
+from middlewares.audit import AuditMiddleware
+from middlewares.metrics import MetricsMiddleware
 from middlewares.check_install import CheckInstalledMiddleware
 from middlewares.throttling import ThrottlingMiddleware
+from middlewares.tracing import TracingMiddleware
 
 
-async def on_startup(_):
-    await bot.set_webhook(WEBHOOK_URL)
-
+def setup_dispatcher() -> None:
+    """
+    Подключает middleware и обработчики, вызывается в каждом процессе, который обрабатывает обновления.
 
-async def on_shutdown(_):
-    await bot.delete_webhook()
-
-
-if __name__ == '__main__':
-    import sys
-    path = 'logs/console.log'
-    sys.stdout = ConsoleLogger(path)
+    Returns:
+        None
+    """
+    # Первыми, чтобы метрики, трасса и время обработки в журнале сообщений включали остальные middleware
+    dp.middleware.setup(MetricsMiddleware())
+    if TRACING_ENABLED:
+        dp.middleware.setup(TracingMiddleware())
+    dp.middleware.setup(AuditMiddleware())
     dp.middleware.setup(i18n)
     dp.middleware.setup(CheckInstalledMiddleware())
     dp.middleware.setup(ThrottlingMiddleware())
@@ -45,4 +55,88 @@ if __name__ == '__main__':
     # root.register_handlers_root(dp)
     other.register_handlers_other(dp)
 
-    executor.start_polling(dp)
+
+async def on_startup(_):
+    certificate = open(WEBHOOK_SSL_CERT, 'rb') if WEBHOOK_SSL_CERT else None
+    try:
+        await bot.set_webhook(WEBHOOK_URL, certificate=certificate, max_connections=WEBHOOK_MAX_CONNECTIONS)
+    finally:
+        if certificate: certificate.close()
+    await on_polling_startup(_)
+
+
+async def on_polling_startup(_):
+    await metrics_server.start(METRICS_PORT)
+    install_state.start_recheck(INSTALL_RECHECK_INTERVAL)
+    broadcast_jobs.start()
+    scheduler.start()
+    week_types.start_rollover()
+    schedule_messages.start_prewarm()
+
+
+async def on_shutdown(_):
+    await install_state.stop_recheck()
+    await cache_versions.stop()
+    await broadcast_jobs.stop()
+    await scheduler.stop()
+    await schedule_messages.stop_prewarm()
+    await week_types.stop_rollover()
+    await db.close()
+    await metrics_server.stop()
+
+
+async def on_webhook_shutdown(_):
+    await bot.delete_webhook()
+    await on_shutdown(_)
+
+
+def start_webhook() -> None:
+    """
+    Запускает бота в режиме webhook: Telegram сам присылает обновления параллельными запросами
+    (до WEBHOOK_MAX_CONNECTIONS одновременно), каждый запрос aiohttp обрабатывает в отдельной задаче.
+
+    Returns:
+        None
+    """
+    ssl_context = None
+    if WEBHOOK_SSL_CERT and WEBHOOK_SSL_PRIVATE_KEY:
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(WEBHOOK_SSL_CERT, WEBHOOK_SSL_PRIVATE_KEY)
+
+    runner = Executor(dp)
+    runner.on_startup(on_startup, polling=False)
+    runner.on_shutdown(on_webhook_shutdown, polling=False)
+    runner.start_webhook(webhook_path=WEBHOOK_PATH, host=WEBHOOK_LISTEN_HOST, port=WEBHOOK_LISTEN_PORT,
+                         ssl_context=ssl_context)
+
+
+def start_polling() -> None:
+    """
+    Запускает бота в режиме long polling, executor.start_polling не принимает limit, поэтому опрос запускается
+    через Executor.start.
+
+    Returns:
+        None
+    """
+    runner = Executor(dp)
+    runner.on_startup(on_polling_startup, webhook=False)
+    runner.on_shutdown(on_shutdown, webhook=False)
+    runner.start(dp.start_polling(reset_webhook=True, timeout=POLLING_TIMEOUT, relax=POLLING_RELAX,
+                                  limit=POLLING_LIMIT, fast=POLLING_FAST))
+
+
+if __name__ == '__main__':
+    import sys
+    path = 'logs/console.log'
+    sys.stdout = ConsoleLogger(path)
+
+    if SHARDING_WORKERS > 0:
+        # Обновления обрабатывают процессы-обработчики, этот процесс только получает их от Telegram
+        from sharding import start_sharded
+        start_sharded()
+    elif BOT_RUN_MODE == 'webhook':
+        setup_dispatcher()
+        start_webhook()
+    else:
+        setup_dispatcher()
+        start_polling()
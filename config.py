@@ -22,6 +22,32 @@ MYSQL_DATABASE_USER = os.environ.get('MYSQL_DATABASE_USER', 'root')
 MYSQL_DATABASE_PASSWORD = os.environ.get('MYSQL_DATABASE_PASSWORD', '')
 MYSQL_DATABASE_HOST = os.environ.get('MYSQL_DATABASE_HOST', '127.0.0.1')
 MYSQL_DATABASE_PORT = int(os.environ.get('MYSQL_DATABASE_PORT', 3306))
+MYSQL_POOL_MIN_SIZE = int(os.environ.get('MYSQL_POOL_MIN_SIZE', 1))
+MYSQL_POOL_MAX_SIZE = int(os.environ.get('MYSQL_POOL_MAX_SIZE', 10))
+MYSQL_POOL_RECYCLE = int(os.environ.get('MYSQL_POOL_RECYCLE', 3600))
+MYSQL_POOL_ACQUIRE_TIMEOUT = float(os.environ.get('MYSQL_POOL_ACQUIRE_TIMEOUT', 10))
+MYSQL_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('MYSQL_POOL_HEALTH_CHECK_INTERVAL', 60))
+MYSQL_QUERIES_PER_UPDATE_WARNING = int(os.environ.get('MYSQL_QUERIES_PER_UPDATE_WARNING', 5))
+# Количество строк в одной части ответа при чтении больших выборок через курсор на стороне сервера
+MYSQL_STREAM_CHUNK_SIZE = int(os.environ.get('MYSQL_STREAM_CHUNK_SIZE', 1000))
+
+SETTINGS_CACHE_TTL = float(os.environ.get('SETTINGS_CACHE_TTL', 60))
+PERMS_CACHE_SIZE = int(os.environ.get('PERMS_CACHE_SIZE', 10000))
+PERMS_CACHE_TTL = float(os.environ.get('PERMS_CACHE_TTL', 300))
+SCHEDULE_CACHE_TTL = float(os.environ.get('SCHEDULE_CACHE_TTL', 600))
+SCHEDULE_MESSAGES_CACHE_SIZE = int(os.environ.get('SCHEDULE_MESSAGES_CACHE_SIZE', 2000))
+# За сколько минут до первой пары дня собирать сообщения с расписанием, 0 - не собирать заранее
+SCHEDULE_PREWARM_LEAD = float(os.environ.get('SCHEDULE_PREWARM_LEAD', 15))
+# Во сколько (ЧЧ:ММ по TIMEZONE) рассылать студентам расписание на следующий день, пустая строка - не рассылать
+SCHEDULE_PUSH_TIME = os.environ.get('SCHEDULE_PUSH_TIME', '19:00')
+SCHEDULER_POLL_INTERVAL = float(os.environ.get('SCHEDULER_POLL_INTERVAL', 30))
+# На сколько секунд задача может опоздать из-за остановки бота, чтобы всё ещё быть выполненной
+SCHEDULER_MISFIRE_GRACE = float(os.environ.get('SCHEDULER_MISFIRE_GRACE', 3600))
+
+# memory - антиспам в памяти процесса, storage - в хранилище FSM (нужен, если бот запущен на нескольких серверах)
+THROTTLING_BACKEND = os.environ.get('THROTTLING_BACKEND', 'memory')
+THROTTLING_MAX_KEYS = int(os.environ.get('THROTTLING_MAX_KEYS', 100000))
+THROTTLING_IDLE_TTL = float(os.environ.get('THROTTLING_IDLE_TTL', 60))
 
 MONGO_DATABASE_NAME = os.environ.get('MONGO_DATABASE_NAME', 'telegram_edu_bot')
 MONGO_DATABASE_USER = os.environ.get('MONGO_DATABASE_NAME', 'admin')
@@ -31,14 +57,63 @@ MONGO_DATABASE_PORT = int(os.environ.get('MONGO_DATABASE_PORT', 5432))
 MONGO_DATABASE_URI = os.environ.get('MONGO_DATABASE_URI',
                                     f'mongodb://{MONGO_DATABASE_USER}:{MONGO_DATABASE_PASSWORD}@{MONGO_DATABASE_HOST}:'
                                     f'{MONGO_DATABASE_PORT}/{MONGO_DATABASE_NAME}')
+# 0 - состояния FSM читаются и записываются в MongoDB без кэша (нужно, если бот запущен на нескольких серверах)
+FSM_CACHE_SIZE = int(os.environ.get('FSM_CACHE_SIZE', 10000))
+FSM_CACHE_FLUSH_INTERVAL = float(os.environ.get('FSM_CACHE_FLUSH_INTERVAL', 1))
 
 TIMEZONE = os.environ.get('TIMEZONE', 'Europe/Moscow')
+WEEK_TYPES_CACHE_TTL = float(os.environ.get('WEEK_TYPES_CACHE_TTL', 3600))
+
+INSTALL_RECHECK_INTERVAL = float(os.environ.get('INSTALL_RECHECK_INTERVAL', 0))
+
+# Максимум записей логов в очереди, при переполнении новые записи отбрасываются
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 500))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 0.5))
+
+# Журнал входящих и исходящих сообщений (JSONL), сегмент закрывается и сжимается по размеру в байтах или возрасту
+AUDIT_LOG_DIR = os.environ.get('AUDIT_LOG_DIR', 'logs/audit')
+AUDIT_SEGMENT_MAX_BYTES = int(os.environ.get('AUDIT_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+AUDIT_SEGMENT_MAX_AGE = float(os.environ.get('AUDIT_SEGMENT_MAX_AGE', 3600))
+AUDIT_QUEUE_SIZE = int(os.environ.get('AUDIT_QUEUE_SIZE', 10000))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1))
+
+# Трассировка обновлений: этапы middleware, SQL запросы и запросы к Bot API
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() in ('true', '1', 'yes')
+# Обновления, обработка которых заняла больше стольких секунд, попадают в лог медленных обновлений с отчётом
+TRACING_SLOW_UPDATE_THRESHOLD = float(os.environ.get('TRACING_SLOW_UPDATE_THRESHOLD', 1))
+TRACING_MAX_SPANS = int(os.environ.get('TRACING_MAX_SPANS', 500))
+
+# Метрики в формате Prometheus, 0 - не запускать сервер метрик. При SHARDING_WORKERS > 0 процесс-обработчик N
+# слушает METRICS_PORT + N
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9100))
+METRICS_PATH = os.environ.get('METRICS_PATH', '/metrics')
+
+BOT_RUN_MODE = os.environ.get('BOT_RUN_MODE', 'polling')
 
 WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST')
 WEBHOOK_PORT = os.environ.get('WEBHOOK_PORT', 8443)
-WEBHOOK_URL = os.environ.get('WEBHOOK_URL', f'https://{WEBHOOK_HOST}:{WEBHOOK_PORT}')
+WEBHOOK_PATH = os.environ.get('WEBHOOK_PATH', '/webhook')
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL') or f'https://{WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}'
+WEBHOOK_LISTEN_HOST = os.environ.get('WEBHOOK_LISTEN_HOST', '0.0.0.0')
+WEBHOOK_LISTEN_PORT = int(os.environ.get('WEBHOOK_LISTEN_PORT', WEBHOOK_PORT))
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', 40))
+WEBHOOK_SSL_CERT = os.environ.get('WEBHOOK_SSL_CERT')
+WEBHOOK_SSL_PRIVATE_KEY = os.environ.get('WEBHOOK_SSL_PRIVATE_KEY')
+
+POLLING_LIMIT = int(os.environ.get('POLLING_LIMIT', 100))
+POLLING_TIMEOUT = int(os.environ.get('POLLING_TIMEOUT', 20))
+POLLING_RELAX = float(os.environ.get('POLLING_RELAX', 0.1))
+POLLING_FAST = os.environ.get('POLLING_FAST', 'true').lower() in ('true', '1', 'yes')
+
+SHARDING_WORKERS = int(os.environ.get('SHARDING_WORKERS', 0))
+SHARDING_QUEUE_SIZE = int(os.environ.get('SHARDING_QUEUE_SIZE', 1000))
+SHARDING_WORKER_CONCURRENCY = int(os.environ.get('SHARDING_WORKER_CONCURRENCY', 100))
+SHARDING_CACHE_SYNC_INTERVAL = float(os.environ.get('SHARDING_CACHE_SYNC_INTERVAL', 5))
 
 API_TOKEN = os.environ.get('API_TOKEN')
+TELEGRAM_API_SERVER = os.environ.get('TELEGRAM_API_SERVER')
 MAX_MESSAGE_LEN = int(os.environ.get('MAX_MESSAGE_LEN', 4096))
 
 OWNER_ID = os.environ.get('OWNER_ID')
@@ -49,6 +124,14 @@ SUPPORT_FILES_LIMIT = int(os.environ.get('SUPPORT_FILES_LIMIT', 3))
 LECTURER_SPAM_FILES_LIMIT = int(os.environ.get('LECTURER_SPAM_FILES_LIMIT', 11))
 SCHEDULE_CHANGES_FILE_LIMIT = int(os.environ.get('SCHEDULE_CHANGES_FILE_LIMIT', 11))
 
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 30))
+BROADCAST_GLOBAL_RATE = float(os.environ.get('BROADCAST_GLOBAL_RATE', 25))
+BROADCAST_PER_CHAT_INTERVAL = float(os.environ.get('BROADCAST_PER_CHAT_INTERVAL', 1))
+BROADCAST_MAX_RETRIES = int(os.environ.get('BROADCAST_MAX_RETRIES', 5))
+BROADCAST_JOBS_CHUNK_SIZE = int(os.environ.get('BROADCAST_JOBS_CHUNK_SIZE', 100))
+BROADCAST_JOBS_POLL_INTERVAL = float(os.environ.get('BROADCAST_JOBS_POLL_INTERVAL', 5))
+FILE_IDS_CACHE_SIZE = int(os.environ.get('FILE_IDS_CACHE_SIZE', 1000))
+
 BAN_MESSAGE = os.environ.get('BAN_MESSAGE', '❌Ваш аккаунт заблокирован администратором❌')
 NO_ACCESS_MESSAGE = os.environ.get('NO_ACCESS_MESSAGE', '❌Нет доступа к команде❌')
 NO_OBJECT_ACCESS_MESSAGE = os.environ.get('NO_OBJECT_ACCESS_MESSAGE', 'Вы не можете использовать данный объект')
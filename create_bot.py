@@ -14,13 +14,15 @@
 import asyncio
 import os
 
-from aiogram import Bot
 from aiogram import Dispatcher
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.contrib.fsm_storage.mongo import MongoStorage
 from aiogram.contrib.middlewares.i18n import I18nMiddleware
 
 from config import MONGO_DATABASE_USER, MONGO_DATABASE_PASSWORD, MONGO_DATABASE_HOST, MONGO_DATABASE_PORT, \
-    MONGO_DATABASE_NAME, API_TOKEN, TEXT_DOMAIN, ABS_PATH
+    MONGO_DATABASE_NAME, API_TOKEN, TEXT_DOMAIN, ABS_PATH, TELEGRAM_API_SERVER, FSM_CACHE_SIZE
+from storages import CachingStorage
+from tracing import TracedBot
 
 loop = asyncio.get_event_loop()
 
@@ -31,8 +33,14 @@ storage = MongoStorage(
     password=MONGO_DATABASE_PASSWORD,
     port=MONGO_DATABASE_PORT,
 )
+if FSM_CACHE_SIZE > 0:
+    storage = CachingStorage(storage)
 
-bot = Bot(token=API_TOKEN, loop=loop)
+# Адрес Bot API можно заменить на локальный сервер Bot API или тестовую заглушку
+server = TelegramAPIServer.from_base(TELEGRAM_API_SERVER) if TELEGRAM_API_SERVER else TELEGRAM_PRODUCTION
+
+# Без трассы обновления (TRACING_ENABLED=false) TracedBot только считает метрики запросов
+bot = TracedBot(token=API_TOKEN, loop=loop, server=server)
 dp = Dispatcher(bot, storage=storage)
 
 i18n = I18nMiddleware(TEXT_DOMAIN, os.path.join(ABS_PATH, 'locales'))
@@ -9,8 +9,45 @@
 # ======================================================================================================================
 
 """Создание кастомных объектов."""
+import os
+
+from audit import audit_log
+from config import ABS_PATH, THROTTLING_BACKEND, SCHEDULE_PUSH_TIME
 from data_base import MYSQLDatabase
-from utils import MessagesManager
+from loggers import log_writer
+from metrics import SQL_POOL_CONNECTIONS, LOG_QUEUE_DEPTH, LOG_DROPPED_TOTAL, AUDIT_QUEUE_DEPTH, AUDIT_DROPPED_TOTAL
+from utils.date_time import WeekTypesCache
+from utils import MessagesManager, PermsEngine, InstallState, Broadcaster, BroadcastJobsWorker, FileIdsCache, \
+    MemoryThrottling, StorageThrottling, ScheduleService, ScheduleMessages, Scheduler, push_tomorrow_schedule, \
+    CacheVersions, CACHE_PERMS, CACHE_SETTINGS, CACHE_SCHEDULE, CACHE_SCHEDULE_MESSAGES, CACHE_WEEK_TYPES
 
 db = MYSQLDatabase()
-mm = MessagesManager()
\ No newline at end of file
+mm = MessagesManager()
+perms_engine = PermsEngine(db)
+week_types = WeekTypesCache()
+schedule_service = ScheduleService(db)
+schedule_messages = ScheduleMessages(schedule_service)
+broadcaster = Broadcaster()
+file_ids_cache = FileIdsCache()
+broadcast_jobs = BroadcastJobsWorker(broadcaster)
+scheduler = Scheduler()
+if SCHEDULE_PUSH_TIME:
+    scheduler.add_daily('schedule_push', SCHEDULE_PUSH_TIME, push_tomorrow_schedule)
+throttling = MemoryThrottling() if THROTTLING_BACKEND == 'memory' else StorageThrottling()
+install_state = InstallState(os.path.join(ABS_PATH, 'bot_installed.txt'))
+
+# Сброс кэшей через cache_versions.publish доходит до всех процессов-обработчиков
+cache_versions = CacheVersions()
+cache_versions.register(CACHE_PERMS, perms_engine.invalidate)
+cache_versions.register(CACHE_SETTINGS, db.settings.invalidate)
+cache_versions.register(CACHE_SCHEDULE, schedule_service.invalidate)
+cache_versions.register(CACHE_SCHEDULE, schedule_messages.invalidate)
+cache_versions.register(CACHE_SCHEDULE_MESSAGES, schedule_messages.invalidate)
+cache_versions.register(CACHE_WEEK_TYPES, week_types.invalidate)
+
+# Значения этих метрик уже хранятся в объектах, они вычисляются при запросе метрик
+SQL_POOL_CONNECTIONS.set_function(db.get_pool_connections)
+LOG_QUEUE_DEPTH.set_function(lambda: log_writer.queue_depth)
+LOG_DROPPED_TOTAL.set_function(lambda: log_writer.dropped_count)
+AUDIT_QUEUE_DEPTH.set_function(lambda: audit_log.queue_depth)
+AUDIT_DROPPED_TOTAL.set_function(lambda: audit_log.dropped_count)
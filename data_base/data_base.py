@@ -12,85 +12,228 @@
 
 from __future__ import annotations
 
-from typing import Union
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Union, AsyncIterator, Iterable
 
-import pymysql
-from pymysql.cursors import Cursor
+import aiomysql
 
 from config import MYSQL_DATABASE_USER, MYSQL_DATABASE_PASSWORD, MYSQL_DATABASE_NAME, MYSQL_DATABASE_PORT, \
-    MYSQL_DATABASE_HOST, BOT_VERSION
+    MYSQL_DATABASE_HOST, MYSQL_POOL_MIN_SIZE, MYSQL_POOL_MAX_SIZE, MYSQL_POOL_RECYCLE, \
+    MYSQL_POOL_ACQUIRE_TIMEOUT, MYSQL_POOL_HEALTH_CHECK_INTERVAL, MYSQL_STREAM_CHUNK_SIZE, SETTINGS_CACHE_TTL
 from create_bot import gettext as _
 from exceptions.bot_stop import UnhandledException
+from data_base.queries import render_query
+from data_base.settings_cache import BotSettingsCache
+from exceptions.data_base import DatabaseBusyException
 from loggers import errors_logger
+from metrics import SQL_QUERIES_TOTAL, SQL_ERRORS_TOTAL, SQL_QUERY_DURATION, SQL_POOL_ACQUIRE_DURATION, \
+    SQL_POOL_ACQUIRE_TIMEOUTS_TOTAL
+from tracing import trace_span, SPAN_SQL
+from utils.cache_versions import CACHE_SETTINGS
 from utils.functions import is_empty
 
 
+# Счётчик запросов текущего обновления, у каждого обновления aiogram своя задача, а значит и свой контекст
+_update_queries_counter: ContextVar[Union[list, None]] = ContextVar('update_queries_counter', default=None)
+
+
 class MYSQLDatabase:
     """Класс для работы с MYSQL базой данных."""
 
-    async def _get_sql_connection(self) -> pymysql.Connection:
+    def __init__(self) -> None:
+        """
+        init метод.
+
+        Пул соединений создаётся при первом запросе, а не при создании объекта, так как для него нужен event loop.
+        """
+        self._pool: Union[aiomysql.Pool, None] = None
+        self._pool_lock = asyncio.Lock()
+        self.queries_count = 0
+        self.settings = BotSettingsCache(self._select_bot_settings, SETTINGS_CACHE_TTL)
+
+    def _count_query(self, kind: str) -> None:
+        """
+        Увеличивает общий счётчик запросов и счётчик запросов текущего обновления.
+
+        Args:
+            kind: вид запроса для метрик: query, transaction или stream
+
+        Returns:
+            None
         """
-        Возвращает объект подключения к БД MySQL.
+        self.queries_count += 1
+        SQL_QUERIES_TOTAL.inc(kind)
+        counter = _update_queries_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+    @staticmethod
+    def start_queries_counter() -> None:
+        """
+        Начинает подсчёт запросов для текущего обновления.
 
         Returns:
-            pymysql.Connection: объект соединения с базой данных MYSQL
+            None
+        """
+        _update_queries_counter.set([0])
+
+    @staticmethod
+    def get_queries_counter() -> Union[int, None]:
+        """
+        Получает количество запросов выполненных в рамках текущего обновления.
+
+        Returns:
+            int: количество запросов
+            None: подсчёт для текущего обновления не запущен
+        """
+        counter = _update_queries_counter.get()
+        return None if counter is None else counter[0]
+
+    def get_pool_connections(self) -> dict:
+        """
+        Получает количество занятых и свободных соединений пула для метрик.
+
+        Returns:
+            dict: словарь вида {(состояние,): количество}, пустой, если пул ещё не создан
+        """
+        if self._pool is None: return {}
+        return {('used',): self._pool.size - self._pool.freesize, ('free',): self._pool.freesize,
+                ('max',): self._pool.maxsize}
+
+    async def _get_pool(self) -> aiomysql.Pool:
+        """
+        Возвращает пул соединений с БД MySQL, при первом вызове создаёт его.
+
+        Returns:
+            aiomysql.Pool: пул соединений с базой данных MYSQL
 
         Raises:
             UnhandledException: не удалось подключиться к MYSQL базе данных
         """
+        if self._pool is not None: return self._pool
+
+        async with self._pool_lock:
+            if self._pool is not None: return self._pool
+            try:
+                self._pool = await aiomysql.create_pool(
+                    host=MYSQL_DATABASE_HOST,
+                    port=MYSQL_DATABASE_PORT,
+                    db=MYSQL_DATABASE_NAME,
+                    user=MYSQL_DATABASE_USER,
+                    password=MYSQL_DATABASE_PASSWORD,
+                    minsize=MYSQL_POOL_MIN_SIZE,
+                    maxsize=MYSQL_POOL_MAX_SIZE,
+                    pool_recycle=MYSQL_POOL_RECYCLE,
+                    cursorclass=aiomysql.DictCursor,
+                    autocommit=True,
+                    charset="utf8"
+                )
+            except Exception as e:
+                message = _('Ошибка при получении соединения с MYSQL: "%s"' % e)
+                errors_logger.exception(message)
+                raise UnhandledException(message)
+        return self._pool
+
+    @asynccontextmanager
+    async def _get_sql_connection(self) -> AsyncIterator[aiomysql.Connection]:
+        """
+        Выдаёт соединение из пула и возвращает его обратно после использования.
+
+        Соединение, простаивавшее дольше MYSQL_POOL_HEALTH_CHECK_INTERVAL секунд, перед выдачей проверяется
+        запросом ping и при необходимости переподключается.
+
+        Yields:
+            aiomysql.Connection: объект соединения с базой данных MYSQL
+
+        Raises:
+            DatabaseBusyException: за MYSQL_POOL_ACQUIRE_TIMEOUT секунд не освободилось ни одного соединения
+        """
+        pool = await self._get_pool()
+        started_at = time.perf_counter()
         try:
-            connection = pymysql.connect(
-                host=MYSQL_DATABASE_HOST,
-                port=MYSQL_DATABASE_PORT,
-                database=MYSQL_DATABASE_NAME,
-                user=MYSQL_DATABASE_USER,
-                password=MYSQL_DATABASE_PASSWORD,
-                cursorclass=pymysql.cursors.DictCursor,
-                autocommit=True,
-                charset="utf8"
-            )
-            return connection
-        except Exception as e:
-            message = _('Ошибка при получении соединения с MYSQL: "%s"' % e)
-            errors_logger.exception(message)
-            raise UnhandledException(message)
+            connection = await asyncio.wait_for(pool.acquire(), timeout=MYSQL_POOL_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            SQL_POOL_ACQUIRE_TIMEOUTS_TOTAL.inc()
+            message = _('Не удалось получить соединение из пула MYSQL за %s сек., занято соединений: %s/%s' % (
+                MYSQL_POOL_ACQUIRE_TIMEOUT, pool.size - pool.freesize, pool.maxsize))
+            errors_logger.error(message)
+            raise DatabaseBusyException(message)
+        SQL_POOL_ACQUIRE_DURATION.observe(time.perf_counter() - started_at)
+
+        try:
+            loop = asyncio.get_running_loop()
+            if loop.time() - connection.last_usage > MYSQL_POOL_HEALTH_CHECK_INTERVAL:
+                await connection.ping(reconnect=True)
+            yield connection
+        finally:
+            await pool.release(connection)
+
+    async def close(self) -> None:
+        """
+        Закрывает все соединения пула, используется при остановке бота.
+
+        Returns:
+            None
+        """
+        if self._pool is None: return
+        self._pool.close()
+        await self._pool.wait_closed()
+        self._pool = None
 
     async def sql_transaction(self, sql_requests: list) -> list:
         """
         Выполняет транзакцию из поступивших SQL запросов.
 
         Args:
-            sql_requests: список SQL запросов
+            sql_requests: список SQL запросов, запрос с параметрами передаётся кортежем (запрос, параметры)
 
         Returns:
-            list: список строк, каждая строка - словарь вида {имя_столбца:значение}
+            list: строки ответа на последний запрос, каждая строка - словарь вида {имя_столбца:значение}
 
         Raises:
             UnhandledException: необрабатываемое исключение во время SQL транзакции
         """
-        try:
-            connection = await self._get_sql_connection()
-            with connection.cursor() as cursor:
-                connection.begin()
-                last_success_request = None
-                for sql_request in sql_requests:
-                    cursor.execute(sql_request)
-                    last_success_request = sql_request
-                connection.commit()
-                connection.close()
-                return [x for x in cursor.fetchall()]
-        except Exception as e:
-            message = _('Ошибка "%s" при выполнении запроса, последний удачный запрос: "%s"' % (e,
-                                                                                                last_success_request))
-            errors_logger.exception(message)
-            raise UnhandledException(message)
-
-    async def sql(self, sql_request: str) -> list:
+        self._count_query('transaction')
+        started_at = time.perf_counter()
+        last_success_request = None
+        with trace_span(SPAN_SQL, 'transaction', statements=len(sql_requests)) as span:
+            async with self._get_sql_connection() as connection:
+                try:
+                    await connection.begin()
+                    async with connection.cursor() as cursor:
+                        for sql_request in sql_requests:
+                            if isinstance(sql_request, tuple):
+                                await cursor.execute(*sql_request)
+                            else:
+                                await cursor.execute(sql_request)
+                            last_success_request = sql_request
+                        await connection.commit()
+                        rows = [x for x in await cursor.fetchall()]
+                        span.set('rows', len(rows))
+                        SQL_QUERY_DURATION.observe(time.perf_counter() - started_at, 'transaction')
+                        return rows
+                except Exception as e:
+                    SQL_ERRORS_TOTAL.inc('transaction')
+                    await connection.rollback()
+                    message = _('Ошибка "%s" при выполнении запроса, последний удачный запрос: "%s"' % (
+                        e, last_success_request))
+                    errors_logger.exception(message)
+                    raise UnhandledException(message)
+
+    async def sql(self,
+                  sql_request: str,
+                  params: Union[tuple, list, dict, None] = None,
+                  query_name: str = None) -> list:
         """
         Выполняет SQL запрос к MYSQL.
 
         Args:
             sql_request: SQL запрос
+            params: параметры запроса, подставляются драйвером вместо %s / %(имя)s с экранированием
+            query_name: имя запроса из реестра data_base.queries, используется в трассировке
 
         Returns:
             list: список строк, каждая строка - словарь вида {имя_столбца:значение}
@@ -98,17 +241,126 @@ class MYSQLDatabase:
         Raises:
             UnhandledException: необрабатываемое исключение при выполнении sql запроса
         """
-        try:
-            connection = await self._get_sql_connection()
-            with connection.cursor() as cursor:
-                cursor.execute(sql_request)
-                connection.commit()
-                connection.close()
-                return [x for x in cursor.fetchall()]  # [{k:v},{k:v}]]
-        except Exception as e:
-            message = _('Ошибка "%s" при выполнении sql запроса: "%s"' % (e, sql_request))
-            errors_logger.exception(message)
-            raise UnhandledException(message)
+        self._count_query('query')
+        started_at = time.perf_counter()
+        with trace_span(SPAN_SQL, query_name or 'sql', sql=sql_request) as span:
+            async with self._get_sql_connection() as connection:
+                try:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(sql_request, params)
+                        rows = [x for x in await cursor.fetchall()]  # [{k:v},{k:v}]]
+                        span.set('rows', len(rows))
+                        SQL_QUERY_DURATION.observe(time.perf_counter() - started_at, 'query')
+                        return rows
+                except Exception as e:
+                    SQL_ERRORS_TOTAL.inc('query')
+                    message = _('Ошибка "%s" при выполнении sql запроса: "%s"' % (e, sql_request))
+                    errors_logger.exception(message)
+                    raise UnhandledException(message)
+
+    async def query(self,
+                    name: str,
+                    params: Union[tuple, list, dict, None] = None,
+                    items_count: Union[int, None] = None) -> list:
+        """
+        Выполняет именованный запрос из реестра data_base.queries.
+
+        Args:
+            name: имя запроса
+            params: параметры запроса
+            items_count: количество элементов списка {items} в запросе, None - запрос без списка
+
+        Returns:
+            list: список строк, каждая строка - словарь вида {имя_столбца:значение}
+
+        Raises:
+            KeyError: запроса с таким именем нет в реестре
+            UnhandledException: необрабатываемое исключение при выполнении sql запроса
+        """
+        return await self.sql(render_query(name, items_count), params, name)
+
+    async def query_pages(self,
+                          name: str,
+                          params: Union[tuple, list, None],
+                          keys: tuple,
+                          chunk_size: int = MYSQL_STREAM_CHUNK_SIZE,
+                          items_count: Union[int, None] = None) -> AsyncIterator[list]:
+        """
+        Выполняет именованный запрос постранично по ключу и отдаёт ответ частями.
+
+        Каждая часть читается отдельным запросом, соединение возвращается в пул сразу после него, поэтому во время
+        обработки части можно выполнять другие запросы даже при пуле из одного соединения, а открытый курсор не
+        упирается в net_write_timeout MYSQL. Запрос должен заканчиваться условием "(ключ) > (%s, ...)", сортировкой
+        по ключу и "LIMIT %s", значения ключа в первом запросе - 0.
+
+        Args:
+            name: имя запроса
+            params: параметры запроса без значений ключа и LIMIT
+            keys: имена столбцов ключа в ответе
+            chunk_size: количество строк в одной части
+            items_count: количество элементов списка {items} в запросе, None - запрос без списка
+
+        Yields:
+            list: часть строк ответа, каждая строка - словарь вида {имя_столбца:значение}
+
+        Raises:
+            KeyError: запроса с таким именем нет в реестре
+            UnhandledException: необрабатываемое исключение при выполнении sql запроса
+        """
+        last_key = [0] * len(keys)
+        while True:
+            rows = await self.query(name, [*(params or ()), *last_key, chunk_size], items_count)
+            if rows:
+                yield rows
+            if len(rows) < chunk_size: return
+            last_key = [rows[-1][key] for key in keys]
+
+    async def sql_stream(self,
+                         sql_request: str,
+                         params: Union[tuple, list, dict, None] = None,
+                         chunk_size: int = MYSQL_STREAM_CHUNK_SIZE) -> AsyncIterator[list]:
+        """
+        Выполняет SQL запрос к MYSQL и отдаёт ответ частями через курсор на стороне сервера, ответ целиком в памяти
+        не хранится.
+
+        Соединение занято до конца чтения ответа, поэтому внутри цикла по частям можно выполнять другие запросы,
+        только если в пуле есть ещё свободные соединения.
+
+        Args:
+            sql_request: SQL запрос
+            params: параметры запроса, подставляются драйвером вместо %s / %(имя)s с экранированием
+            chunk_size: количество строк в одной части
+
+        Yields:
+            list: часть строк ответа, каждая строка - словарь вида {имя_столбца:значение}
+
+        Raises:
+            UnhandledException: необрабатываемое исключение при выполнении sql запроса
+        """
+        self._count_query('stream')
+        started_at = time.perf_counter()
+        async with self._get_sql_connection() as connection:
+            cursor = await connection.cursor(aiomysql.SSDictCursor)
+            try:
+                try:
+                    # Спан только до первой части, между частями выполняется код вызывающего
+                    with trace_span(SPAN_SQL, 'stream', sql=sql_request) as span:
+                        await cursor.execute(sql_request, params)
+                        rows = await cursor.fetchmany(chunk_size)
+                        span.set('rows', len(rows))
+                    # Время до первой части ответа, дальше чтение зависит от вызывающего
+                    SQL_QUERY_DURATION.observe(time.perf_counter() - started_at, 'stream')
+                except Exception as e:
+                    SQL_ERRORS_TOTAL.inc('stream')
+                    message = _('Ошибка "%s" при выполнении sql запроса: "%s"' % (e, sql_request))
+                    errors_logger.exception(message)
+                    raise UnhandledException(message)
+                while rows:
+                    yield list(rows)
+                    rows = await cursor.fetchmany(chunk_size)
+            finally:
+                # Дочитывает непрочитанный остаток ответа, иначе соединение нельзя вернуть в пул
+                await cursor.close()
 
     async def get_bot_user_info_by_telegram_id(self, telegram_id: int) -> Union[dict, None]:
         """
@@ -121,14 +373,8 @@ class MYSQLDatabase:
             dict: Словарь со столбцами из таблицы bot_user
             None: если ничего не найдено
         """
-        sql_request = f"SELECT * FROM `bot_user` WHERE `telegram_id`='{telegram_id}'"
-        response = await self.sql(sql_request)
-        if await is_empty(response): return None
-        user = response[0]
-        for item in user.keys():
-            if type(user[item]) == str:
-                user[item] = user[item].replace("'", "")
-        return user
+        response = await self.query('bot_user.select_by_telegram_id', (str(telegram_id),))
+        return None if await is_empty(response) else response[0]
 
     async def telegram_username_to_telegram_id(self, telegram_username: str) -> Union[int, None]:
         """
@@ -145,8 +391,7 @@ class MYSQLDatabase:
             telegram_username = telegram_username.replace("@", "")
         if await is_empty(telegram_username): return None
 
-        sql_request = f"SELECT `telegram_id` FROM `bot_user` WHERE BINARY `telegram_username`='{telegram_username}'"
-        response = await self.sql(sql_request)
+        response = await self.query('bot_user.select_telegram_id_by_username', (telegram_username,))
 
         return None if await is_empty(response) else int(response[0]['telegram_id'])
 
@@ -161,9 +406,7 @@ class MYSQLDatabase:
             int: список id пользователей бота
             None: если ничего не найдено
         """
-
-        sql_request = f"SELECT `id` FROM `bot_user` WHERE `telegram_id` = '{telegram_id}'"
-        response = await self.sql(sql_request)
+        response = await self.query('bot_user.select_id_by_telegram_id', (str(telegram_id),))
 
         return None if await is_empty(response) else response[0]['id']
 
@@ -178,8 +421,7 @@ class MYSQLDatabase:
             int: id группы
             None: если ничего не найдено
         """
-        sql_request = f"""SELECT `id` FROM `students_group` WHERE `name` = '{students_group_name}')"""
-        response = await self.sql(sql_request)
+        response = await self.query('students_group.select_id_by_name', (students_group_name,))
 
         return None if await is_empty(response) else response[0]['id']
 
@@ -194,34 +436,110 @@ class MYSQLDatabase:
             list: список telegram id студентов
             None: ничего не найдено или группа не существует
         """
-        group_exist = await self.check_students_group_in_db(students_group)
-        if not group_exist: return None
+        telegram_ids = [x async for chunk in self.iter_telegram_ids_by_students_groups([students_group]) for x in chunk]
+        return telegram_ids if telegram_ids else None
 
-        group_id = await self.students_group_name_to_id(students_group)
-        if await is_empty(group_id): return None
-        sql_request = f"SELECT `bot_user_id` FROM `bot_user_students_group` WHERE `students_group_id`='{group_id}'"
-        response = await self.sql(sql_request)
+    async def _iter_telegram_ids(self,
+                                 name: str,
+                                 params: list,
+                                 chunk_size: int,
+                                 items_count: Union[int, None] = None) -> AsyncIterator[list]:
+        """
+        Отдаёт частями telegram id из ответа на именованный запрос со столбцом telegram_id.
 
-        return None if await is_empty(response) else [x['bot_user_id'] for x in response]
+        Args:
+            name: имя запроса
+            params: параметры запроса
+            chunk_size: количество telegram id в одной части
+            items_count: количество элементов списка {items} в запросе, None - запрос без списка
+
+        Yields:
+            list: часть списка telegram id
+        """
+        async for rows in self.query_pages(name, params, ('bot_user_id',), chunk_size, items_count):
+            yield [int(x['telegram_id']) for x in rows]
+
+    def iter_telegram_ids_by_students_groups(self,
+                                             students_groups: Iterable[str],
+                                             chunk_size: int = MYSQL_STREAM_CHUNK_SIZE) -> AsyncIterator[list]:
+        """
+        Получает telegram id зарегистрированных студентов нескольких групп по их названиям частями, студент
+        нескольких групп попадает в ответ один раз.
+
+        Args:
+            students_groups: названия групп
+            chunk_size: количество telegram id в одной части
+
+        Yields:
+            list: часть списка telegram id
+        """
+        students_groups = list(students_groups)
+        return self._iter_telegram_ids('bot_user.select_telegram_ids_by_students_groups_names',
+                                       students_groups, chunk_size, len(students_groups))
+
+    def iter_telegram_ids_by_students_groups_ids(self,
+                                                 students_groups_ids: Iterable[int],
+                                                 chunk_size: int = MYSQL_STREAM_CHUNK_SIZE) -> AsyncIterator[list]:
+        """
+        Получает telegram id зарегистрированных студентов нескольких групп по их id частями, студент
+        нескольких групп попадает в ответ один раз.
+
+        Args:
+            students_groups_ids: id групп
+            chunk_size: количество telegram id в одной части
+
+        Yields:
+            list: часть списка telegram id
+        """
+        students_groups_ids = list(students_groups_ids)
+        return self._iter_telegram_ids('bot_user.select_telegram_ids_by_students_groups_ids',
+                                       students_groups_ids, chunk_size, len(students_groups_ids))
+
+    def iter_telegram_ids_by_institution(self,
+                                         institution_id: int,
+                                         only_students: bool = False,
+                                         chunk_size: int = MYSQL_STREAM_CHUNK_SIZE) -> AsyncIterator[list]:
+        """
+        Получает частями telegram id зарегистрированных пользователей учебного заведения.
+
+        Args:
+            institution_id: id учебного заведения
+            only_students: True - только студенты групп учебного заведения, False - все пользователи, привязанные к
+                           учебному заведению, и студенты его групп
+            chunk_size: количество telegram id в одной части
+
+        Yields:
+            list: часть списка telegram id
+        """
+        if only_students:
+            return self._iter_telegram_ids('bot_user.select_telegram_ids_by_institution_students',
+                                           [institution_id], chunk_size)
+        return self._iter_telegram_ids('bot_user.select_telegram_ids_by_institution',
+                                       [institution_id, institution_id], chunk_size)
+
+    async def _select_bot_settings(self) -> list:
+        """
+        Читает таблицу setting, используется кэшем настроек.
+
+        Returns:
+            list: список строк вида {'name': имя_параметра, 'value': значение}
+        """
+        return await self.query('setting.select_all')
 
     async def get_bot_settings(self) -> Union[dict, None]:
         """
-        Получает настройки бота.
+        Получает настройки бота из кэша настроек.
 
         Returns:
             dict: словарь настроек бота
             None: ничего не найдено
         """
-        sql_request = f"SELECT * FROM `setting`"
-        response = await self.sql(sql_request)
-        settings = {}
-        for item in response:
-            settings.update({item['name']: item['value']})
-        return None if await is_empty(response) else settings
+        settings = await self.settings.get_all()
+        return settings if settings else None
 
     async def update_bot_settings(self, name: str, value: str) -> Union[bool, None]:
         """
-        Обновляет значение переданного параметра.
+        Обновляет значение переданного параметра и сбрасывает кэш настроек.
 
         Args:
             name: имя параметра
@@ -240,8 +558,12 @@ class MYSQLDatabase:
         if not name in settings.keys(): raise UnhandledException(
             _('"%s" - такой параметр не существует, по этому его нельзя обновить' % name))
 
-        sql_request = f"UPDATE `setting` SET `value`='{value}' WHERE `name`='{name}'"
-        await self.sql(sql_request)
+        from create_custom_objects import cache_versions
+
+        try:
+            await self.query('setting.update_value', (value, name))
+        finally:
+            await cache_versions.publish(CACHE_SETTINGS)
 
         return None
 
@@ -255,8 +577,7 @@ class MYSQLDatabase:
         Returns:
             bool: True - telegram id есть в БД, False - telegram id нет в БД
         """
-        sql_request = f"SELECT `telegram_id` FROM `bot_user` WHERE `telegram_id`='{telegram_id}'"
-        response = await self.sql(sql_request)
+        response = await self.query('bot_user.select_id_by_telegram_id', (str(telegram_id),))
         return False if await is_empty(response) else True
 
     async def check_bot_user_registration_by_telegram_id(self, telegram_id: int) -> Union[bool, None]:
@@ -270,8 +591,7 @@ class MYSQLDatabase:
             bool: True - зарегистрирован, False - Не зарегистрирован
             None: не найден
         """
-        sql_request = f"SELECT `is_registered` FROM `bot_user` WHERE `telegram_id`='{telegram_id}'"
-        response = await self.sql(sql_request)
+        response = await self.query('bot_user.select_is_registered_by_telegram_id', (str(telegram_id),))
         if await is_empty(response): return None
 
         return True if response[0]['is_registered'] else False
@@ -286,9 +606,8 @@ class MYSQLDatabase:
         Returns:
             bool: True - есть, False - нет
         """
-        sql_request = f"SELECT `id` FROM `students_group` WHERE `name`='{students_group}'"
-        response = await self.sql(sql_request)
-        return True if await is_empty(response) else False
+        response = await self.query('students_group.select_id_by_name', (students_group,))
+        return False if await is_empty(response) else True
 
     async def add_bot_user_in_db(self,
                                  telegram_id: int,
@@ -310,48 +629,16 @@ class MYSQLDatabase:
         Returns:
             None: метод полностью выполнился
         """
-        sql_request = f"""INSERT INTO 
-                            `bot_user`(
-                                    `telegram_id`, 
-                                    `telegram_username`, 
-                                    `first_name`, 
-                                    `last_name`, 
-                                    `gender`, 
-                                    `is_registered`
-                                ) 
-                        VALUES (
-                            '{telegram_id}', 
-                            {chr(39) if telegram_username else ''}
-                            {telegram_username if telegram_username else 'NULL'}
-                            {chr(39) if telegram_username else ''},
-                            '{first_name}',
-                            '{last_name}',
-                            {chr(39) if gender else ''}{gender if gender else 'NULL'}{chr(39) if gender else ''},
-                            FALSE)"""
-        await self.sql(sql_request)
+        await self.query('bot_user.insert', (str(telegram_id), telegram_username, first_name, last_name, gender))
 
     async def get_all_messages_prefix(self) -> str:
         """
-        Получает префикс всех сообщений.
+        Получает префикс всех сообщений из кэша настроек.
 
         Returns:
             str: Префикс
         """
-        sql_request = "SELECT `value` FROM `setting` WHERE `name` = 'all_messages_prefix'"
-        response = await self.sql(sql_request)
-        if await is_empty(response): return ''
-
-        data = response[0]['value']
-
-        if data == 'bot_version':
-            prefix = f'{BOT_VERSION}\n\n'
-        elif data == 'None':
-            prefix = ''
-        else:
-            prefix = data
-            prefix = prefix.replace("/n", "\n")
-            prefix = prefix.replace("bot_version", BOT_VERSION)
-        return prefix
+        return await self.settings.messages_prefix()
 
     async def get_terms_agree_by_telegram_id(self, telegram_id: int) -> Union[bool, None]:
         """
@@ -364,8 +651,7 @@ class MYSQLDatabase:
             bool: True - принято, False - не приняты
             None: пользователь не найден
         """
-        sql_request = f"SELECT `terms_agree` FROM `bot_user` WHERE `telegram_id`='{telegram_id}'"
-        response = await self.sql(sql_request)
+        response = await self.query('bot_user.select_terms_agree_by_telegram_id', (str(telegram_id),))
 
         if await is_empty(response): return None
         return True if response[0]['terms_agree'] else False
@@ -381,18 +667,14 @@ class MYSQLDatabase:
         Returns:
             None: Метод полностью выполнился
         """
-        sql_request = f"UPDATE `bot_user` SET `terms_agree`={'TRUE' if value else 'FALSE'} WHERE " \
-                      f"`telegram_id`='{telegram_id}'"
-        await self.sql(sql_request)
+        await self.query('bot_user.update_terms_agree_by_telegram_id', (bool(value), str(telegram_id)))
 
     async def get_terms_text(self) -> Union[str, None]:
         """
-        Получает текст пользовательского соглашения.
+        Получает текст пользовательского соглашения из кэша настроек.
 
         Returns:
-            dict: Упакованные данные ответа
+            str: текст пользовательского соглашения
+            None: текст не найден
         """
-        sql_request = "SELECT `value` FROM `setting` WHERE `name`='terms_text'"
-        response = await self.sql(sql_request)
-
-        return None if await is_empty(response) else response[0]['value']
+        return await self.settings.terms_text()
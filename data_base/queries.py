@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Реестр именованных SQL запросов.
+
+Текст запроса собирается один раз при импорте, значения передаются отдельно от текста и подставляются драйвером
+с экранированием. Столбец telegram_id имеет тип VARCHAR, поэтому telegram id передаётся строкой, иначе MYSQL
+не использует индекс.
+
+Запросы, которые читаются частями через query_pages, заканчиваются условием по ключу, сортировкой по нему и LIMIT.
+
+Запросы со списком значений переменной длины (IN (...) и вставка нескольких строк) содержат {items}, вместо
+которого render_query подставляет нужное количество элементов из QUERIES_ITEMS, по умолчанию %s.
+"""
+from typing import Union
+
+# Разделители для GROUP_CONCAT, не встречаются в названиях ролей
+GROUP_CONCAT_FIELDS_SEPARATOR = '\x1f'
+GROUP_CONCAT_ITEMS_SEPARATOR = '\x1e'
+
+QUERIES = {
+    # Пользователи
+    'bot_user.select_by_telegram_id': "SELECT * FROM `bot_user` WHERE `telegram_id` = %s",
+    'bot_user.select_id_by_telegram_id': "SELECT `id` FROM `bot_user` WHERE `telegram_id` = %s",
+    'bot_user.select_telegram_id_by_username':
+        "SELECT `telegram_id` FROM `bot_user` WHERE BINARY `telegram_username` = %s",
+    'bot_user.select_is_registered_by_telegram_id': "SELECT `is_registered` FROM `bot_user` WHERE `telegram_id` = %s",
+    'bot_user.select_terms_agree_by_telegram_id': "SELECT `terms_agree` FROM `bot_user` WHERE `telegram_id` = %s",
+    'bot_user.insert':
+        "INSERT INTO `bot_user`(`telegram_id`, `telegram_username`, `first_name`, `last_name`, `gender`, "
+        "`is_registered`) VALUES (%s, %s, %s, %s, %s, FALSE)",
+    'bot_user.update_is_registered_by_telegram_id':
+        "UPDATE `bot_user` SET `is_registered` = %s WHERE `telegram_id` = %s",
+    'bot_user.update_terms_agree_by_telegram_id': "UPDATE `bot_user` SET `terms_agree` = %s WHERE `telegram_id` = %s",
+    'bot_user.select_context_by_telegram_id':
+        "SELECT `bot_user`.*, (SELECT GROUP_CONCAT(CONCAT_WS('" + GROUP_CONCAT_FIELDS_SEPARATOR + "', "
+        "`bot_role`.`id`, `bot_role`.`priority`, `bot_role`.`name`) SEPARATOR '" + GROUP_CONCAT_ITEMS_SEPARATOR +
+        "') FROM `bot_user_bot_role` JOIN `bot_role` ON `bot_role`.`id` = `bot_user_bot_role`.`bot_role_id` "
+        "WHERE `bot_user_bot_role`.`bot_user_id` = `bot_user`.`id`) AS `roles`, "
+        "(SELECT GROUP_CONCAT(`bot_user_students_group`.`students_group_id`) FROM `bot_user_students_group` "
+        "WHERE `bot_user_students_group`.`bot_user_id` = `bot_user`.`id`) AS `students_groups_ids` "
+        "FROM `bot_user` WHERE `bot_user`.`telegram_id` = %s",
+
+    # Роли и разрешения
+    'bot_role.select_all': "SELECT * FROM `bot_role` ORDER BY `priority` DESC",
+    'bot_role.select_priorities': "SELECT `id`, `priority` FROM `bot_role`",
+    'bot_role.select_by_telegram_id':
+        "SELECT `bot_role`.`id`, `bot_role`.`name`, `bot_role`.`priority` FROM `bot_user_bot_role` INNER JOIN "
+        "`bot_role` ON `bot_role`.`id` = `bot_user_bot_role`.`bot_role_id` INNER JOIN `bot_user` ON `bot_user`.`id` = "
+        "`bot_user_bot_role`.`bot_user_id` WHERE `bot_user`.`telegram_id` = %s",
+    'bot_user_bot_role.select_all':
+        "SELECT `bot_user_bot_role`.`bot_user_id`, `bot_user`.`telegram_id`, `bot_user_bot_role`.`bot_role_id` "
+        "FROM `bot_user_bot_role` JOIN `bot_user` ON `bot_user`.`id` = `bot_user_bot_role`.`bot_user_id`",
+    'bot_user_bot_role.insert': "INSERT INTO `bot_user_bot_role`(`bot_user_id`, `bot_role_id`) VALUES (%s, %s)",
+    'permission.select_all':
+        "SELECT `allow_command`, `deny_command`, `for_bot_user_id`, `for_bot_role_id` FROM `permission`",
+
+    # Настройки
+    'setting.select_all': "SELECT `name`, `value` FROM `setting`",
+    'setting.update_value': "UPDATE `setting` SET `value` = %s WHERE `name` = %s",
+
+    # Учебные заведения, группы и расписание
+    'institution.select_invert_week_types': "SELECT `id`, `invert_week_type` FROM `institution`",
+    'students_group.select_ids': "SELECT `id` FROM `students_group`",
+    'students_group.select_id_by_name': "SELECT `id` FROM `students_group` WHERE `name` = %s",
+    'schedule.select_by_students_group_id':
+        "SELECT `institution_students_group`.`institution_id`, `schedule`.`id` AS `schedule_id`, "
+        "`schedule`.`day_number`, `schedule`.`week_type`, `schedule`.`pair_start_time`, "
+        "`schedule`.`pair_close_time`, `pair`.`name` AS `pair_name`, `lecturer`.`first_name` AS "
+        "`lecturer_first_name`, `lecturer`.`last_name` AS `lecturer_last_name`, `cabinet`.`name` AS "
+        "`cabinet_name` FROM `students_group` LEFT JOIN `institution_students_group` ON "
+        "`institution_students_group`.`students_group_id` = `students_group`.`id` LEFT JOIN `schedule` ON "
+        "`schedule`.`students_group_id` = `students_group`.`id` LEFT JOIN `pair` ON `pair`.`id` = "
+        "`schedule`.`pair_id` LEFT JOIN `lecturer` ON `lecturer`.`id` = `schedule`.`lecturer_id` LEFT JOIN "
+        "`cabinet` ON `cabinet`.`id` = `schedule`.`cabinet_id` WHERE `students_group`.`id` = %s "
+        "ORDER BY `schedule`.`day_number`, `schedule`.`pair_start_time`",
+    'schedule_change.insert': "INSERT INTO `schedule_change`(`photo_id`) VALUES (%s)",
+
+    # Получатели рассылок
+    'bot_user.select_telegram_ids_by_students_groups_names':
+        "SELECT DISTINCT `bot_user`.`id` AS `bot_user_id`, `bot_user`.`telegram_id` FROM `students_group` INNER JOIN "
+        "`bot_user_students_group` ON `bot_user_students_group`.`students_group_id` = `students_group`.`id` INNER JOIN "
+        "`bot_user` ON `bot_user`.`id` = `bot_user_students_group`.`bot_user_id` WHERE `bot_user`.`is_registered` = "
+        "TRUE AND `students_group`.`name` IN ({items}) AND `bot_user`.`id` > %s ORDER BY `bot_user`.`id` LIMIT %s",
+    'bot_user.select_telegram_ids_by_students_groups_ids':
+        "SELECT DISTINCT `bot_user`.`id` AS `bot_user_id`, `bot_user`.`telegram_id` FROM `bot_user_students_group` "
+        "INNER JOIN `bot_user` ON `bot_user`.`id` = `bot_user_students_group`.`bot_user_id` WHERE "
+        "`bot_user`.`is_registered` = TRUE AND `bot_user_students_group`.`students_group_id` IN ({items}) AND "
+        "`bot_user`.`id` > %s ORDER BY `bot_user`.`id` LIMIT %s",
+    'bot_user.select_telegram_ids_by_institution_students':
+        "SELECT `bot_user`.`id` AS `bot_user_id`, `bot_user`.`telegram_id` FROM `bot_user` WHERE "
+        "`bot_user`.`is_registered` = TRUE AND "
+        "`bot_user`.`id` IN (SELECT `bot_user_students_group`.`bot_user_id` FROM `institution_students_group` "
+        "INNER JOIN `bot_user_students_group` ON `bot_user_students_group`.`students_group_id` = "
+        "`institution_students_group`.`students_group_id` WHERE `institution_students_group`.`institution_id` = %s) "
+        "AND `bot_user`.`id` > %s ORDER BY `bot_user`.`id` LIMIT %s",
+    'bot_user.select_telegram_ids_by_institution':
+        "SELECT `bot_user`.`id` AS `bot_user_id`, `bot_user`.`telegram_id` FROM `bot_user` WHERE "
+        "`bot_user`.`is_registered` = TRUE AND "
+        "`bot_user`.`id` IN (SELECT `bot_user_students_group`.`bot_user_id` FROM `institution_students_group` "
+        "INNER JOIN `bot_user_students_group` ON `bot_user_students_group`.`students_group_id` = "
+        "`institution_students_group`.`students_group_id` WHERE `institution_students_group`.`institution_id` = %s "
+        "UNION SELECT `bot_user_id` FROM `institution_bot_user` WHERE `institution_id` = %s) "
+        "AND `bot_user`.`id` > %s ORDER BY `bot_user`.`id` LIMIT %s",
+    'bot_user_students_group.select_registered_telegram_ids':
+        "SELECT `bot_user_students_group`.`students_group_id`, `bot_user`.`id` AS `bot_user_id`, "
+        "`bot_user`.`telegram_id` FROM `bot_user_students_group` INNER JOIN `bot_user` ON `bot_user`.`id` = "
+        "`bot_user_students_group`.`bot_user_id` WHERE `bot_user`.`is_registered` = TRUE AND "
+        "(`bot_user_students_group`.`students_group_id`, `bot_user`.`id`) > (%s, %s) ORDER BY "
+        "`bot_user_students_group`.`students_group_id`, `bot_user`.`id` LIMIT %s",
+
+    # Задания рассылки
+    'broadcast_job.insert_preparing':
+        "INSERT INTO `broadcast_job`(`status`, `message_text`, `parse_mode`, `sticker_id`, `files`, `reply_markup`, "
+        "`deny_none`, `report_chat_id`, `report_log`) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+    'broadcast_job.insert':
+        "INSERT INTO `broadcast_job`(`message_text`, `parse_mode`, `sticker_id`, `files`, `reply_markup`, "
+        "`deny_none`, `report_chat_id`, `report_log`, `recipients_count`) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+    'broadcast_job.select_last_insert_id': "SELECT LAST_INSERT_ID() AS `id`",
+    'broadcast_job.set_last_insert_id': "SET @broadcast_job_id = LAST_INSERT_ID()",
+    'broadcast_job.select_inserted_id': "SELECT @broadcast_job_id AS `id`",
+    'broadcast_job.select_progress':
+        "SELECT `status`, `recipients_count`, `cursor_position`, `success_count`, `errors_count`, `created_at`, "
+        "`started_at`, `finished_at` FROM `broadcast_job` WHERE `id` = %s",
+    'broadcast_job.select_report':
+        "SELECT `messages_count`, `started_at`, `finished_at` FROM `broadcast_job` WHERE `id` = %s",
+    'broadcast_job.select_status': "SELECT `status` FROM `broadcast_job` WHERE `id` = %s",
+    'broadcast_job.select_next':
+        "SELECT * FROM `broadcast_job` WHERE `status` IN (%s, %s) ORDER BY `id` LIMIT 1",
+    'broadcast_job.update_started':
+        "UPDATE `broadcast_job` SET `status` = %s, `started_at` = COALESCE(`started_at`, NOW()) WHERE `id` = %s",
+    'broadcast_job.update_prepared':
+        "UPDATE `broadcast_job` SET `status` = %s, `recipients_count` = %s WHERE `id` = %s",
+    'broadcast_job.update_finished':
+        "UPDATE `broadcast_job` SET `status` = %s, `finished_at` = NOW() WHERE `id` = %s",
+    'broadcast_job.update_canceled':
+        "UPDATE `broadcast_job` SET `status` = %s, `finished_at` = NOW() WHERE `id` = %s AND `status` IN (%s, %s)",
+    'broadcast_job.update_progress':
+        "UPDATE `broadcast_job` SET `cursor_position` = %s, `success_count` = `success_count` + %s, "
+        "`errors_count` = `errors_count` + %s, `messages_count` = `messages_count` + %s WHERE `id` = %s",
+    'broadcast_job.delete': "DELETE FROM `broadcast_job` WHERE `id` = %s",
+    'broadcast_job.delete_stale':
+        "DELETE FROM `broadcast_job` WHERE `status` = %s AND `created_at` < NOW() - INTERVAL %s MINUTE",
+    'broadcast_job_recipient.insert_many':
+        "INSERT INTO `broadcast_job_recipient`(`job_id`, `position`, `telegram_id`) VALUES {items}",
+    'broadcast_job_recipient.insert_many_for_inserted_job':
+        "INSERT INTO `broadcast_job_recipient`(`job_id`, `position`, `telegram_id`) VALUES {items}",
+    'broadcast_job_recipient.select_processed':
+        "SELECT `telegram_id`, `status`, `error` FROM `broadcast_job_recipient` WHERE `job_id` = %s AND "
+        "`status` != %s ORDER BY `position`",
+    'broadcast_job_recipient.select_pending':
+        "SELECT `position`, `telegram_id` FROM `broadcast_job_recipient` WHERE `job_id` = %s AND `position` >= %s "
+        "AND `status` = %s ORDER BY `position` LIMIT %s",
+    'broadcast_job_recipient.update_status_many':
+        "UPDATE `broadcast_job_recipient` SET `status` = %s WHERE `job_id` = %s AND `position` IN ({items})",
+    'broadcast_job_recipient.update_error':
+        "UPDATE `broadcast_job_recipient` SET `status` = %s, `error` = %s WHERE `job_id` = %s AND `position` = %s",
+
+    # Версии кэшей процессов-обработчиков
+    'cache_version.select_all': "SELECT `name`, `version` FROM `cache_version`",
+    'cache_version.bump':
+        "INSERT INTO `cache_version`(`name`, `version`) VALUES (%s, 1) "
+        "ON DUPLICATE KEY UPDATE `version` = `version` + 1",
+
+    # Планировщик
+    'scheduled_task.select_all': "SELECT `name`, `next_run_at` FROM `scheduled_task`",
+    'scheduled_task.select_due': "SELECT `name`, `next_run_at` FROM `scheduled_task` WHERE `next_run_at` <= %s",
+    'scheduled_task.insert': "INSERT INTO `scheduled_task`(`name`, `next_run_at`) VALUES (%s, %s)",
+    'scheduled_task.update_next_run_at': "UPDATE `scheduled_task` SET `next_run_at` = %s WHERE `name` = %s",
+    'scheduled_task.update_started':
+        "UPDATE `scheduled_task` SET `next_run_at` = %s, `last_run_at` = %s WHERE `name` = %s",
+    'scheduled_task.update_result':
+        "UPDATE `scheduled_task` SET `last_status` = %s, `last_error` = %s WHERE `name` = %s",
+}
+
+# Элемент списка {items} для запросов, в которых он отличается от %s
+QUERIES_ITEMS = {
+    'broadcast_job_recipient.insert_many': '(%s, %s, %s)',
+    'broadcast_job_recipient.insert_many_for_inserted_job': '(@broadcast_job_id, %s, %s)',
+}
+
+
+def render_query(name: str, items_count: Union[int, None] = None) -> str:
+    """
+    Получает текст именованного запроса, в запросах со списком подставляет нужное количество элементов.
+
+    Args:
+        name: имя запроса
+        items_count: количество элементов списка {items}, None - запрос без списка
+
+    Returns:
+        str: текст запроса
+
+    Raises:
+        KeyError: запроса с таким именем нет в реестре
+    """
+    sql_request = QUERIES[name]
+    if items_count is None: return sql_request
+    # IN () - ошибка синтаксиса, IN (NULL) - пустой ответ
+    items = ', '.join([QUERIES_ITEMS.get(name, '%s')] * items_count) or 'NULL'
+    return sql_request.replace('{items}', items)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Кэш настроек бота из таблицы setting."""
+
+import asyncio
+import time
+from typing import Union, Callable, Awaitable, Tuple
+
+from config import BOT_VERSION
+
+
+class BotSettingsCache:
+    """Класс кэша настроек бота, перечитывает таблицу setting не чаще раза в ttl секунд."""
+
+    def __init__(self, loader: Callable[[], Awaitable[list]], ttl: float) -> None:
+        """
+        init метод.
+
+        Args:
+            loader: корутина, возвращающая строки таблицы setting вида {'name': имя, 'value': значение}
+            ttl: время жизни кэша в секундах
+        """
+        self._loader = loader
+        self._ttl = ttl
+        self._settings: Union[dict, None] = None
+        self._messages_prefix = ''
+        self._expires_at = 0.0
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        """
+        Сбрасывает кэш, следующее обращение перечитает настройки из базы данных.
+
+        Returns:
+            None
+        """
+        self._version += 1
+        self._settings = None
+
+    async def _get_settings(self) -> Tuple[dict, str]:
+        """
+        Возвращает закэшированные настройки вместе с префиксом сообщений, при необходимости загружает их.
+
+        Returns:
+            tuple: словарь настроек вида {имя_параметра:значение} и префикс сообщений из той же загрузки
+        """
+        if self._settings is not None and time.monotonic() < self._expires_at:
+            return self._settings, self._messages_prefix
+
+        async with self._lock:
+            if self._settings is not None and time.monotonic() < self._expires_at:
+                return self._settings, self._messages_prefix
+
+            version = self._version
+            settings = {item['name']: item['value'] for item in await self._loader()}
+            messages_prefix = self._render_messages_prefix(settings.get('all_messages_prefix'))
+            # Если во время загрузки настройки были изменены - не кэшируем устаревшие данные
+            if version == self._version:
+                self._settings = settings
+                self._messages_prefix = messages_prefix
+                self._expires_at = time.monotonic() + self._ttl
+            return settings, messages_prefix
+
+    @staticmethod
+    def _render_messages_prefix(data: Union[str, None]) -> str:
+        """
+        Преобразует значение параметра all_messages_prefix в префикс сообщений.
+
+        Args:
+            data: значение параметра
+
+        Returns:
+            str: Префикс
+        """
+        if data is None: return ''
+
+        if data == 'bot_version':
+            prefix = f'{BOT_VERSION}\n\n'
+        elif data == 'None':
+            prefix = ''
+        else:
+            prefix = data
+            prefix = prefix.replace("/n", "\n")
+            prefix = prefix.replace("bot_version", BOT_VERSION)
+        return prefix
+
+    async def get_all(self) -> dict:
+        """
+        Получает все настройки бота.
+
+        Returns:
+            dict: копия словаря настроек вида {имя_параметра:значение}
+        """
+        settings, messages_prefix = await self._get_settings()
+        return dict(settings)
+
+    async def get(self, name: str, default: Union[str, None] = None) -> Union[str, None]:
+        """
+        Получает значение параметра.
+
+        Args:
+            name: имя параметра
+            default: значение, если параметр не найден
+
+        Returns:
+            str: значение параметра
+            None: параметр не найден
+        """
+        settings, messages_prefix = await self._get_settings()
+        return settings.get(name, default)
+
+    async def access_mode(self) -> Union[str, None]:
+        """
+        Получает режим доступа.
+
+        Returns:
+            str: режим доступа
+            None: параметр не найден
+        """
+        return await self.get('access_mode')
+
+    async def terms_text(self) -> Union[str, None]:
+        """
+        Получает текст пользовательского соглашения.
+
+        Returns:
+            str: текст пользовательского соглашения
+            None: параметр не найден
+        """
+        return await self.get('terms_text')
+
+    async def messages_prefix(self) -> str:
+        """
+        Получает префикс всех сообщений с уже подставленными bot_version и переносами строк.
+
+        Returns:
+            str: Префикс
+        """
+        settings, messages_prefix = await self._get_settings()
+        return messages_prefix
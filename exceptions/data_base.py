@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Исключения при работе с базой данных."""
+
+
+class DatabaseBusyException(Exception):
+    """Класс ошибки, не удалось получить свободное соединение из пула за отведённое время."""
+
+    def __init__(self, message: str) -> None:
+        """
+        init метод.
+
+        Args:
+            message: сообщение
+        """
+        self.message = message
+
+    def __str__(self) -> str:
+        """
+        Текстовое представление класса ошибки.
+
+        Returns:
+            str: сообщение ошибки
+        """
+        return self.message
@@ -8,42 +8,405 @@
 #   Разработчик: https://catdeveloper.com/kontakty
 # ======================================================================================================================
 
-"""Тут создаются Логгеры."""
+"""
+Тут создаются Логгеры.
+
+Логгеры не пишут в файлы сами: запись кладётся в ограниченную очередь, а форматирование, перевод и запись в файлы
+выполняет фоновый поток пачками. Если очередь заполнена, запись отбрасывается и учитывается в счётчике отброшенных
+записей, обработка обновления при этом не ждёт.
+"""
+import atexit
+import logging
+import os
+import queue
 import sys
+import threading
+import time
+import traceback
+from typing import Union
+
+from config import LOG_QUEUE_SIZE, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL
+
+_FORMAT = '[%s] [%s] [%s -> %s line:%d] %s\n'
+
+
+class LogWriter:
+    """Класс фонового потока, который форматирует записи из очереди и пишет их в файлы пачками."""
+
+    def __init__(self,
+                 queue_size: int = LOG_QUEUE_SIZE,
+                 batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL) -> None:
+        """
+        init метод.
+
+        Args:
+            queue_size: максимальное количество записей в очереди
+            batch_size: максимальное количество записей в одной пачке
+            flush_interval: максимальное время в секундах, которое запись может ждать в очереди
+        """
+        self._queue = queue.Queue(queue_size)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        # {путь: файл}
+        self._files = {}
+        self._lock = threading.Lock()
+        self._thread: Union[threading.Thread, None] = None
+        self._gettext = None
+        self.dropped_count = 0
+        self.written_count = 0
+        # Отброшенные записи, о которых ещё не написано в лог
+        self._unreported_drops = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Получает количество записей в очереди.
+
+        Returns:
+            int: количество записей
+        """
+        return self._queue.qsize()
+
+    def put(self, record: tuple) -> bool:
+        """
+        Кладёт запись в очередь без ожидания.
+
+        Args:
+            record: запись вида (путь, уровень, время, файл, функция, строка, сообщение, аргументы, исключение) или
+                    (путь, None, текст) для уже готового текста
+
+        Returns:
+            bool: False - очередь заполнена, запись отброшена
+        """
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped_count += 1
+                self._unreported_drops += 1
+            return False
+
+    def start(self) -> None:
+        """
+        Запускает фоновый поток.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Дописывает записи из очереди и останавливает фоновый поток.
+
+        Returns:
+            None
+        """
+        if self._thread is None: return
+        try:
+            self._queue.put(None, timeout=self._flush_interval * 10)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=self._flush_interval * 10)
+        self._thread = None
+
+    def _translate(self, message: str) -> str:
+        """
+        Переводит сообщение на язык по умолчанию.
+
+        Args:
+            message: сообщение
+
+        Returns:
+            str: перевод сообщения
+        """
+        if self._gettext is None:
+            from create_bot import gettext
+            self._gettext = gettext
+        return self._gettext(message)
+
+    def _format(self, record: tuple) -> str:
+        """
+        Собирает строку лога из записи.
+
+        Args:
+            record: запись из очереди
+
+        Returns:
+            str: строка лога
+        """
+        if record[1] is None: return record[2]
+
+        path, level, created, filename, func_name, lineno, message, args, exc_info = record
+        try:
+            text = self._translate(message)
+            if args:
+                text = text % args
+        except Exception:
+            # Сломанный шаблон не должен терять запись
+            text = '%s %r' % (message, args)
+        asctime = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created)) + ',%03d' % (created % 1 * 1000)
+        line = _FORMAT % (logging.getLevelName(level), asctime, filename, func_name, lineno, text)
+        if exc_info:
+            line += ''.join(traceback.format_exception(*exc_info))
+        return line
+
+    def _get_file(self, path: str):
+        """
+        Возвращает открытый на дозапись файл лога.
+
+        Args:
+            path: путь к файлу, '-' - исходный stdout процесса
+
+        Returns:
+            файл
+        """
+        file = self._files.get(path)
+        if file is None:
+            if path == '-':
+                file = sys.__stdout__
+            else:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                file = open(path, 'a', encoding='utf-8')
+            self._files[path] = file
+        return file
+
+    def _write_batch(self, batch: list) -> None:
+        """
+        Форматирует пачку записей и пишет её, по одной записи в каждый файл.
+
+        Args:
+            batch: список записей
+
+        Returns:
+            None
+        """
+        with self._lock:
+            drops, self._unreported_drops = self._unreported_drops, 0
+        if drops:
+            batch.append(('logs/warnings_log.log', logging.WARNING, time.time(), 'loggers.py', '_write_batch', 0,
+                          'Очередь логов переполнена, отброшено записей: %s', (drops,), None))
+
+        # {путь: [строки]}
+        lines = {}
+        for record in batch:
+            lines.setdefault(record[0], []).append(self._format(record))
+        for path, path_lines in lines.items():
+            try:
+                file = self._get_file(path)
+                file.write(''.join(path_lines))
+                file.flush()
+            except Exception:
+                traceback.print_exc(file=sys.__stderr__)
+        self.written_count += len(batch)
+
+    def _run(self) -> None:
+        """
+        Цикл фонового потока: ждёт первую запись, добирает пачку из очереди и пишет её.
 
-from aiologger import Logger
-from aiologger.formatters.base import Formatter
-from aiologger.handlers.files import AsyncFileHandler
-from aiologger.levels import LogLevel
+        Returns:
+            None
+        """
+        while True:
+            try:
+                record = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                if self._unreported_drops:
+                    self._write_batch([])
+                continue
 
-formatter = Formatter('[%(levelname)s] [%(asctime)s] [%(filename)s -> %(funcName)s line:%(lineno)d] %(message)s')
+            batch = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+            while not stop and len(batch) < self._batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
 
-warnings_logger = Logger(name="Errors_logger", level=LogLevel.WARNING)
-handler = AsyncFileHandler(filename='logs/warnings_log.log', mode='a', encoding="UTF-8")
-handler.formatter = formatter
-warnings_logger.add_handler(handler)
+            if batch or self._unreported_drops:
+                self._write_batch(batch)
+            if stop:
+                for path, file in self._files.items():
+                    if path != '-': file.close()
+                self._files = {}
+                return
 
-errors_logger = Logger(name="Errors_logger", level=LogLevel.ERROR)
-handler = AsyncFileHandler(filename='logs/errors_log.log', mode='a', encoding="UTF-8")
-handler.formatter = formatter
-errors_logger.add_handler(handler)
 
-messages_logger = Logger(name="Messages_logger", level=LogLevel.INFO)
-handler = AsyncFileHandler(filename='logs/messages_log.log', mode='a', encoding="UTF-8")
-handler.formatter = formatter
-messages_logger.add_handler(handler)
+class QueuedLogger:
+    """
+    Класс логгера, передающего записи фоновому потоку.
+
+    Сообщение - шаблон с %s, аргументы передаются отдельно: шаблон переводится и форматируется только если уровень
+    записи не ниже уровня логгера, и только в фоновом потоке.
+    """
+
+    def __init__(self, name: str, path: str, level: int, writer: LogWriter) -> None:
+        """
+        init метод.
+
+        Args:
+            name: имя логгера
+            path: путь к файлу лога
+            level: минимальный уровень записей, уровни из модуля logging
+            writer: фоновый поток записи
+        """
+        self.name = name
+        self.path = path
+        self.level = level
+        self._writer = writer
+
+    def is_enabled_for(self, level: int) -> bool:
+        """
+        Проверяет, будет ли записана запись с таким уровнем.
+
+        Args:
+            level: уровень записи
+
+        Returns:
+            bool: True - будет записана
+        """
+        return level >= self.level
+
+    def _log(self, level: int, message: str, args: tuple, exc_info: bool = False) -> None:
+        """
+        Кладёт запись в очередь фонового потока.
+
+        Args:
+            level: уровень записи
+            message: шаблон сообщения
+            args: аргументы шаблона
+            exc_info: добавить в запись обрабатываемое исключение
+
+        Returns:
+            None
+        """
+        if level < self.level: return
+        frame = sys._getframe(2)
+        self._writer.put((self.path, level, time.time(), os.path.basename(frame.f_code.co_filename),
+                          frame.f_code.co_name, frame.f_lineno, message, args,
+                          sys.exc_info() if exc_info else None))
+
+    def debug(self, message: str, *args) -> None:
+        """
+        Записывает отладочное сообщение.
+
+        Args:
+            message: шаблон сообщения
+            *args: аргументы шаблона
+
+        Returns:
+            None
+        """
+        self._log(logging.DEBUG, message, args)
+
+    def info(self, message: str, *args) -> None:
+        """
+        Записывает информационное сообщение.
+
+        Args:
+            message: шаблон сообщения
+            *args: аргументы шаблона
+
+        Returns:
+            None
+        """
+        self._log(logging.INFO, message, args)
+
+    def warning(self, message: str, *args) -> None:
+        """
+        Записывает предупреждение.
+
+        Args:
+            message: шаблон сообщения
+            *args: аргументы шаблона
+
+        Returns:
+            None
+        """
+        self._log(logging.WARNING, message, args)
+
+    def error(self, message: str, *args) -> None:
+        """
+        Записывает ошибку.
+
+        Args:
+            message: шаблон сообщения
+            *args: аргументы шаблона
+
+        Returns:
+            None
+        """
+        self._log(logging.ERROR, message, args)
+
+    def exception(self, message: str, *args) -> None:
+        """
+        Записывает ошибку вместе с обрабатываемым исключением, вызывается внутри except.
+
+        Args:
+            message: шаблон сообщения
+            *args: аргументы шаблона
+
+        Returns:
+            None
+        """
+        self._log(logging.ERROR, message, args, exc_info=True)
 
 
 class ConsoleLogger:
+    """Класс замены sys.stdout: вывод попадает в консоль и в файл через фоновый поток записи логов."""
+
+    def __init__(self, filename: str, writer: LogWriter = None) -> None:
+        """
+        init метод.
+
+        Args:
+            filename: путь к файлу, в который дублируется вывод
+            writer: фоновый поток записи, по умолчанию общий поток логгеров
+        """
+        self._writer = writer if writer else log_writer
+        # Файл перезаписывается при каждом запуске
+        open(filename, 'w').close()
+        self._filename = filename
+
+    def write(self, message: str) -> int:
+        """
+        Передаёт вывод фоновому потоку.
+
+        Args:
+            message: текст
+
+        Returns:
+            int: длина текста
+        """
+        self._writer.put(('-', None, message))
+        self._writer.put((self._filename, None, message))
+        return len(message)
+
+    def flush(self) -> None:
+        """
+        Ничего не делает, фоновый поток сбрасывает файлы после каждой пачки.
 
-    def __init__(self, filename):
-        self.console = sys.stdout
-        self.file = open(filename, 'w')
+        Returns:
+            None
+        """
 
-    def write(self, message):
-        self.console.write(message)
-        self.file.write(message)
 
-    def flush(self):
-        self.console.flush()
-        self.file.flush()
\ No newline at end of file
+log_writer = LogWriter()
+warnings_logger = QueuedLogger('Warnings_logger', 'logs/warnings_log.log', logging.WARNING, log_writer)
+errors_logger = QueuedLogger('Errors_logger', 'logs/errors_log.log', logging.ERROR, log_writer)
+messages_logger = QueuedLogger('Messages_logger', 'logs/messages_log.log', logging.INFO, log_writer)
+slow_updates_logger = QueuedLogger('Slow_updates_logger', 'logs/slow_updates_log.log', logging.WARNING, log_writer)
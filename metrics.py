@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Метрики процесса бота в текстовом формате Prometheus.
+
+Метрики меняются только в event loop, поэтому обходятся без блокировок: изменение метрики - поиск в словаре и
+сложение. Метрики, значение которых уже хранится в другом объекте (размер пула соединений, длина очередей),
+не обновляются при каждом изменении, а вычисляются функцией при запросе /metrics.
+"""
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PATH
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_value(value: float) -> str:
+    """
+    Приводит значение к виду текстового формата Prometheus.
+
+    Args:
+        value: значение
+
+    Returns:
+        str: значение
+    """
+    if value == math.inf: return '+Inf'
+    if value == -math.inf: return '-Inf'
+    if math.isnan(value): return 'NaN'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(labelnames: Tuple[str, ...], labels: tuple, extra: str = None) -> str:
+    """
+    Собирает метки метрики вида {имя="значение"}.
+
+    Args:
+        labelnames: имена меток
+        labels: значения меток
+        extra: дополнительная метка в уже собранном виде, например le="0.5"
+
+    Returns:
+        str: метки, пустая строка - меток нет
+    """
+    items = ['%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+             for name, value in zip(labelnames, labels)]
+    if extra:
+        items.append(extra)
+    return '{%s}' % ','.join(items) if items else ''
+
+
+class Metric:
+    """Базовый класс метрики."""
+
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 registry: 'Registry' = None) -> None:
+        """
+        init метод.
+
+        Args:
+            name: имя метрики
+            documentation: описание метрики
+            labelnames: имена меток, значения меток передаются в том же порядке
+            registry: реестр, по умолчанию общий реестр процесса
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # {значения_меток: значение}
+        self._values: Dict[tuple, float] = {}
+        self._function: Union[Callable[[], Union[float, Dict[tuple, float]]], None] = None
+        (registry if registry is not None else default_registry).register(self)
+
+    def set_function(self, function: Callable[[], Union[float, Dict[tuple, float]]]) -> None:
+        """
+        Задаёт функцию, вычисляющую значение метрики при запросе метрик.
+
+        Args:
+            function: функция без аргументов, возвращает значение или словарь вида {значения_меток: значение}
+
+        Returns:
+            None
+        """
+        self._function = function
+
+    def collect(self) -> Dict[tuple, float]:
+        """
+        Получает значения метрики.
+
+        Returns:
+            dict: словарь вида {значения_меток: значение}
+        """
+        if self._function is None: return self._values
+        value = self._function()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self) -> List[str]:
+        """
+        Собирает строки метрики в текстовом формате.
+
+        Returns:
+            list: строки
+        """
+        return ['%s%s %s' % (self.name, _format_labels(self.labelnames, labels), _format_value(value))
+                for labels, value in self.collect().items()]
+
+
+class Counter(Metric):
+    """Класс счётчика, значение только растёт."""
+
+    type_name = 'counter'
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        """
+        Увеличивает счётчик.
+
+        Args:
+            *labels: значения меток
+            amount: на сколько увеличить
+
+        Returns:
+            None
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """Класс метрики текущего значения."""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, *labels) -> None:
+        """
+        Устанавливает значение.
+
+        Args:
+            value: значение
+            *labels: значения меток
+
+        Returns:
+            None
+        """
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        """
+        Увеличивает значение.
+
+        Args:
+            *labels: значения меток
+            amount: на сколько увеличить, отрицательное - уменьшить
+
+        Returns:
+            None
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    """Класс гистограммы, считает наблюдения по корзинам, их сумму и количество."""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: 'Registry' = None) -> None:
+        """
+        init метод.
+
+        Args:
+            name: имя метрики
+            documentation: описание метрики
+            labelnames: имена меток
+            buckets: верхние границы корзин по возрастанию, корзина +Inf добавляется автоматически
+            registry: реестр, по умолчанию общий реестр процесса
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # {значения_меток: [количества по корзинам (последняя - +Inf), сумма, количество]}
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        """
+        Добавляет наблюдение.
+
+        Args:
+            value: значение
+            *labels: значения меток
+
+        Returns:
+            None
+        """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        """
+        Собирает строки гистограммы в текстовом формате, количества по корзинам накопительные.
+
+        Returns:
+            list: строки
+        """
+        lines = []
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append('%s_bucket%s %s' % (
+                    self.name, _format_labels(self.labelnames, labels, 'le="%s"' % _format_value(bound)), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _format_labels(self.labelnames, labels), _format_value(total)))
+            lines.append('%s_count%s %s' % (self.name, _format_labels(self.labelnames, labels), count))
+        return lines
+
+
+class Registry:
+    """Класс реестра метрик."""
+
+    def __init__(self) -> None:
+        """init метод."""
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        """
+        Добавляет метрику в реестр.
+
+        Args:
+            metric: метрика
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: метрика с таким именем уже есть
+        """
+        if metric.name in self._metrics:
+            raise ValueError('Метрика "%s" уже зарегистрирована' % metric.name)
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        Собирает все метрики в текстовом формате Prometheus.
+
+        Returns:
+            str: текст ответа /metrics
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation.replace('\\', '\\\\')
+                                           .replace('\n', '\\n')))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type_name))
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Класс HTTP сервера, отдающего метрики."""
+
+    def __init__(self, registry: Registry = None, host: str = METRICS_HOST, path: str = METRICS_PATH) -> None:
+        """
+        init метод.
+
+        Args:
+            registry: реестр, по умолчанию общий реестр процесса
+            host: адрес, на котором слушает сервер
+            path: путь метрик
+        """
+        self._registry = registry if registry is not None else default_registry
+        self._host = host
+        self._path = path
+        self._runner: Union[web.AppRunner, None] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        """
+        Отдаёт метрики.
+
+        Args:
+            request: запрос
+
+        Returns:
+            web.Response: метрики в текстовом формате
+        """
+        return web.Response(text=self._registry.render(), content_type='text/plain',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def start(self, port: int) -> None:
+        """
+        Запускает сервер.
+
+        Args:
+            port: порт, 0 - сервер не запускается
+
+        Returns:
+            None
+        """
+        if not port or self._runner is not None: return
+        app = web.Application()
+        app.router.add_get(self._path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, port).start()
+
+    async def stop(self) -> None:
+        """
+        Останавливает сервер.
+
+        Returns:
+            None
+        """
+        if self._runner is None: return
+        await self._runner.cleanup()
+        self._runner = None
+
+
+default_registry = Registry()
+
+# Обновления
+UPDATES_TOTAL = Counter('bot_updates_total', 'Обработано обновлений', ['type'])
+UPDATE_DURATION = Histogram('bot_update_duration_seconds', 'Время обработки обновления')
+UPDATE_SQL_QUERIES = Histogram('bot_update_sql_queries', 'SQL запросов на одно обновление',
+                               buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34))
+THROTTLED_TOTAL = Counter('bot_throttled_total', 'Сообщений, отклонённых антиспамом')
+THROTTLING_UNLOCK_TIMERS = Gauge('bot_throttling_unlock_timers', 'Ожидающих уведомлений о разблокировке антиспама')
+
+# MYSQL
+SQL_QUERIES_TOTAL = Counter('bot_sql_queries_total', 'Выполнено SQL запросов', ['kind'])
+SQL_ERRORS_TOTAL = Counter('bot_sql_errors_total', 'SQL запросов, завершившихся ошибкой', ['kind'])
+SQL_QUERY_DURATION = Histogram('bot_sql_query_duration_seconds',
+                               'Время SQL запроса вместе с ожиданием соединения', ['kind'])
+SQL_POOL_ACQUIRE_DURATION = Histogram('bot_sql_pool_acquire_duration_seconds', 'Время ожидания соединения из пула')
+SQL_POOL_ACQUIRE_TIMEOUTS_TOTAL = Counter('bot_sql_pool_acquire_timeouts_total',
+                                          'Запросов, не дождавшихся соединения из пула')
+SQL_POOL_CONNECTIONS = Gauge('bot_sql_pool_connections', 'Соединений в пуле MYSQL', ['state'])
+
+# Telegram Bot API
+TELEGRAM_REQUESTS_TOTAL = Counter('bot_telegram_requests_total', 'Запросов к Bot API', ['method'])
+TELEGRAM_REQUEST_DURATION = Histogram('bot_telegram_request_duration_seconds', 'Время запроса к Bot API',
+                                      ['method'])
+TELEGRAM_ERRORS_TOTAL = Counter('bot_telegram_errors_total', 'Запросов к Bot API, завершившихся ошибкой', ['error'])
+TELEGRAM_RETRY_AFTER_TOTAL = Counter('bot_telegram_retry_after_total', 'Ответов Bot API 429 RetryAfter')
+
+# Сообщения и рассылки
+MESSAGES_SENT_TOTAL = Counter('bot_messages_sent_total', 'Отправлено сообщений', ['source'])
+BROADCAST_RECIPIENTS_TOTAL = Counter('bot_broadcast_recipients_total', 'Получателей рассылок', ['result'])
+
+# Очереди
+LOG_QUEUE_DEPTH = Gauge('bot_log_queue_depth', 'Записей в очереди логов')
+LOG_DROPPED_TOTAL = Counter('bot_log_dropped_total', 'Отброшено записей логов из-за переполнения очереди')
+AUDIT_QUEUE_DEPTH = Gauge('bot_audit_queue_depth', 'Записей в очереди журнала сообщений')
+AUDIT_DROPPED_TOTAL = Counter('bot_audit_dropped_total',
+                              'Отброшено записей журнала сообщений из-за переполнения очереди')
+
+metrics_server = MetricsServer()
@@ -9,24 +9,55 @@
 # ======================================================================================================================
 
 """Middleware проверяющий доступ пользователя."""
-import os
 from typing import Dict, Any
 
 from aiogram.dispatcher.handler import CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
-from aiogram.types import Message
+from aiogram.types import Message, Update
 
-from config import TERMS_AGREE_PHRASE, ADMIN_GROUP_ID, SUPPORT_GROUP_ID, ABS_PATH, NO_ACCESS_MESSAGE, OWNER_ID, STICKERS
-from create_custom_objects import db, mm
+from config import TERMS_AGREE_PHRASE, ADMIN_GROUP_ID, SUPPORT_GROUP_ID, NO_ACCESS_MESSAGE, OWNER_ID, \
+    STICKERS, MYSQL_QUERIES_PER_UPDATE_WARNING
+from create_custom_objects import db, mm, install_state
 from create_bot import gettext as _
 from exceptions.bot_stop import UnhandledException
 from loggers import warnings_logger
-from utils import check_user_access, get_user_roles_by_telegram_id, is_empty
+from tracing import TracingMiddlewareMixin
+from utils import check_user_access, is_empty, get_user_context_by_telegram_id
 
 
-class AccessControlMiddleware(BaseMiddleware):
+class AccessControlMiddleware(TracingMiddlewareMixin, BaseMiddleware):
     """Класс Middleware проверяющий доступ к командам."""
 
+    async def on_pre_process_update(self, update: Update, data: Dict[str, Any]) -> None:
+        """
+        Запускает подсчёт SQL запросов для обновления.
+
+        Args:
+            update: обновление
+            data: данные
+
+        Returns:
+            None
+        """
+        db.start_queries_counter()
+
+    async def on_post_process_update(self, update: Update, results: list, data: Dict[str, Any]) -> None:
+        """
+        Предупреждает, если на обработку обновления ушло больше SQL запросов, чем MYSQL_QUERIES_PER_UPDATE_WARNING.
+
+        Args:
+            update: обновление
+            results: результаты обработчиков
+            data: данные
+
+        Returns:
+            None
+        """
+        queries_count = db.get_queries_counter()
+        if queries_count is not None and queries_count > MYSQL_QUERIES_PER_UPDATE_WARNING:
+            warnings_logger.warning('Обработка обновления потребовала %s SQL запросов: update_id: "%s"',
+                                    queries_count, update.update_id)
+
     async def on_process_message(self, event: Message, data: Dict[str, Any]) -> None:
         """
         Проверяет доступ пользователя к команде.
@@ -41,61 +72,56 @@ class AccessControlMiddleware(BaseMiddleware):
         self.event = event
         self.data = data
         self.user_fsm_state = data['state']
-        self.is_setup_state = not os.path.exists(os.path.join(ABS_PATH, 'bot_installed.txt'))
+        self.is_setup_state = not await install_state.check()
 
         if self.is_setup_state:
             return
 
-        # Проверяем пользователя в базе данных
-        user_data = await db.check_telegram_id_in_db(event.from_user.id)
+        # Загружаем контекст пользователя одним запросом, он доступен обработчикам как data['user_context']
+        user_context = await get_user_context_by_telegram_id(event.from_user.id)
         # Если пользователя нет в базе данных - заносим его туда
-        if not user_data: await db.add_bot_user_in_db(event.from_user.id, event.from_user.username)
+        if user_context is None:
+            await db.add_bot_user_in_db(event.from_user.id, event.from_user.username)
+            user_context = await get_user_context_by_telegram_id(event.from_user.id)
+            if user_context is None:
+                raise UnhandledException(
+                    _('Попытка проверить регистрацию не найденного пользователя в Access Middleware: '
+                      'telegram_id: "%s"' % event.from_user.id)
+                )
+        data['user_context'] = user_context
         # Если сообщение пришло из беседы или канала, кроме административных
         from_chat_id = event.chat.id
         if from_chat_id < 0 and (from_chat_id != ADMIN_GROUP_ID or from_chat_id != SUPPORT_GROUP_ID):
             raise CancelHandler
 
         # Если условия пользования не приняты - просим принять
-        terms_agree_status = await db.get_terms_agree_by_telegram_id(event.from_user.id)
-        if await is_empty(terms_agree_status):
-            raise UnhandledException(
-                _('Попытка проверить регистрацию не найденного пользователя в Access Middleware: '
-                  'telegram_id: "%s"' % event.from_user.id)
-            )
-        terms_agree_text = await db.get_terms_text()
-        if await is_empty(terms_agree_status):
-            raise UnhandledException(
-                _('Получены пустые условия пользования в Access Middleware')
-            )
-
-        if (not terms_agree_status) and (event.text != TERMS_AGREE_PHRASE):
+        if (not user_context.terms_agree) and (event.text != TERMS_AGREE_PHRASE):
+            terms_agree_text = await db.get_terms_text()
+            if await is_empty(terms_agree_text):
+                raise UnhandledException(
+                    _('Получены пустые условия пользования в Access Middleware')
+                )
             await mm.send_message(terms_agree_text, message_object=event)
             await mm.send_message(
                 _('Если вы принимаете условия пользования, напишите: "%s"' % TERMS_AGREE_PHRASE),
                 message_object=event)
             raise CancelHandler
-        elif (not terms_agree_status) and (event.text == TERMS_AGREE_PHRASE):
+        elif (not user_context.terms_agree) and (event.text == TERMS_AGREE_PHRASE):
             await db.set_terms_agree_by_telegram_id(event.from_user.id, True)
+            user_context.terms_agree = True
 
         # Получаем настройки бота, чтобы узнать режим доступа
-        bot_settings = await db.get_bot_settings()
-        if await is_empty(bot_settings):
+        access_mode = await db.settings.access_mode()
+        if await is_empty(access_mode):
             raise UnhandledException(
                 _('Получены пустые настройки бота в Access Middleware')
             )
 
-        access_mode = bot_settings['access_mode']
         if access_mode == 'allow_all':
             pass
         elif access_mode == 'strict':
-            # Проверяем регистрацию пользователя
-            is_register = await db.check_bot_user_registration_by_telegram_id(event.from_user.id)
-            if await is_empty(is_register):
-                raise UnhandledException(
-                    _('Попытка проверить регистрацию не найденного пользователя в Access Middleware')
-                )
             # Если пользователь не зарегистрирован
-            if not is_register:
+            if not user_context.is_registered:
                 await mm.send_message(
                     _('Регистрация ограничена, доступ есть только у зарегистрированных пользователей'),
                     message_object=event,
@@ -112,18 +138,13 @@ class AccessControlMiddleware(BaseMiddleware):
                     raise CancelHandler
                 if not access:
                     await mm.send_message(NO_ACCESS_MESSAGE, message_object=event)
-                    warnings_logger.warning(
-                        _('Попытка доступа к запрещённой команде: telegram_id: "%s" | команда: "%s"' % (
-                            event.from_user.id,
-                            event.get_command(),
-                        )
-                          )
-                    )
+                    warnings_logger.warning('Попытка доступа к запрещённой команде: telegram_id: "%s" | команда: "%s"',
+                                            event.from_user.id, event.get_command())
                     raise CancelHandler
                 return
         elif access_mode == 'debug':
             # Получаем роли пользователя
-            roles = await get_user_roles_by_telegram_id(event.from_user.id)
+            roles = user_context.roles_names
             if await is_empty(roles):
                 raise UnhandledException(
                     _('Попытка получить роли не существующего пользователя в Access Middleware')
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Middleware записывающий входящие сообщения в журнал сообщений."""
+import time
+from typing import Dict, Any
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+
+from audit import audit_log, get_handler_name, DIRECTION_IN
+from tracing import TracingMiddlewareMixin
+
+
+class AuditMiddleware(TracingMiddlewareMixin, BaseMiddleware):
+    """Класс Middleware записывающий в журнал входящие сообщения и callback: пользователь, чат, обработчик, время."""
+
+    @staticmethod
+    async def _start(data: Dict[str, Any]) -> None:
+        """
+        Запоминает время начала обработки.
+
+        Args:
+            data: данные
+
+        Returns:
+            None
+        """
+        data['audit_started_at'] = time.monotonic()
+
+    @staticmethod
+    async def _set_handler(data: Dict[str, Any]) -> None:
+        """
+        Запоминает обработчик, после обработки он уже недоступен через current_handler.
+
+        Args:
+            data: данные
+
+        Returns:
+            None
+        """
+        data['audit_handler'] = get_handler_name(current_handler.get(None))
+
+    async def on_pre_process_message(self, message: Message, data: Dict[str, Any]) -> None:
+        """
+        Запоминает время начала обработки сообщения.
+
+        Args:
+            message: сообщение
+            data: данные
+
+        Returns:
+            None
+        """
+        await self._start(data)
+
+    async def on_process_message(self, message: Message, data: Dict[str, Any]) -> None:
+        """
+        Запоминает обработчик сообщения.
+
+        Args:
+            message: сообщение
+            data: данные
+
+        Returns:
+            None
+        """
+        await self._set_handler(data)
+
+    async def on_post_process_message(self, message: Message, results: list, data: Dict[str, Any]) -> None:
+        """
+        Записывает сообщение в журнал.
+
+        Args:
+            message: сообщение
+            results: результаты обработчиков
+            data: данные
+
+        Returns:
+            None
+        """
+        started_at = data.get('audit_started_at')
+        audit_log.write(DIRECTION_IN,
+                        message.from_user.id if message.from_user else None,
+                        message.chat.id,
+                        data.get('audit_handler'),
+                        time.monotonic() - started_at if started_at is not None else None,
+                        len(message.text or message.caption or ''),
+                        content_type=message.content_type,
+                        message_id=message.message_id)
+
+    async def on_pre_process_callback_query(self, callback: CallbackQuery, data: Dict[str, Any]) -> None:
+        """
+        Запоминает время начала обработки callback.
+
+        Args:
+            callback: callback
+            data: данные
+
+        Returns:
+            None
+        """
+        await self._start(data)
+
+    async def on_process_callback_query(self, callback: CallbackQuery, data: Dict[str, Any]) -> None:
+        """
+        Запоминает обработчик callback.
+
+        Args:
+            callback: callback
+            data: данные
+
+        Returns:
+            None
+        """
+        await self._set_handler(data)
+
+    async def on_post_process_callback_query(self, callback: CallbackQuery, results: list,
+                                             data: Dict[str, Any]) -> None:
+        """
+        Записывает callback в журнал.
+
+        Args:
+            callback: callback
+            results: результаты обработчиков
+            data: данные
+
+        Returns:
+            None
+        """
+        started_at = data.get('audit_started_at')
+        audit_log.write(DIRECTION_IN,
+                        callback.from_user.id,
+                        callback.message.chat.id if callback.message else None,
+                        data.get('audit_handler'),
+                        time.monotonic() - started_at if started_at is not None else None,
+                        len(callback.data or ''),
+                        content_type='callback_query',
+                        message_id=callback.message.message_id if callback.message else None)
@@ -9,21 +9,21 @@
 # ======================================================================================================================
 
 """Middleware проверяющий наличие выполненной установки."""
-import os.path
 from typing import Any, Dict
 
 from aiogram.dispatcher.handler import CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.types import Message
 
-from config import ABS_PATH, OWNER_ID
-from create_custom_objects import db
+from config import OWNER_ID
+from create_custom_objects import db, install_state
 from loggers import messages_logger
 from create_bot import gettext as _
-from utils import is_empty
+from tracing import TracingMiddlewareMixin
+from utils import is_empty, BROADCAST_JOBS_TABLES_SQL, SCHEDULER_TABLES_SQL, CACHE_VERSIONS_TABLES_SQL
 
 
-class CheckInstalledMiddleware(BaseMiddleware):
+class CheckInstalledMiddleware(TracingMiddlewareMixin, BaseMiddleware):
     """Класс middleware, проверяет установку бота."""
 
     async def on_process_message(self, event: Message, data: Dict[str, Any]) -> None:
@@ -38,15 +38,11 @@ class CheckInstalledMiddleware(BaseMiddleware):
             None
         """
         self.event = event
-        messages_logger.info(
-            _('Входящее сообщение: telegram_id: %s | telegram_username: '
-              '"@%s" | text: "%s"' % (event.from_user.id,
-                                          event.from_user.username if event.from_user.username else '',
-                                          event.text)
-              )
-        )
+        messages_logger.info('Входящее сообщение: telegram_id: %s | telegram_username: "@%s" | text: "%s"',
+                             event.from_user.id, event.from_user.username if event.from_user.username else '',
+                             event.text)
         self.data = data
-        if not os.path.exists(os.path.join(ABS_PATH, 'bot_installed.txt')):
+        if not await install_state.check():
             if self.event.text == _('Продолжить'):
                 await self.run_bot_setup()
             else:
@@ -158,29 +154,40 @@ class CheckInstalledMiddleware(BaseMiddleware):
             'FOREIGN KEY (bot_role_id) REFERENCES bot_role (id) ON DELETE CASCADE,'
             'CONSTRAINT u_bot_user_id_bot_role_id UNIQUE(bot_user_id, bot_role_id))',
 
+            # Задания рассылки
+            *BROADCAST_JOBS_TABLES_SQL,
+
+            # Задачи планировщика
+            *SCHEDULER_TABLES_SQL,
+
+            # Версии кэшей процессов-обработчиков
+            *CACHE_VERSIONS_TABLES_SQL,
+
+            # Начальные данные вставляются с INSERT IGNORE и явными id: установку могут одновременно запустить
+            # несколько процессов-обработчиков, повторный запуск ничего не добавляет
             # Создаём роли пользователей
-            "INSERT INTO bot_role (`name`, `priority`) VALUES ('root', '1000')",
-            "INSERT INTO bot_role (`name`, `priority`) VALUES ('director', '500')",
-            "INSERT INTO bot_role (`name`, `priority`) VALUES ('admin', '100')",
-            "INSERT INTO bot_role (`name`, `priority`) VALUES ('editor', '50')",
-            "INSERT INTO bot_role (`name`, `priority`) VALUES ('student', '10')",
-            "INSERT INTO bot_role (`name`, `priority`) VALUES ('guest', '5')",
+            "INSERT IGNORE INTO bot_role (`id`, `name`, `priority`) VALUES (1, 'root', '1000')",
+            "INSERT IGNORE INTO bot_role (`id`, `name`, `priority`) VALUES (2, 'director', '500')",
+            "INSERT IGNORE INTO bot_role (`id`, `name`, `priority`) VALUES (3, 'admin', '100')",
+            "INSERT IGNORE INTO bot_role (`id`, `name`, `priority`) VALUES (4, 'editor', '50')",
+            "INSERT IGNORE INTO bot_role (`id`, `name`, `priority`) VALUES (5, 'student', '10')",
+            "INSERT IGNORE INTO bot_role (`id`, `name`, `priority`) VALUES (6, 'guest', '5')",
             # Создаём первого пользователя и регистрируем его
-            f'INSERT INTO bot_user (telegram_id, telegram_username, first_name, last_name, is_registered, terms_agree) '
-            f'VALUES ("{OWNER_ID}", "{root_username}", "нет_имени", "нет_фамилии", TRUE, TRUE)',
+            ('INSERT IGNORE INTO bot_user (id, telegram_id, telegram_username, first_name, last_name, is_registered, '
+             "terms_agree) VALUES (1, %s, %s, 'нет_имени', 'нет_фамилии', TRUE, TRUE)", (str(OWNER_ID), root_username)),
             # Выдаём пользователю роль root
-            'INSERT INTO bot_user_bot_role (bot_user_id, bot_role_id) VALUES (1, 1)',
+            'INSERT IGNORE INTO bot_user_bot_role (bot_user_id, bot_role_id) VALUES (1, 1)',
             # Создаём учебное заведение
-            'INSERT INTO institution(name) VALUES ("Главное учебное заведение")',
+            'INSERT IGNORE INTO institution(id, name) VALUES (1, "Главное учебное заведение")',
             # Создаём базовые условия пользования, обязательно измените их!
-            "INSERT INTO setting (name, value) VALUES ('terms_text', 'Условия пользования: мы храним историю сообщений и "
+            "INSERT IGNORE INTO setting (name, value) VALUES ('terms_text', 'Условия пользования: мы храним историю сообщений и "
             "имеем к ней полный доступ, доступ к истории сообщений не зависит от вашего одобрения и согласия. "
             "Условия пользования могут измениться в любой момент, без уведомления вас об этом."
             "Продолжая использовать бота, вы соглашаетесь с этими условиями пользования.')",
             # Устанавливаем режим доступа
-            "INSERT INTO setting (name, value) VALUES ('access_mode', 'allow_all')",
+            "INSERT IGNORE INTO setting (name, value) VALUES ('access_mode', 'allow_all')",
             # Привязываем root пользователя к учебному заведению
-            "INSERT INTO institution_bot_user(institution_id, bot_user_id) VALUES (1, 1)"
+            "INSERT IGNORE INTO institution_bot_user(institution_id, bot_user_id) VALUES (1, 1)"
         ]
 
         response = await db.sql_transaction(sql_requests)
@@ -208,5 +215,5 @@ class CheckInstalledMiddleware(BaseMiddleware):
         Returns:
             None
         """
-        with open('bot_installed.txt', 'w', encoding='utf-8') as file:
-            file.write('# ' + _('Это служебный файл, если его удалить, то бот начнёт процедуру установки'))
+        await install_state.mark_installed(
+            '# ' + _('Это служебный файл, если его удалить, то бот начнёт процедуру установки'))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Middleware считающий метрики обновлений."""
+import time
+from typing import Dict, Any
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import Update
+
+from create_custom_objects import db
+from metrics import UPDATES_TOTAL, UPDATE_DURATION, UPDATE_SQL_QUERIES
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Класс Middleware считающий обновления по типам, время их обработки и количество SQL запросов на обновление."""
+
+    async def on_pre_process_update(self, update: Update, data: Dict[str, Any]) -> None:
+        """
+        Запоминает время начала обработки обновления.
+
+        Args:
+            update: обновление
+            data: данные
+
+        Returns:
+            None
+        """
+        data['metrics_started_at'] = time.perf_counter()
+
+    async def on_post_process_update(self, update: Update, results: list, data: Dict[str, Any]) -> None:
+        """
+        Записывает метрики обработанного обновления.
+
+        Args:
+            update: обновление
+            results: результаты обработчиков
+            data: данные
+
+        Returns:
+            None
+        """
+        UPDATE_DURATION.observe(time.perf_counter() - data['metrics_started_at'])
+        UPDATES_TOTAL.inc(next((x for x in update.values if x != 'update_id'), 'unknown'))
+        # Подсчёт запускает AccessControlMiddleware, значение читается из контекста обновления
+        queries_count = db.get_queries_counter()
+        if queries_count is not None:
+            UPDATE_SQL_QUERIES.observe(queries_count)
@@ -4,13 +4,19 @@
 
 """Антиспам middleware."""
 import asyncio
-from aiogram import Dispatcher, types
+import time
+
+from aiogram import types
 from aiogram.dispatcher import DEFAULT_RATE_LIMIT
 from aiogram.dispatcher.handler import current_handler, CancelHandler
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.utils.exceptions import Throttled
 
 from config import UNLOCKED_MESSAGE, TOO_MANY_REQUESTS_MESSAGE
+from create_custom_objects import throttling
+from loggers import errors_logger
+from metrics import THROTTLED_TOTAL, THROTTLING_UNLOCK_TIMERS
+from tracing import TracingMiddlewareMixin
 
 
 def rate_limit(limit: int, key=None):
@@ -30,7 +36,7 @@ def rate_limit(limit: int, key=None):
 
     return decorator
 
-class ThrottlingMiddleware(BaseMiddleware):
+class ThrottlingMiddleware(TracingMiddlewareMixin, BaseMiddleware):
     """
     Simple middleware
     """
@@ -38,6 +44,10 @@ class ThrottlingMiddleware(BaseMiddleware):
     def __init__(self, limit=DEFAULT_RATE_LIMIT, key_prefix='antiflood_'):
         self.rate_limit = limit
         self.prefix = key_prefix
+        # {(chat_id, user_id, key): unlock notification timer}
+        self._unlock_timers = {}
+        self._notify_tasks = set()
+        THROTTLING_UNLOCK_TIMERS.set_function(lambda: len(self._unlock_timers))
         super(ThrottlingMiddleware, self).__init__()
 
     async def on_process_message(self, message: types.Message, data: dict):
@@ -49,8 +59,6 @@ class ThrottlingMiddleware(BaseMiddleware):
         # Get current handler
         handler = current_handler.get()
 
-        # Get dispatcher from context
-        dispatcher = Dispatcher.get_current()
         # If handler was configured, get rate limit and key from handler
         if handler:
             limit = getattr(handler, 'throttling_rate_limit', self.rate_limit)
@@ -59,10 +67,11 @@ class ThrottlingMiddleware(BaseMiddleware):
             limit = self.rate_limit
             key = f"{self.prefix}_message"
 
-        # Use Dispatcher.throttle method.
+        # Use configured throttling backend
         try:
-            await dispatcher.throttle(key, rate=limit)
+            await throttling.throttle(key, rate=limit)
         except Throttled as t:
+            THROTTLED_TOTAL.inc()
             # Execute action
             await self.message_throttled(message, t)
 
@@ -73,29 +82,56 @@ class ThrottlingMiddleware(BaseMiddleware):
         """
         Notify user only on first exceed and notify about unlocking only on last exceed
 
+        Throttled message is dropped immediately: unlock notification is sent by one timer per throttled key,
+        which is rescheduled on every exceed, so a flood keeps one timer per user instead of a coroutine per message.
+
         :param message:
         :param throttled:
         """
-        handler = current_handler.get()
-        dispatcher = Dispatcher.get_current()
-        if handler:
-            key = getattr(handler, 'throttling_key', f"{self.prefix}_{handler.__name__}")
-        else:
-            key = f"{self.prefix}_message"
-
-        # Calculate how many time is left till the block ends
-        delta = throttled.rate - throttled.delta
-
         # Prevent flooding
         if throttled.exceeded_count <= 2:
             await message.reply(TOO_MANY_REQUESTS_MESSAGE)
 
-        # Sleep.
-        await asyncio.sleep(delta)
+        timer_key = (throttled.chat, throttled.user, throttled.key)
+        timer = self._unlock_timers.pop(timer_key, None)
+        if timer:
+            timer.cancel()
 
-        # Check lock status
-        thr = await dispatcher.check_key(key)
+        # Block ends when rate passes since the last call
+        delay = max(throttled.called_at + throttled.rate - time.time(), 0)
+        self._unlock_timers[timer_key] = asyncio.get_running_loop().call_later(
+            delay, self._on_unlock, timer_key, message, throttled.exceeded_count
+        )
 
-        # If current message is not last with current key - do not send message
-        if thr.exceeded_count == throttled.exceeded_count:
-            await message.reply(UNLOCKED_MESSAGE)
\ No newline at end of file
+    def _on_unlock(self, timer_key: tuple, message: types.Message, exceeded_count: int):
+        """
+        Unlock timer callback, starts notification task
+
+        :param timer_key:
+        :param message: last throttled message
+        :param exceeded_count: exceeded count of the last throttled message
+        """
+        self._unlock_timers.pop(timer_key, None)
+        task = asyncio.create_task(self._notify_unlocked(timer_key, message, exceeded_count))
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    async def _notify_unlocked(self, timer_key: tuple, message: types.Message, exceeded_count: int):
+        """
+        Send unlock notification if there were no calls with this key since the last throttled message
+
+        :param timer_key:
+        :param message: last throttled message
+        :param exceeded_count: exceeded count of the last throttled message
+        """
+        chat_id, user_id, key = timer_key
+        try:
+            # Check lock status, with other bot instances sharing the storage the last exceed may be not ours
+            thr = await throttling.check_key(key, user_id=user_id, chat_id=chat_id)
+
+            # If current message is not last with current key - do not send message,
+            # zero count means in-memory key was evicted as idle, so there were no calls after this message
+            if thr.exceeded_count in (exceeded_count, 0):
+                await message.reply(UNLOCKED_MESSAGE)
+        except Exception:
+            errors_logger.exception('Ошибка отправки уведомления о разблокировке')
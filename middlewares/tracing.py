@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Middleware запускающий трассировку обновлений."""
+from typing import Dict, Any
+
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import Update
+
+from tracing import start_trace, finish_trace
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Класс Middleware запускающий трассу на каждое обновление, подключается первым."""
+
+    async def on_pre_process_update(self, update: Update, data: Dict[str, Any]) -> None:
+        """
+        Запускает трассу обновления.
+
+        Args:
+            update: обновление
+            data: данные
+
+        Returns:
+            None
+        """
+        start_trace(update.update_id)
+
+    async def on_post_process_update(self, update: Update, results: list, data: Dict[str, Any]) -> None:
+        """
+        Завершает трассу обновления, медленные обновления попадают в лог медленных обновлений.
+
+        Args:
+            update: обновление
+            results: результаты обработчиков
+            data: данные
+
+        Returns:
+            None
+        """
+        finish_trace()
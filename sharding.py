@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Шардирование обработки обновлений по процессам.
+
+Главный процесс получает обновления от Telegram (webhook или long polling) и передаёт их процессам-обработчикам,
+номер процесса выбирается по from_user.id. Обновления одного пользователя всегда попадают в один процесс и
+обрабатываются в нём строго по очереди, обновления разных пользователей обрабатываются параллельно. Состояния FSM
+хранятся в MongoStorage и общие для всех процессов.
+
+Кэши (разрешения, настройки, расписание, типы недели, готовые сообщения) у каждого процесса свои. Сброс кэша через
+cache_versions.publish доходит до остальных процессов не позже чем через SHARDING_CACHE_SYNC_INTERVAL секунд,
+изменения в базе данных в обход publish видны после истечения TTL кэша. Состояние установки каждый процесс
+перепроверяет сам, пока бот не установлен.
+"""
+import asyncio
+import multiprocessing
+import signal
+import ssl
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot import api
+from aiohttp import web
+
+from config import SHARDING_WORKERS, SHARDING_QUEUE_SIZE, SHARDING_WORKER_CONCURRENCY, BOT_RUN_MODE, WEBHOOK_URL, \
+    WEBHOOK_PATH, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_SSL_CERT, \
+    WEBHOOK_SSL_PRIVATE_KEY, POLLING_LIMIT, POLLING_TIMEOUT, POLLING_RELAX, INSTALL_RECHECK_INTERVAL, METRICS_PORT
+from loggers import errors_logger
+from metrics import metrics_server
+
+# Время ожидания завершения процесса-обработчика перед принудительной остановкой в секундах
+_WORKER_JOIN_TIMEOUT = 30
+
+
+def get_shard_key(update: dict) -> int:
+    """
+    Получает ключ шардирования обновления: id пользователя, если его нет - id чата, если нет и его - update_id.
+
+    Args:
+        update: обновление в виде словаря Bot API
+
+    Returns:
+        int: ключ шардирования
+    """
+    for key, value in update.items():
+        if not isinstance(value, dict): continue
+        user = value.get('from') or value.get('user')
+        if user: return user['id']
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat: return chat['id']
+    return update.get('update_id', 0)
+
+
+class ShardWorker:
+    """
+    Класс обработчика обновлений внутри процесса-обработчика.
+
+    У каждого пользователя своя очередь обновлений, которую разбирает одна задача. Место в лимите одновременной
+    обработки занимается только на время обработки обновления, поэтому обновления пользователя, ждущие своей
+    очереди, не мешают обработке обновлений других пользователей.
+    """
+
+    def __init__(self, index: int, queue: multiprocessing.Queue, concurrency: int,
+                 backlog_size: int = SHARDING_QUEUE_SIZE) -> None:
+        """
+        init метод.
+
+        Args:
+            index: номер процесса-обработчика
+            queue: очередь обновлений процесса
+            concurrency: максимум одновременно обрабатываемых обновлений
+            backlog_size: максимум полученных из очереди, но ещё не обработанных обновлений
+        """
+        self.index = index
+        self._queue = queue
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._backlog = asyncio.Semaphore(backlog_size)
+        # {ключ шардирования: очередь ещё не обработанных обновлений пользователя}, ключ есть, пока очередь разбирается
+        self._pending = {}
+        self._tasks = set()
+
+    async def run(self) -> None:
+        """
+        Получает обновления из очереди до сигнала остановки и дожидается обработки уже полученных.
+
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._backlog.acquire()
+            item = await loop.run_in_executor(None, self._queue.get)
+            if item is None:
+                self._backlog.release()
+                break
+            shard_key, update = item
+            if shard_key in self._pending:
+                self._pending[shard_key].append(update)
+                continue
+            self._pending[shard_key] = deque([update])
+            task = asyncio.create_task(self._process(shard_key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    async def _process(self, shard_key: int) -> None:
+        """
+        Обрабатывает обновления пользователя по очереди, пока они есть.
+
+        Args:
+            shard_key: ключ шардирования
+
+        Returns:
+            None
+        """
+        from create_bot import dp
+
+        updates = self._pending[shard_key]
+        try:
+            while updates:
+                update = updates.popleft()
+                try:
+                    async with self._semaphore:
+                        await dp.updates_handler.notify(types.Update.to_object(update))
+                except Exception:
+                    errors_logger.exception('Ошибка обработки обновления в процессе-обработчике %s', self.index)
+                finally:
+                    self._backlog.release()
+        finally:
+            del self._pending[shard_key]
+
+
+def run_worker(index: int, queue: multiprocessing.Queue, concurrency: int) -> None:
+    """
+    Точка входа процесса-обработчика.
+
+    Фоновый обработчик заданий рассылки и планировщик задач запускаются только в процессе 0, чтобы задания не
+    выполнялись дважды.
+
+    Args:
+        index: номер процесса-обработчика
+        queue: очередь обновлений процесса
+        concurrency: максимум одновременно обрабатываемых обновлений
+
+    Returns:
+        None
+    """
+    # Остановкой процессов управляет главный процесс через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from bot import setup_dispatcher, on_shutdown
+    from create_bot import dp, bot, loop
+    from create_custom_objects import install_state, broadcast_jobs, schedule_messages, week_types, \
+        scheduler, cache_versions
+
+    setup_dispatcher()
+    Bot.set_current(bot)
+    Dispatcher.set_current(dp)
+
+    async def main() -> None:
+        # У каждого процесса-обработчика свои метрики и свой порт
+        await metrics_server.start(METRICS_PORT + index if METRICS_PORT else 0)
+        install_state.start_recheck(INSTALL_RECHECK_INTERVAL)
+        cache_versions.start()
+        # Кэши типов недели и сообщений с расписанием у каждого процесса свои
+        week_types.start_rollover()
+        schedule_messages.start_prewarm()
+        if index == 0:
+            broadcast_jobs.start()
+            scheduler.start()
+        try:
+            await ShardWorker(index, queue, concurrency).run()
+        finally:
+            await on_shutdown(dp)
+            await dp.storage.close()
+            await dp.storage.wait_closed()
+            await (await bot.get_session()).close()
+
+    loop.run_until_complete(main())
+
+
+class ShardsFront:
+    """Класс главного процесса: запускает процессы-обработчики и распределяет между ними обновления."""
+
+    def __init__(self, workers_count: int = SHARDING_WORKERS, queue_size: int = SHARDING_QUEUE_SIZE) -> None:
+        """
+        init метод.
+
+        Args:
+            workers_count: количество процессов-обработчиков
+            queue_size: размер очереди обновлений одного процесса
+        """
+        context = multiprocessing.get_context('spawn')
+        self._queues = [context.Queue(queue_size) for x in range(workers_count)]
+        self._processes = [
+            context.Process(target=run_worker, args=(index, queue, SHARDING_WORKER_CONCURRENCY),
+                            name=f'shard-{index}')
+            for index, queue in enumerate(self._queues)
+        ]
+        # Один поток на очередь, чтобы обновления попадали в очередь в порядке вызова dispatch
+        self._putters = [ThreadPoolExecutor(max_workers=1) for x in range(workers_count)]
+
+    def start(self) -> None:
+        """
+        Запускает процессы-обработчики.
+
+        Returns:
+            None
+        """
+        for process in self._processes:
+            process.start()
+
+    async def dispatch(self, update: dict) -> None:
+        """
+        Передаёт обновление процессу-обработчику, если его очередь заполнена - ждёт.
+
+        Args:
+            update: обновление в виде словаря Bot API
+
+        Returns:
+            None
+        """
+        shard_key = get_shard_key(update)
+        index = shard_key % len(self._queues)
+        await asyncio.get_running_loop().run_in_executor(self._putters[index], self._queues[index].put,
+                                                         (shard_key, update))
+
+    async def stop(self) -> None:
+        """
+        Останавливает процессы-обработчики после обработки уже переданных им обновлений.
+
+        Returns:
+            None
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(putter, queue.put, None)
+                               for putter, queue in zip(self._putters, self._queues)])
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, _WORKER_JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        for putter in self._putters:
+            putter.shutdown(wait=False)
+
+    async def run_polling(self) -> None:
+        """
+        Получает обновления через long polling и передаёт их процессам-обработчикам без разбора в объекты aiogram.
+
+        Returns:
+            None
+        """
+        from create_bot import bot
+
+        await bot.delete_webhook()
+        offset = None
+        while True:
+            payload = {'limit': POLLING_LIMIT, 'timeout': POLLING_TIMEOUT}
+            if offset is not None:
+                payload['offset'] = offset
+            try:
+                updates = await bot.request(api.Methods.GET_UPDATES, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                errors_logger.exception('Ошибка получения обновлений')
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                await self.dispatch(update)
+                offset = update['update_id'] + 1
+            if POLLING_RELAX:
+                await asyncio.sleep(POLLING_RELAX)
+
+    def make_webhook_app(self) -> web.Application:
+        """
+        Создаёт aiohttp приложение, принимающее обновления от Telegram и передающее их процессам-обработчикам.
+
+        Returns:
+            web.Application: приложение
+        """
+        from create_bot import bot
+
+        async def handle(request: web.Request) -> web.Response:
+            await self.dispatch(await request.json())
+            return web.Response()
+
+        async def on_startup(app: web.Application) -> None:
+            self.start()
+            certificate = open(WEBHOOK_SSL_CERT, 'rb') if WEBHOOK_SSL_CERT else None
+            try:
+                await bot.set_webhook(WEBHOOK_URL, certificate=certificate, max_connections=WEBHOOK_MAX_CONNECTIONS)
+            finally:
+                if certificate: certificate.close()
+
+        async def on_shutdown(app: web.Application) -> None:
+            await bot.delete_webhook()
+            await self.stop()
+            await (await bot.get_session()).close()
+
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, handle)
+        app.on_startup.append(on_startup)
+        app.on_shutdown.append(on_shutdown)
+        return app
+
+
+def start_sharded() -> None:
+    """
+    Запускает бота с обработкой обновлений в SHARDING_WORKERS процессах в режиме BOT_RUN_MODE.
+
+    Returns:
+        None
+    """
+    from create_bot import bot, loop
+
+    front = ShardsFront()
+    if BOT_RUN_MODE == 'webhook':
+        ssl_context = None
+        if WEBHOOK_SSL_CERT and WEBHOOK_SSL_PRIVATE_KEY:
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ssl_context.load_cert_chain(WEBHOOK_SSL_CERT, WEBHOOK_SSL_PRIVATE_KEY)
+        web.run_app(front.make_webhook_app(), host=WEBHOOK_LISTEN_HOST, port=WEBHOOK_LISTEN_PORT,
+                    ssl_context=ssl_context, loop=loop)
+        return
+
+    front.start()
+    polling = loop.create_task(front.run_polling())
+    try:
+        loop.run_until_complete(polling)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        polling.cancel()
+        loop.run_until_complete(asyncio.gather(polling, return_exceptions=True))
+        loop.run_until_complete(front.stop())
+        session = loop.run_until_complete(bot.get_session())
+        loop.run_until_complete(session.close())
@@ -0,0 +1 @@
+from .caching import *
\ No newline at end of file
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Кэширующая обёртка хранилища состояний FSM с отложенной записью."""
+import asyncio
+import copy
+from collections import OrderedDict
+from typing import Union, Optional, Dict, AnyStr
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from config import FSM_CACHE_SIZE, FSM_CACHE_FLUSH_INTERVAL
+from loggers import errors_logger
+
+# Значение поля, которое не нужно записывать
+_SKIP = object()
+
+
+class _Entry:
+    """Класс закэшированного состояния и данных одного пользователя в чате."""
+
+    __slots__ = ('state', 'data', 'has_state', 'has_data', 'state_dirty', 'data_dirty')
+
+    def __init__(self) -> None:
+        """init метод."""
+        self.state = None
+        self.data = None
+        self.has_state = False
+        self.has_data = False
+        self.state_dirty = False
+        self.data_dirty = False
+
+    @property
+    def dirty(self) -> bool:
+        """
+        Есть ли незаписанные изменения.
+
+        Returns:
+            bool: True - есть
+        """
+        return self.state_dirty or self.data_dirty
+
+    def take_dirty(self) -> tuple:
+        """
+        Забирает незаписанные изменения и снимает отметку.
+
+        Returns:
+            tuple: (state, data), _SKIP вместо неизменённых полей
+        """
+        state = self.state if self.state_dirty else _SKIP
+        data = self.data if self.data_dirty else _SKIP
+        self.state_dirty = self.data_dirty = False
+        return state, data
+
+
+class CachingStorage(BaseStorage):
+    """
+    Класс кэширующего хранилища состояний FSM.
+
+    Состояния и данные пользователей хранятся в LRU кэше, промах читается из обёрнутого хранилища, в том числе
+    отсутствие состояния, поэтому пользователи без FSM не обращаются к хранилищу повторно. Изменения записываются
+    в обёрнутое хранилище раз в flush_interval секунд и при закрытии, вытесняемая изменённая запись записывается
+    сразу. Кэш корректен, пока пользователя обслуживает один процесс (в том числе при шардировании по процессам),
+    при аварийном завершении теряются изменения за последний flush_interval.
+    """
+
+    def __init__(self,
+                 storage: BaseStorage,
+                 size: int = FSM_CACHE_SIZE,
+                 flush_interval: float = FSM_CACHE_FLUSH_INTERVAL) -> None:
+        """
+        init метод.
+
+        Args:
+            storage: обёрнутое хранилище, например MongoStorage
+            size: максимальное количество пар (чат, пользователь) в кэше
+            flush_interval: интервал записи изменений в секундах
+        """
+        self._storage = storage
+        self._size = size
+        self._flush_interval = flush_interval
+        # {(chat, user): _Entry}
+        self._entries = OrderedDict()
+        self._dirty = set()
+        # {(chat, user): задача записи вытесненной изменённой записи}
+        self._evicted = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Union[asyncio.Task, None] = None
+
+    async def _get_entry(self, key: tuple) -> _Entry:
+        """
+        Получает запись кэша, создаёт пустую, если её нет.
+
+        Args:
+            key: (chat, user)
+
+        Returns:
+            _Entry: запись кэша
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        # Запись вытеснена и ещё записывается: ждём, чтобы не прочитать или не перезаписать старое значение
+        pending = self._evicted.get(key)
+        if pending is not None:
+            await asyncio.wait([pending])
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            self._evict()
+        return entry
+
+    def _evict(self) -> None:
+        """
+        Вытесняет самые старые записи сверх размера кэша, изменённые записываются в фоне.
+
+        Returns:
+            None
+        """
+        while len(self._entries) > self._size:
+            key, entry = self._entries.popitem(last=False)
+            self._dirty.discard(key)
+            if entry.dirty:
+                self._evicted[key] = asyncio.create_task(self._write_evicted(key, *entry.take_dirty()))
+
+    def _mark_dirty(self, key: tuple) -> None:
+        """
+        Отмечает запись изменённой и запускает периодическую запись.
+
+        Args:
+            key: (chat, user)
+
+        Returns:
+            None
+        """
+        self._dirty.add(key)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _write(self, key: tuple, state, data) -> None:
+        """
+        Записывает изменения в обёрнутое хранилище, при ошибке возвращает отметку изменений.
+
+        Args:
+            key: (chat, user)
+            state: состояние или _SKIP
+            data: данные или _SKIP
+
+        Returns:
+            None
+        """
+        chat, user = key
+        try:
+            if state is not _SKIP:
+                await self._storage.set_state(chat=chat, user=user, state=state)
+            if data is not _SKIP:
+                await self._storage.set_data(chat=chat, user=user, data=data)
+        except Exception:
+            errors_logger.exception('Ошибка записи состояния FSM: chat: "%s" | user: "%s"', chat, user)
+            entry = self._entries.get(key)
+            if entry is None: return
+            entry.state_dirty = entry.state_dirty or state is not _SKIP
+            entry.data_dirty = entry.data_dirty or data is not _SKIP
+            self._dirty.add(key)
+
+    async def _write_evicted(self, key: tuple, state, data) -> None:
+        """
+        Записывает вытесненную запись после уже начатой записи изменений.
+
+        Args:
+            key: (chat, user)
+            state: состояние или _SKIP
+            data: данные или _SKIP
+
+        Returns:
+            None
+        """
+        try:
+            async with self._flush_lock:
+                await self._write(key, state, data)
+        finally:
+            if self._evicted.get(key) is asyncio.current_task():
+                del self._evicted[key]
+
+    async def flush(self) -> None:
+        """
+        Записывает все изменения в обёрнутое хранилище.
+
+        Returns:
+            None
+        """
+        async with self._flush_lock:
+            keys, self._dirty = self._dirty, set()
+            writes = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry.dirty:
+                    writes.append(self._write(key, *entry.take_dirty()))
+            await asyncio.gather(*writes)
+
+    async def _flush_loop(self) -> None:
+        """
+        Периодически записывает изменения.
+
+        Returns:
+            None
+        """
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                errors_logger.exception('Ошибка записи состояний FSM')
+
+    async def close(self) -> None:
+        """
+        Записывает изменения и закрывает обёрнутое хранилище.
+
+        Returns:
+            None
+        """
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._evicted:
+            await asyncio.wait(list(self._evicted.values()))
+        await self._storage.close()
+
+    async def wait_closed(self) -> bool:
+        """
+        Ждёт закрытия обёрнутого хранилища.
+
+        Returns:
+            bool: ответ обёрнутого хранилища
+        """
+        return await self._storage.wait_closed()
+
+    async def get_state(self, *,
+                        chat: Union[str, int, None] = None,
+                        user: Union[str, int, None] = None,
+                        default: Optional[str] = None) -> Optional[str]:
+        """
+        Получает состояние, при промахе читает его из обёрнутого хранилища.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            default: состояние, если оно не установлено
+
+        Returns:
+            str: состояние
+            None: состояние не установлено и default не передан
+        """
+        chat, user = self.check_address(chat=chat, user=user)
+        entry = await self._get_entry((chat, user))
+        if not entry.has_state:
+            state = await self._storage.get_state(chat=chat, user=user)
+            # Пока шло чтение, состояние могли установить
+            if not entry.has_state:
+                entry.state, entry.has_state = state, True
+        return entry.state if entry.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: Union[str, int, None] = None,
+                       user: Union[str, int, None] = None,
+                       default: Optional[dict] = None) -> Dict:
+        """
+        Получает копию данных, при промахе читает их из обёрнутого хранилища.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            default: данные, если они не установлены
+
+        Returns:
+            dict: копия данных
+        """
+        chat, user = self.check_address(chat=chat, user=user)
+        entry = await self._get_entry((chat, user))
+        if not entry.has_data:
+            data = await self._storage.get_data(chat=chat, user=user)
+            if not entry.has_data:
+                entry.data, entry.has_data = data, True
+        # Копия, чтобы изменения без set_data не попадали в кэш
+        return copy.deepcopy(entry.data) if entry.data else default or {}
+
+    async def set_state(self, *,
+                        chat: Union[str, int, None] = None,
+                        user: Union[str, int, None] = None,
+                        state: Optional[AnyStr] = None) -> None:
+        """
+        Устанавливает состояние, запись в обёрнутое хранилище отложена.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            state: состояние, None - сбросить
+
+        Returns:
+            None
+        """
+        chat, user = self.check_address(chat=chat, user=user)
+        entry = await self._get_entry((chat, user))
+        entry.state, entry.has_state, entry.state_dirty = self.resolve_state(state), True, True
+        self._mark_dirty((chat, user))
+
+    async def set_data(self, *,
+                       chat: Union[str, int, None] = None,
+                       user: Union[str, int, None] = None,
+                       data: Dict = None) -> None:
+        """
+        Устанавливает данные, запись в обёрнутое хранилище отложена.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            data: данные, кэш хранит их копию
+
+        Returns:
+            None
+        """
+        chat, user = self.check_address(chat=chat, user=user)
+        entry = await self._get_entry((chat, user))
+        entry.data, entry.has_data, entry.data_dirty = copy.deepcopy(data) if data else {}, True, True
+        self._mark_dirty((chat, user))
+
+    async def update_data(self, *,
+                          chat: Union[str, int, None] = None,
+                          user: Union[str, int, None] = None,
+                          data: Dict = None,
+                          **kwargs) -> None:
+        """
+        Обновляет данные.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            data: словарь новых значений
+            **kwargs: новые значения
+
+        Returns:
+            None
+        """
+        temp_data = await self.get_data(chat=chat, user=user, default={})
+        temp_data.update(data or {}, **kwargs)
+        await self.set_data(chat=chat, user=user, data=temp_data)
+
+    def has_bucket(self) -> bool:
+        """
+        Поддерживает ли обёрнутое хранилище bucket антиспама.
+
+        Returns:
+            bool: True - поддерживает
+        """
+        return self._storage.has_bucket()
+
+    async def get_bucket(self, *,
+                         chat: Union[str, int, None] = None,
+                         user: Union[str, int, None] = None,
+                         default: Optional[dict] = None) -> Dict:
+        """
+        Получает bucket антиспама из обёрнутого хранилища, bucket не кэшируется.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            default: bucket, если он не установлен
+
+        Returns:
+            dict: bucket
+        """
+        return await self._storage.get_bucket(chat=chat, user=user, default=default)
+
+    async def set_bucket(self, *,
+                         chat: Union[str, int, None] = None,
+                         user: Union[str, int, None] = None,
+                         bucket: Dict = None) -> None:
+        """
+        Записывает bucket антиспама в обёрнутое хранилище.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            bucket: bucket
+
+        Returns:
+            None
+        """
+        await self._storage.set_bucket(chat=chat, user=user, bucket=bucket)
+
+    async def update_bucket(self, *,
+                            chat: Union[str, int, None] = None,
+                            user: Union[str, int, None] = None,
+                            bucket: Dict = None,
+                            **kwargs) -> None:
+        """
+        Обновляет bucket антиспама в обёрнутом хранилище.
+
+        Args:
+            chat: id чата
+            user: id пользователя
+            bucket: словарь новых значений
+            **kwargs: новые значения
+
+        Returns:
+            None
+        """
+        await self._storage.update_bucket(chat=chat, user=user, bucket=bucket, **kwargs)
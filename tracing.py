@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""
+Трассировка обработки обновлений.
+
+На каждое обновление создаётся трасса, в неё записываются спаны этапов middleware, SQL запросов и запросов к Bot API.
+Трасса хранится в ContextVar, у каждого обновления aiogram своя задача, а значит и своя трасса. Вне обновления
+(рассылки, планировщик) трассы нет и спаны ничего не делают. Если обработка обновления заняла больше
+TRACING_SLOW_UPDATE_THRESHOLD секунд, отчёт со всеми спанами пишется в лог медленных обновлений, отчёт собирается
+в фоновом потоке логов.
+"""
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+from config import TRACING_SLOW_UPDATE_THRESHOLD, TRACING_MAX_SPANS
+from loggers import slow_updates_logger
+from metrics import TELEGRAM_REQUESTS_TOTAL, TELEGRAM_REQUEST_DURATION, TELEGRAM_ERRORS_TOTAL, \
+    TELEGRAM_RETRY_AFTER_TOTAL
+
+SPAN_MIDDLEWARE = 'middleware'
+SPAN_SQL = 'sql'
+SPAN_API = 'api'
+
+_current_trace: ContextVar[Union['Trace', None]] = ContextVar('current_trace', default=None)
+# Номер текущего спана в трассе, становится родителем вложенных спанов
+_current_span: ContextVar[Union[int, None]] = ContextVar('current_span', default=None)
+
+_SQL_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_SQL_NUMBER_RE = re.compile(r'(?<![\w`])-?\d+(?:\.\d+)?\b')
+_SQL_PLACEHOLDER_RE = re.compile(r'%(?:\([^)]+\))?s')
+_SQL_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SQL_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql_request: str, max_length: int = 200) -> str:
+    """
+    Приводит SQL запрос к виду без значений, чтобы одинаковые запросы с разными значениями выглядели одинаково.
+
+    Args:
+        sql_request: SQL запрос
+        max_length: максимальная длина результата
+
+    Returns:
+        str: запрос, в котором строки, числа и параметры заменены на ?, а списки значений на (...)
+    """
+    text = _SQL_STRING_RE.sub('?', sql_request)
+    text = _SQL_PLACEHOLDER_RE.sub('?', text)
+    text = _SQL_NUMBER_RE.sub('?', text)
+    text = _SQL_LIST_RE.sub('(...)', text)
+    text = _SQL_SPACES_RE.sub(' ', text).strip()
+    return text if len(text) <= max_length else text[:max_length - 3] + '...'
+
+
+class Span:
+    """Класс спана - этапа обработки обновления с временем начала и длительностью."""
+
+    __slots__ = ('kind', 'name', 'attrs', 'parent', 'start', 'duration', '_trace', '_index', '_token')
+
+    def __init__(self, trace: 'Trace', kind: str, name: str, attrs: dict) -> None:
+        """
+        init метод.
+
+        Args:
+            trace: трасса
+            kind: вид спана: middleware, sql или api
+            name: имя спана
+            attrs: дополнительные поля спана
+        """
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+        self.parent = _current_span.get()
+        self.start = 0.0
+        self.duration: Union[float, None] = None
+        self._trace = trace
+        self._index = len(trace.spans)
+        self._token = None
+        trace.spans.append(self)
+
+    def set(self, key: str, value) -> None:
+        """
+        Добавляет поле спана.
+
+        Args:
+            key: имя поля
+            value: значение
+
+        Returns:
+            None
+        """
+        self.attrs[key] = value
+
+    def __enter__(self) -> 'Span':
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self._index)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        return False
+
+
+class _NullSpan:
+    """Класс пустого спана, используется вне обновления и при превышении TRACING_MAX_SPANS."""
+
+    __slots__ = ()
+
+    def set(self, key: str, value) -> None:
+        """
+        Ничего не делает.
+
+        Args:
+            key: имя поля
+            value: значение
+
+        Returns:
+            None
+        """
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """Класс трассы обработки одного обновления."""
+
+    def __init__(self, update_id: int, max_spans: int = TRACING_MAX_SPANS) -> None:
+        """
+        init метод.
+
+        Args:
+            update_id: id обновления
+            max_spans: максимальное количество спанов, остальные только считаются
+        """
+        self.update_id = update_id
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.start = time.perf_counter()
+        self.duration: Union[float, None] = None
+
+    def get_totals(self) -> Dict[str, list]:
+        """
+        Считает количество и суммарную длительность спанов каждого вида, вложенные спаны того же вида не учитываются.
+
+        Returns:
+            dict: словарь вида {вид: [количество, длительность]}
+        """
+        totals = {}
+        for span in self.spans:
+            if span.duration is None: continue
+            if span.parent is not None and self.spans[span.parent].kind == span.kind: continue
+            total = totals.setdefault(span.kind, [0, 0.0])
+            total[0] += 1
+            total[1] += span.duration
+        return totals
+
+    def format_report(self) -> str:
+        """
+        Собирает отчёт о трассе: итоги по видам спанов и все спаны со смещением от начала обработки обновления.
+
+        Returns:
+            str: текст отчёта
+        """
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.start
+        lines = ['update_id: %s | %.1f мс | спанов: %s%s' % (
+            self.update_id, duration * 1000, len(self.spans),
+            ' (не записано: %s)' % self.dropped_spans if self.dropped_spans else '')]
+        lines.append('  ' + ' | '.join('%s: %s / %.1f мс' % (kind, count, total * 1000)
+                                       for kind, (count, total) in self.get_totals().items()))
+
+        depths = []
+        for span in self.spans:
+            depth = depths[span.parent] + 1 if span.parent is not None else 0
+            depths.append(depth)
+            attrs = dict(span.attrs)
+            sql_request = attrs.pop('sql', None)
+            line = '  %8.1f + %8s мс %s%s %s' % (
+                (span.start - self.start) * 1000,
+                '%.1f' % (span.duration * 1000) if span.duration is not None else '?',
+                '  ' * depth, span.kind, span.name)
+            if attrs:
+                line += ' ' + ' '.join('%s=%s' % x for x in attrs.items())
+            if sql_request is not None:
+                line += ' | ' + normalize_sql(sql_request)
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def __str__(self) -> str:
+        return self.format_report()
+
+
+def trace_span(kind: str, name: str, **attrs) -> Union[Span, _NullSpan]:
+    """
+    Создаёт спан в трассе текущего обновления, используется как контекстный менеджер.
+
+    Args:
+        kind: вид спана: middleware, sql или api
+        name: имя спана
+        **attrs: дополнительные поля спана
+
+    Returns:
+        Span: спан
+        _NullSpan: пустой спан, если трассы нет или в ней уже TRACING_MAX_SPANS спанов
+    """
+    trace = _current_trace.get()
+    if trace is None: return _NULL_SPAN
+    if len(trace.spans) >= trace.max_spans:
+        trace.dropped_spans += 1
+        return _NULL_SPAN
+    return Span(trace, kind, name, attrs)
+
+
+def get_current_trace() -> Union[Trace, None]:
+    """
+    Получает трассу текущего обновления.
+
+    Returns:
+        Trace: трасса
+        None: трасса не запущена
+    """
+    return _current_trace.get()
+
+
+def start_trace(update_id: int) -> Trace:
+    """
+    Запускает трассу для текущего обновления.
+
+    Args:
+        update_id: id обновления
+
+    Returns:
+        Trace: трасса
+    """
+    trace = Trace(update_id)
+    _current_trace.set(trace)
+    _current_span.set(None)
+    return trace
+
+
+def finish_trace(slow_threshold: float = TRACING_SLOW_UPDATE_THRESHOLD) -> Union[Trace, None]:
+    """
+    Завершает трассу текущего обновления и пишет отчёт, если обновление обрабатывалось дольше slow_threshold секунд.
+
+    Args:
+        slow_threshold: порог медленного обновления в секундах
+
+    Returns:
+        Trace: завершённая трасса
+        None: трасса не была запущена
+    """
+    trace = _current_trace.get()
+    if trace is None: return None
+    trace.duration = time.perf_counter() - trace.start
+    _current_trace.set(None)
+    if trace.duration >= slow_threshold:
+        # Трасса после завершения не меняется, поэтому отчёт собирается в фоновом потоке логов
+        slow_updates_logger.warning('Медленное обновление: %s', trace)
+    return trace
+
+
+class TracingMiddlewareMixin:
+    """Класс примеси к middleware, записывающей каждый этап middleware в трассу обновления."""
+
+    async def trigger(self, action: str, args) -> Optional[bool]:
+        """
+        Вызывает обработчик этапа внутри спана.
+
+        Args:
+            action: этап, например pre_process_message
+            args: аргументы обработчика
+
+        Returns:
+            результат trigger базового middleware
+        """
+        if _current_trace.get() is None or getattr(self, f'on_{action}', None) is None:
+            return await super().trigger(action, args)
+        with trace_span(SPAN_MIDDLEWARE, f'{type(self).__name__}.{action}'):
+            return await super().trigger(action, args)
+
+
+class TracedBot(Bot):
+    """Класс бота, записывающего каждый запрос к Bot API в трассу обновления и в метрики."""
+
+    async def request(self, method: str, data: Optional[Dict] = None, files: Optional[Dict] = None, **kwargs):
+        """
+        Выполняет запрос к Bot API внутри спана и считает запросы, их время и ошибки.
+
+        Args:
+            method: метод Bot API
+            data: параметры запроса
+            files: файлы
+            **kwargs: параметры aiohttp
+
+        Returns:
+            ответ Bot API
+        """
+        TELEGRAM_REQUESTS_TOTAL.inc(method)
+        started_at = time.perf_counter()
+        try:
+            if _current_trace.get() is None:
+                return await super().request(method, data, files, **kwargs)
+            with trace_span(SPAN_API, method):
+                return await super().request(method, data, files, **kwargs)
+        except RetryAfter:
+            TELEGRAM_RETRY_AFTER_TOTAL.inc()
+            TELEGRAM_ERRORS_TOTAL.inc('RetryAfter')
+            raise
+        except Exception as e:
+            TELEGRAM_ERRORS_TOTAL.inc(type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_REQUEST_DURATION.observe(time.perf_counter() - started_at, method)
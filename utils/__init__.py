@@ -1,4 +1,17 @@
 from .functions import *
+from .attachments import *
+from .broadcast import *
+from .broadcast_jobs import *
+from .cache_versions import *
+from .install import *
 from .perms import *
+from .perms_engine import *
+from .throttling import *
 from .messages import *
-from .users import *
\ No newline at end of file
+from .schedule import *
+from .schedule_messages import *
+from .schedule_changes import *
+from .schedule_push import *
+from .scheduler import *
+from .users import *
+from .user_context import *
\ No newline at end of file
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Вложения рассылок: файл загружается в Telegram один раз, дальше отправляется по file_id."""
+import asyncio
+import hashlib
+import io
+from collections import OrderedDict
+from typing import Union
+
+from aiogram.types import InputFile, MediaGroup, Message
+
+from config import FILE_IDS_CACHE_SIZE
+from create_bot import bot
+
+# Ключ словаря файлов рассылки: метод отправки одного файла
+_SEND_METHODS = {'photo': 'send_photo', 'video': 'send_video', 'doc': 'send_document'}
+# Максимум файлов в одной медиагруппе Telegram
+_MEDIA_GROUP_LIMIT = 10
+
+
+class FileIdsCache:
+    """Класс кэша file_id загруженных файлов по хэшу содержимого, общий для всех рассылок."""
+
+    def __init__(self, size: int = FILE_IDS_CACHE_SIZE) -> None:
+        """
+        init метод.
+
+        Args:
+            size: максимальное количество file_id в кэше
+        """
+        self._size = size
+        self._file_ids = OrderedDict()
+
+    def get(self, content_hash: str) -> Union[str, None]:
+        """
+        Получает file_id по хэшу содержимого.
+
+        Args:
+            content_hash: хэш содержимого файла
+
+        Returns:
+            str: file_id
+            None: файл ещё не загружался
+        """
+        file_id = self._file_ids.get(content_hash)
+        if file_id is not None:
+            self._file_ids.move_to_end(content_hash)
+        return file_id
+
+    def set(self, content_hash: str, file_id: str) -> None:
+        """
+        Сохраняет file_id загруженного файла.
+
+        Args:
+            content_hash: хэш содержимого файла
+            file_id: file_id
+
+        Returns:
+            None
+        """
+        self._file_ids[content_hash] = file_id
+        self._file_ids.move_to_end(content_hash)
+        if len(self._file_ids) > self._size:
+            self._file_ids.popitem(last=False)
+
+
+class _Attachment:
+    """Класс одного файла рассылки."""
+
+    def __init__(self, kind: str, file: Union[InputFile, io.IOBase, str]) -> None:
+        """
+        init метод.
+
+        Args:
+            kind: тип файла: photo, video или doc
+            file: InputFile, открытый файл, ссылка или file_id
+        """
+        self.kind = kind
+        # Открытый файл или BytesIO, как и при прямой отправке через бота, загружается через InputFile
+        self.file = InputFile(file) if isinstance(file, io.IOBase) else file
+        self.content_hash: Union[str, None] = None
+        # Содержимое файла на время загрузки, aiohttp закрывает поток после каждого запроса
+        self._content: Union[bytes, None] = None
+
+    @property
+    def needs_upload(self) -> bool:
+        """
+        Нужно ли загружать файл в Telegram, ссылки Telegram скачивает при каждой отправке.
+
+        Returns:
+            bool: True - файл ещё не имеет file_id
+        """
+        return isinstance(self.file, InputFile) or self.file.startswith(('http://', 'https://'))
+
+    async def compute_hash(self) -> None:
+        """
+        Считает хэш содержимого файла вне event loop.
+
+        Returns:
+            None
+        """
+        if not self.needs_upload: return
+        if not isinstance(self.file, InputFile):
+            self.content_hash = f'url:{self.kind}:{self.file}'
+            return
+
+        stream = self.file.file
+
+        def read_hash() -> str:
+            position = stream.tell()
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+            stream.seek(position)
+            return digest.hexdigest()
+
+        self.content_hash = f'{self.kind}:' + await asyncio.get_running_loop().run_in_executor(None, read_hash)
+
+    async def load(self) -> None:
+        """
+        Читает содержимое файла вне event loop перед загрузкой.
+
+        Returns:
+            None
+        """
+        if self._content is not None or not isinstance(self.file, InputFile): return
+
+        stream = self.file.file
+
+        def read() -> bytes:
+            stream.seek(0)
+            return stream.read()
+
+        self._content = await asyncio.get_running_loop().run_in_executor(None, read)
+
+    def rewind(self) -> None:
+        """
+        Подставляет новый поток с содержимым файла перед каждой попыткой загрузки, в том числе повтором после
+        RetryAfter.
+
+        Returns:
+            None
+        """
+        if self._content is not None:
+            self.file = InputFile(io.BytesIO(self._content), filename=self.file.filename)
+
+    def capture(self, message: Message, cache: FileIdsCache) -> None:
+        """
+        Запоминает file_id из ответа Telegram на отправку файла.
+
+        Args:
+            message: отправленное сообщение
+            cache: кэш file_id
+
+        Returns:
+            None
+        """
+        if self.kind == 'photo':
+            file_id = message.photo[-1].file_id
+        elif self.kind == 'video':
+            file_id = message.video.file_id
+        else:
+            file_id = message.document.file_id
+        if self.content_hash:
+            cache.set(self.content_hash, file_id)
+        self.file = file_id
+        self._content = None
+
+
+class _SendItem:
+    """Класс одной отправки: один файл или медиагруппа."""
+
+    def __init__(self, attachments: list) -> None:
+        """
+        init метод.
+
+        Args:
+            attachments: файлы отправки
+        """
+        self.attachments = attachments
+        self._upload_lock = asyncio.Lock()
+
+    @property
+    def uploaded(self) -> bool:
+        """
+        Все ли файлы отправки уже имеют file_id.
+
+        Returns:
+            bool: True - загрузка не нужна
+        """
+        return not any(x.needs_upload for x in self.attachments)
+
+    async def send(self, session, telegram_id: int, cache: FileIdsCache) -> None:
+        """
+        Отправляет файлы получателю, первая отправка загружает файлы, остальные получатели ждут её и используют file_id.
+
+        Args:
+            session: сессия рассылки
+            telegram_id: telegram id получателя
+            cache: кэш file_id
+
+        Returns:
+            None
+        """
+        if not self.uploaded:
+            async with self._upload_lock:
+                if not self.uploaded:
+                    for attachment in self.attachments:
+                        await attachment.load()
+                    response = await self._send(session, telegram_id)
+                    messages = response if isinstance(response, list) else [response]
+                    for attachment, message in zip(self.attachments, messages):
+                        if attachment.needs_upload:
+                            attachment.capture(message, cache)
+                    return
+        await self._send(session, telegram_id)
+
+    async def _send(self, session, telegram_id: int) -> Union[Message, list]:
+        """
+        Выполняет отправку через сессию рассылки.
+
+        Args:
+            session: сессия рассылки
+            telegram_id: telegram id получателя
+
+        Returns:
+            Message: отправленное сообщение
+            list: сообщения медиагруппы
+        """
+        return await session.call(telegram_id, self._request, telegram_id)
+
+    async def _request(self, telegram_id: int) -> Union[Message, list]:
+        """
+        Выполняет запрос отправки, сессия повторяет его после RetryAfter, поэтому запрос собирается заново.
+
+        Args:
+            telegram_id: telegram id получателя
+
+        Returns:
+            Message: отправленное сообщение
+            list: сообщения медиагруппы
+        """
+        for attachment in self.attachments:
+            attachment.rewind()
+
+        if len(self.attachments) == 1:
+            attachment = self.attachments[0]
+            return await getattr(bot, _SEND_METHODS[attachment.kind])(telegram_id, attachment.file)
+
+        media = MediaGroup()
+        for attachment in self.attachments:
+            if attachment.kind == 'photo':
+                media.attach_photo(attachment.file)
+            elif attachment.kind == 'video':
+                media.attach_video(attachment.file)
+            else:
+                media.attach_document(attachment.file)
+        return await bot.send_media_group(telegram_id, media)
+
+
+class BroadcastAttachments:
+    """Класс файлов одной рассылки."""
+
+    def __init__(self, files: dict, cache: FileIdsCache) -> None:
+        """
+        init метод.
+
+        Args:
+            files: словарь вида {'photo': файл_или_список, 'video': ..., 'doc': ...}
+            cache: кэш file_id
+        """
+        self._cache = cache
+        self._attachments = []
+        for kind, value in files.items():
+            if kind not in _SEND_METHODS: continue
+            for file in (value if isinstance(value, (list, tuple)) else [value]):
+                self._attachments.append(_Attachment(kind, file))
+        self._items = []
+
+    async def prepare(self) -> None:
+        """
+        Подставляет file_id уже загруженных ранее файлов и собирает медиагруппы.
+
+        Фото и видео объединяются в медиагруппы, документы - в отдельные медиагруппы, одиночный файл
+        отправляется своим методом.
+
+        Returns:
+            None
+        """
+        for attachment in self._attachments:
+            await attachment.compute_hash()
+            file_id = self._cache.get(attachment.content_hash) if attachment.content_hash else None
+            if file_id is not None:
+                attachment.file = file_id
+
+        visual = [x for x in self._attachments if x.kind in ('photo', 'video')]
+        documents = [x for x in self._attachments if x.kind == 'doc']
+        self._items = []
+        for group in (visual, documents):
+            # Часть из одного файла отправляется не медиагруппой, а своим методом
+            for start in range(0, len(group), _MEDIA_GROUP_LIMIT):
+                self._items.append(_SendItem(group[start:start + _MEDIA_GROUP_LIMIT]))
+
+    async def send(self, session, telegram_id: int) -> None:
+        """
+        Отправляет все файлы рассылки получателю.
+
+        Args:
+            session: сессия рассылки
+            telegram_id: telegram id получателя
+
+        Returns:
+            None
+        """
+        for item in self._items:
+            await item.send(session, telegram_id, self._cache)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Движок рассылок с ограничением скорости отправки по лимитам Telegram."""
+import asyncio
+import time
+from typing import Callable, Awaitable, Union, Any
+
+from aiogram.utils.exceptions import RetryAfter
+
+from config import BROADCAST_CONCURRENCY, BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_INTERVAL, BROADCAST_MAX_RETRIES
+from create_bot import gettext as _
+from metrics import BROADCAST_RECIPIENTS_TOTAL
+
+
+class TokenBucket:
+    """Класс ограничителя скорости "корзина токенов", один токен - один запрос к Telegram."""
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        """
+        init метод.
+
+        Args:
+            rate: скорость пополнения, токенов в секунду
+            capacity: максимальное количество накопленных токенов, по умолчанию равно rate
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Ждёт, пока в корзине появится токен, и забирает его, ожидающие обслуживаются по очереди.
+
+        Returns:
+            None
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Приостанавливает выдачу токенов, используется после ответа Telegram 429 RetryAfter.
+
+        Args:
+            seconds: длительность паузы в секундах
+
+        Returns:
+            None
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class BroadcastReport:
+    """Класс результата рассылки."""
+
+    def __init__(self, results: list, messages_count: int, elapsed: float) -> None:
+        """
+        init метод.
+
+        Args:
+            results: результаты в порядке получателей, кортежи вида (успех, строка_отчёта, текст_ошибки)
+            messages_count: количество успешно отправленных сообщений (текст, стикеры и файлы)
+            elapsed: длительность рассылки в секундах
+        """
+        self.results = results
+        self.messages_count = messages_count
+        self.elapsed = elapsed
+
+    @property
+    def success_log(self) -> list:
+        """
+        Строки отчёта об успешных отправках.
+
+        Returns:
+            list: список строк
+        """
+        return [message for success, message, error in self.results if success]
+
+    @property
+    def errors_log(self) -> list:
+        """
+        Строки отчёта об ошибках.
+
+        Returns:
+            list: список строк
+        """
+        return [message for success, message, error in self.results if not success]
+
+    @property
+    def throughput(self) -> float:
+        """
+        Скорость рассылки.
+
+        Returns:
+            float: сообщений в секунду
+        """
+        return self.messages_count / self.elapsed if self.elapsed > 0 else float(self.messages_count)
+
+
+class BroadcastSession:
+    """Класс отправки запросов одной рассылки через общий ограничитель скорости."""
+
+    def __init__(self, broadcaster: 'Broadcaster') -> None:
+        """
+        init метод.
+
+        Args:
+            broadcaster: движок рассылок
+        """
+        self._broadcaster = broadcaster
+        # {chat_id: время, раньше которого в чат нельзя отправлять}
+        self._chats_next_send = {}
+        self.messages_count = 0
+
+    async def call(self, chat_id: int, method: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """
+        Выполняет запрос к Telegram с соблюдением общего лимита, лимита на чат и повтором после RetryAfter.
+
+        Args:
+            chat_id: id чата получателя
+            method: метод бота, например bot.send_message
+            *args: аргументы метода
+            **kwargs: именованные аргументы метода
+
+        Returns:
+            Any: ответ метода
+        """
+        broadcaster = self._broadcaster
+        retries = 0
+        while True:
+            delay = self._chats_next_send.get(chat_id, 0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await broadcaster.bucket.acquire()
+            self._chats_next_send[chat_id] = time.monotonic() + broadcaster.per_chat_interval
+            try:
+                response = await method(*args, **kwargs)
+            except RetryAfter as e:
+                retries += 1
+                broadcaster.bucket.pause(e.timeout)
+                if retries > broadcaster.max_retries: raise
+                continue
+            self.messages_count += 1
+            return response
+
+
+class Broadcaster:
+    """Класс движка рассылок, ограничитель скорости общий для всех рассылок процесса."""
+
+    def __init__(self,
+                 concurrency: int = BROADCAST_CONCURRENCY,
+                 global_rate: float = BROADCAST_GLOBAL_RATE,
+                 per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+                 max_retries: int = BROADCAST_MAX_RETRIES) -> None:
+        """
+        init метод.
+
+        Args:
+            concurrency: количество одновременно обслуживаемых получателей
+            global_rate: максимум запросов к Telegram в секунду для всех рассылок
+            per_chat_interval: минимальный интервал между сообщениями в один чат в секундах
+            max_retries: максимум повторов одного запроса после RetryAfter
+        """
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(global_rate)
+
+    async def run(self,
+                  telegram_ids: list,
+                  deliver: Callable[[BroadcastSession, int], Awaitable],
+                  on_error: Callable[[Union[int, str], Exception], None] = None) -> BroadcastReport:
+        """
+        Выполняет рассылку.
+
+        Args:
+            telegram_ids: список telegram id
+            deliver: корутина отправки одному получателю, все запросы должна выполнять через session.call
+            on_error: функция, вызываемая при ошибке отправки получателю
+
+        Returns:
+            BroadcastReport: результат рассылки
+        """
+        session = BroadcastSession(self)
+        results: list = [None] * len(telegram_ids)
+        queue = iter(enumerate(telegram_ids))
+
+        async def worker() -> None:
+            for index, telegram_id in queue:
+                if not (type(telegram_id) == int or (type(telegram_id) == str and telegram_id.isdigit())):
+                    results[index] = (False, _('"%s" - не является id') % telegram_id, 'not telegram id')
+                    continue
+                try:
+                    await deliver(session, int(telegram_id))
+                    results[index] = (True, _('"%s" - Успех') % telegram_id, None)
+                except Exception as e:
+                    if on_error: on_error(telegram_id, e)
+                    results[index] = (False, _('telegram_id: "%s" - Ошибка: "%s"') % (telegram_id, e), str(e))
+
+        started = time.monotonic()
+        await asyncio.gather(*[worker() for x in range(min(self.concurrency, len(telegram_ids)))])
+        elapsed = time.monotonic() - started
+
+        success_count = sum(1 for x in results if x[0])
+        BROADCAST_RECIPIENTS_TOTAL.inc('success', amount=success_count)
+        BROADCAST_RECIPIENTS_TOTAL.inc('error', amount=len(results) - success_count)
+
+        return BroadcastReport(results, session.messages_count, elapsed)
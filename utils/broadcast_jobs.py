@@ -0,0 +1,475 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Сохраняемые в MYSQL задания рассылки, выполняемые фоновым обработчиком и продолжаемые после перезапуска."""
+import asyncio
+import json
+from typing import AsyncIterable, Union
+
+from config import BROADCAST_JOBS_CHUNK_SIZE, BROADCAST_JOBS_POLL_INTERVAL
+from create_bot import gettext as _
+from data_base.queries import render_query
+from loggers import errors_logger, messages_logger
+from utils.broadcast import Broadcaster, BroadcastReport
+
+BROADCAST_JOBS_TABLES_SQL = [
+    "CREATE TABLE IF NOT EXISTS broadcast_job (id BIGINT NOT NULL AUTO_INCREMENT, status VARCHAR(32) NOT NULL "
+    "DEFAULT 'pending', message_text TEXT NOT NULL, parse_mode VARCHAR(32), sticker_id VARCHAR(256), files TEXT, "
+    'reply_markup TEXT, deny_none BOOLEAN NOT NULL DEFAULT TRUE, report_chat_id VARCHAR(256), report_log BOOLEAN '
+    'NOT NULL DEFAULT FALSE, recipients_count BIGINT NOT NULL DEFAULT 0, cursor_position BIGINT NOT NULL DEFAULT 0, '
+    'success_count BIGINT NOT NULL DEFAULT 0, errors_count BIGINT NOT NULL DEFAULT 0, messages_count BIGINT NOT '
+    'NULL DEFAULT 0, created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, started_at DATETIME, finished_at '
+    'DATETIME, PRIMARY KEY (id), UNIQUE(id))',
+
+    'CREATE TABLE IF NOT EXISTS broadcast_job_recipient (id BIGINT NOT NULL AUTO_INCREMENT, job_id BIGINT NOT NULL, '
+    "position BIGINT NOT NULL, telegram_id VARCHAR(256) NOT NULL, status VARCHAR(32) NOT NULL DEFAULT 'pending', "
+    'error TEXT, PRIMARY KEY (id), UNIQUE(id), FOREIGN KEY (job_id) REFERENCES broadcast_job (id) ON DELETE CASCADE, '
+    'CONSTRAINT u_job_id_position UNIQUE(job_id, position))',
+]
+
+# Получатели ещё записываются, фоновый обработчик такое задание не берёт
+JOB_PREPARING = 'preparing'
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_CANCELED = 'canceled'
+
+RECIPIENT_PENDING = 'pending'
+RECIPIENT_SUCCESS = 'success'
+RECIPIENT_ERROR = 'error'
+
+# Максимум строк в одном INSERT при создании задания
+_INSERT_ROWS_LIMIT = 1000
+# Через сколько минут недозаписанное задание считается брошенным и удаляется при запуске обработчика
+_PREPARING_JOB_TTL = 60
+
+
+def is_persistable_files(files: Union[dict, None]) -> bool:
+    """
+    Проверяет, можно ли сохранить файлы в задании рассылки: задание хранит только file_id и ссылки.
+
+    Args:
+        files: словарь вида {'photo': файл_или_список, 'video': ..., 'doc': ...}
+
+    Returns:
+        bool: True - файлов нет или все они переданы строками
+    """
+    if not files: return True
+    return all(type(x) == str for value in files.values()
+               for x in (value if isinstance(value, (list, tuple)) else [value]))
+
+
+def _dump_reply_markup(reply_markup) -> Union[str, None]:
+    """
+    Приводит клавиатуру к JSON для сохранения в задании.
+
+    Args:
+        reply_markup: клавиатура aiogram или словарь
+
+    Returns:
+        str: клавиатура в JSON
+        None: клавиатуры нет
+    """
+    if reply_markup is None: return None
+    return json.dumps(reply_markup.to_python() if hasattr(reply_markup, 'to_python') else reply_markup)
+
+
+class BroadcastJobsWorker:
+    """
+    Класс фонового обработчика заданий рассылки.
+
+    Получатели обрабатываются частями, после каждой части в базу данных записываются статусы получателей и курсор
+    задания, поэтому после перезапуска повторно могут получить сообщение только получатели последней незаписанной части.
+    """
+
+    def __init__(self,
+                 broadcaster: Broadcaster,
+                 chunk_size: int = BROADCAST_JOBS_CHUNK_SIZE,
+                 poll_interval: float = BROADCAST_JOBS_POLL_INTERVAL) -> None:
+        """
+        init метод.
+
+        Args:
+            broadcaster: движок рассылок
+            chunk_size: количество получателей в одной части
+            poll_interval: интервал проверки новых заданий в секундах
+        """
+        self._broadcaster = broadcaster
+        self._chunk_size = chunk_size
+        self._poll_interval = poll_interval
+        self._task: Union[asyncio.Task, None] = None
+        self._wakeup: Union[asyncio.Event, None] = None
+
+    async def ensure_tables(self) -> None:
+        """
+        Создаёт таблицы заданий, если бот был установлен до их появления.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        for sql_request in BROADCAST_JOBS_TABLES_SQL:
+            await db.sql(sql_request)
+
+    async def create_job(self,
+                         telegram_ids: Union[list, AsyncIterable[list]],
+                         message_text: str,
+                         sticker_id: str = None,
+                         parse_mode: str = 'HTML',
+                         files: dict = None,
+                         deny_none: bool = True,
+                         reply_markup=None,
+                         report_chat_id: Union[int, str, None] = None,
+                         report_log: bool = False) -> int:
+        """
+        Сохраняет задание рассылки и сразу возвращает его id, задание выполнит фоновый обработчик.
+
+        Получателей можно передать частями, например из db.iter_telegram_ids_by_institution, тогда весь список
+        получателей в памяти не хранится: задание создаётся в статусе preparing, получатели записываются по мере
+        чтения, и только после записи всех получателей задание становится доступно фоновому обработчику.
+
+        Args:
+            telegram_ids: список telegram id или асинхронный итератор частей списка
+            message_text: текст сообщения
+            sticker_id: id стикера
+            parse_mode: режим парсинга сообщения
+            files: словарь вида {'photo': file_id_или_список, 'video': ..., 'doc': ...}
+            deny_none: запретить слово "None"
+            reply_markup: клавиатура aiogram или словарь
+            report_chat_id: чат, в который после завершения задания будет отправлен отчёт, None - не отправлять
+            report_log: True - отчёт со списками успешных отправок и ошибок, False - только количество
+
+        Returns:
+            int: id задания
+
+        Raises:
+            ValueError: в files передан не file_id
+        """
+        from create_custom_objects import db
+
+        if not is_persistable_files(files):
+            raise ValueError(_('Задание рассылки может хранить только file_id файлов'))
+
+        if isinstance(telegram_ids, list):
+            return await self._create_job_from_list(telegram_ids, message_text, sticker_id, parse_mode, files,
+                                                    deny_none, reply_markup, report_chat_id, report_log)
+
+        response = await db.sql_transaction([
+            (render_query('broadcast_job.insert_preparing'),
+             (JOB_PREPARING, message_text, parse_mode, sticker_id, json.dumps(files) if files else None,
+              _dump_reply_markup(reply_markup), deny_none, report_chat_id, report_log)),
+            render_query('broadcast_job.select_last_insert_id'),
+        ])
+        job_id = int(response[0]['id'])
+
+        recipients_count = 0
+        try:
+            async for chunk in telegram_ids:
+                for start in range(0, len(chunk), _INSERT_ROWS_LIMIT):
+                    rows = chunk[start:start + _INSERT_ROWS_LIMIT]
+                    params = []
+                    for position, telegram_id in enumerate(rows, start=recipients_count):
+                        params.extend((job_id, position, str(telegram_id)))
+                    await db.query('broadcast_job_recipient.insert_many', params, len(rows))
+                    recipients_count += len(rows)
+        except Exception:
+            await db.query('broadcast_job.delete', (job_id,))
+            raise
+
+        await db.query('broadcast_job.update_prepared', (JOB_PENDING, recipients_count, job_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def _create_job_from_list(self,
+                                    telegram_ids: list,
+                                    message_text: str,
+                                    sticker_id: str,
+                                    parse_mode: str,
+                                    files: Union[dict, None],
+                                    deny_none: bool,
+                                    reply_markup,
+                                    report_chat_id: Union[int, str, None],
+                                    report_log: bool) -> int:
+        """
+        Сохраняет задание рассылки с получателями из списка одной транзакцией.
+
+        Args:
+            telegram_ids: список telegram id
+            message_text: текст сообщения
+            sticker_id: id стикера
+            parse_mode: режим парсинга сообщения
+            files: словарь вида {'photo': file_id_или_список, 'video': ..., 'doc': ...}
+            deny_none: запретить слово "None"
+            reply_markup: клавиатура aiogram или словарь
+            report_chat_id: чат, в который после завершения задания будет отправлен отчёт, None - не отправлять
+            report_log: True - отчёт со списками успешных отправок и ошибок, False - только количество
+
+        Returns:
+            int: id задания
+        """
+        from create_custom_objects import db
+
+        sql_requests = [
+            (render_query('broadcast_job.insert'),
+             (message_text, parse_mode, sticker_id, json.dumps(files) if files else None,
+              _dump_reply_markup(reply_markup), deny_none, report_chat_id, report_log, len(telegram_ids))),
+            render_query('broadcast_job.set_last_insert_id'),
+        ]
+        for start in range(0, len(telegram_ids), _INSERT_ROWS_LIMIT):
+            chunk = telegram_ids[start:start + _INSERT_ROWS_LIMIT]
+            params = []
+            for position, telegram_id in enumerate(chunk, start=start):
+                params.extend((position, str(telegram_id)))
+            sql_requests.append((render_query('broadcast_job_recipient.insert_many_for_inserted_job', len(chunk)),
+                                 params))
+        sql_requests.append(render_query('broadcast_job.select_inserted_id'))
+
+        response = await db.sql_transaction(sql_requests)
+        job_id = int(response[0]['id'])
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get_job_progress(self, job_id: int) -> Union[dict, None]:
+        """
+        Получает прогресс задания рассылки.
+
+        Args:
+            job_id: id задания
+
+        Returns:
+            dict: словарь с полями status, recipients_count, processed_count, success_count, errors_count, percent
+            None: задание не найдено
+        """
+        from create_custom_objects import db
+
+        response = await db.query('broadcast_job.select_progress', (job_id,))
+        if not response: return None
+
+        job = response[0]
+        return {
+            'status': job['status'],
+            'recipients_count': job['recipients_count'],
+            'processed_count': job['cursor_position'],
+            'success_count': job['success_count'],
+            'errors_count': job['errors_count'],
+            'percent': round(job['cursor_position'] * 100 / job['recipients_count'], 1)
+            if job['recipients_count'] else 100.0,
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+        }
+
+    async def get_job_report(self, job_id: int) -> Union[BroadcastReport, None]:
+        """
+        Собирает результат задания рассылки в том же виде, что и у рассылки через Broadcaster.
+
+        Args:
+            job_id: id задания
+
+        Returns:
+            BroadcastReport: результат по уже обработанным получателям
+            None: задание не найдено
+        """
+        from create_custom_objects import db
+
+        job = await db.query('broadcast_job.select_report', (job_id,))
+        if not job: return None
+
+        recipients = await db.query('broadcast_job_recipient.select_processed', (job_id, RECIPIENT_PENDING))
+        results = []
+        for recipient in recipients:
+            telegram_id, error = recipient['telegram_id'], recipient['error']
+            if recipient['status'] == RECIPIENT_SUCCESS:
+                results.append((True, _('"%s" - Успех') % telegram_id, None))
+            elif error == 'not telegram id':
+                results.append((False, _('"%s" - не является id') % telegram_id, error))
+            else:
+                results.append((False, _('telegram_id: "%s" - Ошибка: "%s"') % (telegram_id, error), error))
+
+        job = job[0]
+        # Время ожидания в очереди в скорость рассылки не входит
+        elapsed = (job['finished_at'] - job['started_at']).total_seconds() \
+            if job['started_at'] and job['finished_at'] else 0.0
+        return BroadcastReport(results, job['messages_count'], elapsed)
+
+    async def cancel_job(self, job_id: int) -> None:
+        """
+        Отменяет задание рассылки, уже начатая часть будет дослана.
+
+        Args:
+            job_id: id задания
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        await db.query('broadcast_job.update_canceled', (JOB_CANCELED, job_id, JOB_PENDING, JOB_RUNNING))
+
+    def start(self) -> None:
+        """
+        Запускает фоновый обработчик.
+
+        Returns:
+            None
+        """
+        if self._task is not None: return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновый обработчик, незавершённые задания продолжатся после следующего запуска.
+
+        Returns:
+            None
+        """
+        if self._task is None: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        """
+        Цикл фонового обработчика: берёт самое старое незавершённое задание и выполняет его.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db, install_state
+
+        # До установки бота таблиц ещё нет
+        while not await install_state.check():
+            await asyncio.sleep(self._poll_interval)
+
+        await self.ensure_tables()
+        # Задания, создание которых прервалось вместе с процессом
+        await db.query('broadcast_job.delete_stale', (JOB_PREPARING, _PREPARING_JOB_TTL))
+        while True:
+            try:
+                response = await db.query('broadcast_job.select_next', (JOB_RUNNING, JOB_PENDING))
+                if response:
+                    await self._process_job(response[0])
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                errors_logger.exception('Ошибка фонового обработчика заданий рассылки')
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process_job(self, job: dict) -> None:
+        """
+        Выполняет задание рассылки начиная с сохранённого курсора.
+
+        Args:
+            job: строка таблицы broadcast_job
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db, mm
+
+        job_id = job['id']
+        if job['status'] == JOB_PENDING:
+            messages_logger.info('Задание рассылки: id: "%s" | получателей: "%s" | text: "%s"',
+                                 job_id, job['recipients_count'], job['message_text'])
+        await db.query('broadcast_job.update_started', (JOB_RUNNING, job_id))
+
+        messages_array = await mm.render_message_parts(job['message_text'], bool(job['deny_none']))
+        deliver = await mm.make_broadcast_deliver(messages_array,
+                                                  job['parse_mode'],
+                                                  job['sticker_id'],
+                                                  json.loads(job['files']) if job['files'] else None,
+                                                  json.loads(job['reply_markup']) if job['reply_markup'] else None)
+        cursor_position = job['cursor_position']
+
+        while True:
+            status = await db.query('broadcast_job.select_status', (job_id,))
+            if not status or status[0]['status'] != JOB_RUNNING: return
+
+            recipients = await db.query('broadcast_job_recipient.select_pending',
+                                        (job_id, cursor_position, RECIPIENT_PENDING, self._chunk_size))
+            if not recipients:
+                await db.query('broadcast_job.update_finished', (JOB_DONE, job_id))
+                messages_logger.info('Задание рассылки завершено: id: "%s"', job_id)
+                if job['report_chat_id']:
+                    await self._send_report(job)
+                return
+
+            report = await self._broadcaster.run([x['telegram_id'] for x in recipients], deliver, self._on_error)
+
+            success_positions = [x['position'] for x, result in zip(recipients, report.results) if result[0]]
+            sql_requests = []
+            if success_positions:
+                sql_requests.append((
+                    render_query('broadcast_job_recipient.update_status_many', len(success_positions)),
+                    [RECIPIENT_SUCCESS, job_id, *success_positions]
+                ))
+            for recipient, (success, message, error) in zip(recipients, report.results):
+                if success: continue
+                sql_requests.append((
+                    render_query('broadcast_job_recipient.update_error'),
+                    (RECIPIENT_ERROR, error, job_id, recipient['position'])
+                ))
+            cursor_position = recipients[-1]['position'] + 1
+            sql_requests.append((
+                render_query('broadcast_job.update_progress'),
+                (cursor_position, len(success_positions), len(recipients) - len(success_positions),
+                 report.messages_count, job_id)
+            ))
+            await db.sql_transaction(sql_requests)
+
+    async def _send_report(self, job: dict) -> None:
+        """
+        Отправляет отчёт о завершённом задании в чат, указанный при создании задания.
+
+        Args:
+            job: строка таблицы broadcast_job
+
+        Returns:
+            None
+        """
+        from create_custom_objects import mm
+
+        report = await self.get_job_report(job['id'])
+        if report is None: return
+        messages_logger.info('Рассылка: получателей: "%s" | скорость: "%.1f" сообщ./сек. | задание: "%s"',
+                             job['recipients_count'], report.throughput, job['id'])
+        try:
+            await mm.send_message(mm.render_broadcast_report(report, job['recipients_count'], bool(job['report_log'])),
+                                  chat_id=int(job['report_chat_id']), parse_mode=None, deny_none=False)
+        except Exception:
+            errors_logger.exception('Не удалось отправить отчёт о задании рассылки: id: "%s"', job['id'])
+
+    @staticmethod
+    def _on_error(telegram_id: Union[int, str], error: Exception) -> None:
+        """
+        Пишет в лог ошибку отправки получателю.
+
+        Args:
+            telegram_id: telegram id получателя
+            error: ошибка
+
+        Returns:
+            None
+        """
+        errors_logger.error('Задание рассылки: ошибка при отправке сообщения: telegram_id: "%s" | ошибка: "%s"',
+                            telegram_id, error)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Сброс кэшей во всех процессах-обработчиках через версии в таблице cache_version."""
+import asyncio
+from typing import Callable, Union
+
+from config import SHARDING_CACHE_SYNC_INTERVAL
+from loggers import errors_logger
+
+CACHE_VERSIONS_TABLES_SQL = [
+    'CREATE TABLE IF NOT EXISTS cache_version (name VARCHAR(64) NOT NULL, version BIGINT NOT NULL DEFAULT 0, '
+    'PRIMARY KEY (name))',
+]
+
+# Имена кэшей
+CACHE_PERMS = 'perms'
+CACHE_SETTINGS = 'settings'
+CACHE_SCHEDULE = 'schedule'
+CACHE_SCHEDULE_MESSAGES = 'schedule_messages'
+CACHE_WEEK_TYPES = 'week_types'
+
+
+class CacheVersions:
+    """
+    Класс сброса кэшей процесса по изменению версий в базе данных.
+
+    publish сбрасывает кэш в своём процессе и, если запущена синхронизация, увеличивает версию кэша в таблице
+    cache_version. Остальные процессы-обработчики раз в poll_interval секунд читают версии и сбрасывают кэши,
+    версия которых изменилась, поэтому кэш в другом процессе устаревает не дольше чем на poll_interval секунд.
+    Без шардирования процесс один и синхронизация не запускается.
+    """
+
+    def __init__(self, poll_interval: float = SHARDING_CACHE_SYNC_INTERVAL) -> None:
+        """
+        init метод.
+
+        Args:
+            poll_interval: интервал чтения версий в секундах
+        """
+        self._poll_interval = poll_interval
+        # {имя_кэша: [функции сброса]}
+        self._callbacks = {}
+        # {имя_кэша: последняя прочитанная версия}
+        self._versions = {}
+        self._task: Union[asyncio.Task, None] = None
+
+    def register(self, name: str, invalidate: Callable[[], None]) -> None:
+        """
+        Регистрирует функцию сброса кэша.
+
+        Args:
+            name: имя кэша
+            invalidate: функция сброса
+
+        Returns:
+            None
+        """
+        self._callbacks.setdefault(name, []).append(invalidate)
+
+    def _invalidate(self, name: str) -> None:
+        """
+        Сбрасывает кэш в текущем процессе.
+
+        Args:
+            name: имя кэша
+
+        Returns:
+            None
+        """
+        for invalidate in self._callbacks.get(name, []):
+            invalidate()
+
+    async def publish(self, name: str) -> None:
+        """
+        Сбрасывает кэш в текущем процессе и сообщает об этом остальным процессам-обработчикам.
+
+        Args:
+            name: имя кэша
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        self._invalidate(name)
+        if self._task is None: return
+        try:
+            await db.query('cache_version.bump', (name,))
+        except Exception:
+            errors_logger.exception('Не удалось увеличить версию кэша "%s"', name)
+
+    async def ensure_tables(self) -> None:
+        """
+        Создаёт таблицу версий, если бот был установлен до её появления.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        for sql_request in CACHE_VERSIONS_TABLES_SQL:
+            await db.sql(sql_request)
+
+    async def _read_versions(self) -> dict:
+        """
+        Читает версии кэшей.
+
+        Returns:
+            dict: словарь вида {имя_кэша: версия}
+        """
+        from create_custom_objects import db
+
+        return {x['name']: x['version'] for x in await db.query('cache_version.select_all')}
+
+    async def _run(self) -> None:
+        """
+        Цикл синхронизации: читает версии и сбрасывает кэши, версия которых изменилась.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import install_state
+
+        # До установки бота таблиц ещё нет
+        while not await install_state.check():
+            await asyncio.sleep(self._poll_interval)
+
+        await self.ensure_tables()
+        self._versions = await self._read_versions()
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                versions = await self._read_versions()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                errors_logger.exception('Ошибка чтения версий кэшей')
+                continue
+            for name, version in versions.items():
+                if self._versions.get(name) != version:
+                    self._invalidate(name)
+            self._versions = versions
+
+    def start(self) -> None:
+        """
+        Запускает синхронизацию, нужна только процессам-обработчикам при шардировании.
+
+        Returns:
+            None
+        """
+        if self._poll_interval <= 0 or self._task is not None: return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает синхронизацию.
+
+        Returns:
+            None
+        """
+        if self._task is None: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -9,13 +9,15 @@
 # ======================================================================================================================
 
 """Функции для работы с датой и временем."""
-from datetime import datetime
+import asyncio
+import time
+from datetime import datetime, date, timedelta
 from typing import Union
 
 from pytz import timezone
 
-from config import TIMEZONE
-from utils import is_empty
+from config import TIMEZONE, WEEK_TYPES_CACHE_TTL
+from loggers import errors_logger
 
 
 async def get_current_time() -> datetime.now:
@@ -38,27 +40,203 @@ async def get_current_day_number() -> int:
     return datetime.now(timezone(TIMEZONE)).isoweekday()
 
 
-async def get_week_type(institution_id: int) -> Union[bool, None]:
+class WeekTypesCache:
+    """
+    Класс кэша типов недели учебных заведений.
+
+    Таблица institution загружается в память целиком и перечитывается раз в ttl секунд или после invalidate.
+    Типы недели на текущий день считаются один раз по местному времени TIMEZONE и пересчитываются в местную полночь.
+    """
+
+    def __init__(self, ttl: float = WEEK_TYPES_CACHE_TTL) -> None:
+        """
+        init метод.
+
+        Args:
+            ttl: время в секундах, через которое таблица institution будет перечитана
+        """
+        self._ttl = ttl
+        # {id_учебного_заведения: invert_week_type}
+        self._invert_week_types: Union[dict, None] = None
+        self._expires_at = 0.0
+        self._version = 0
+        self._lock = asyncio.Lock()
+        # {id_учебного_заведения: тип_недели} на день self._day
+        self._week_types = {}
+        self._day: Union[date, None] = None
+        self._rollover_task: Union[asyncio.Task, None] = None
+
+    def invalidate(self) -> None:
+        """
+        Сбрасывает кэш, вызывается после изменения таблицы institution.
+
+        Returns:
+            None
+        """
+        self._version += 1
+        self._invert_week_types = None
+        self._day = None
+
+    @staticmethod
+    def compute(invert_week_type: bool, day: Union[datetime, date]) -> bool:
+        """
+        Вычисляет тип недели по номеру недели ISO.
+
+        Args:
+            invert_week_type: инвертировать тип недели учебного заведения
+            day: дата
+
+        Returns:
+            bool: True - числитель, False - знаменатель
+        """
+        is_even = int(day.strftime("%V")) % 2 == 0
+        return not is_even if invert_week_type else is_even
+
+    async def _get_invert_week_types(self) -> dict:
+        """
+        Возвращает закэшированную таблицу institution, при необходимости загружает её.
+
+        Returns:
+            dict: словарь вида {id_учебного_заведения: invert_week_type}
+        """
+        if self._invert_week_types is not None and time.monotonic() < self._expires_at:
+            return self._invert_week_types
+
+        from create_custom_objects import db
+
+        async with self._lock:
+            if self._invert_week_types is not None and time.monotonic() < self._expires_at:
+                return self._invert_week_types
+
+            version = self._version
+            response = await db.query('institution.select_invert_week_types')
+            invert_week_types = {int(x['id']): bool(x['invert_week_type']) for x in response}
+            # Если во время загрузки таблица была изменена - не кэшируем устаревшие данные
+            if version == self._version:
+                self._invert_week_types = invert_week_types
+                self._expires_at = time.monotonic() + self._ttl
+                self._day = None
+            return invert_week_types
+
+    async def _get_all(self, day: Union[datetime, date, None] = None) -> dict:
+        """
+        Получает типы недели всех учебных заведений без копирования, словарь за текущий день общий для всех вызовов.
+
+        Args:
+            day: дата, по умолчанию текущая по местному времени
+
+        Returns:
+            dict: словарь вида {id_учебного_заведения: тип_недели}, изменять его нельзя
+        """
+        invert_week_types = await self._get_invert_week_types()
+        today = (await get_current_time()).date()
+        if day is not None and (day.date() if isinstance(day, datetime) else day) != today:
+            return {x: self.compute(invert, day) for x, invert in invert_week_types.items()}
+
+        if self._day != today:
+            self._week_types = {x: self.compute(invert, today) for x, invert in invert_week_types.items()}
+            self._day = today
+        return self._week_types
+
+    async def get_all(self, day: Union[datetime, date, None] = None) -> dict:
+        """
+        Получает типы недели всех учебных заведений.
+
+        Args:
+            day: дата, по умолчанию текущая по местному времени
+
+        Returns:
+            dict: копия словаря вида {id_учебного_заведения: тип_недели}
+        """
+        return dict(await self._get_all(day))
+
+    async def get(self, institution_id: int, day: Union[datetime, date, None] = None) -> Union[bool, None]:
+        """
+        Получает тип недели учебного заведения.
+
+        Args:
+            institution_id: id учебного заведения
+            day: дата, по умолчанию текущая по местному времени
+
+        Returns:
+            bool: True - числитель, False - знаменатель
+            None: не найдено учебное заведение с таким id
+        """
+        return (await self._get_all(day)).get(int(institution_id))
+
+    async def _rollover(self) -> None:
+        """
+        Пересчитывает типы недели в местную полночь.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import install_state
+
+        while True:
+            now = await get_current_time()
+            midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+            next_day = timezone(TIMEZONE).localize(midnight)
+            await asyncio.sleep((next_day - now).total_seconds())
+            if not await install_state.check(): continue
+            try:
+                await self._get_all()
+            except Exception:
+                errors_logger.exception('Ошибка пересчёта типов недели')
+
+    def start_rollover(self) -> None:
+        """
+        Запускает пересчёт типов недели в местную полночь.
+
+        Returns:
+            None
+        """
+        if self._rollover_task is not None: return
+        self._rollover_task = asyncio.create_task(self._rollover())
+
+    async def stop_rollover(self) -> None:
+        """
+        Останавливает пересчёт типов недели.
+
+        Returns:
+            None
+        """
+        if self._rollover_task is None: return
+        self._rollover_task.cancel()
+        try:
+            await self._rollover_task
+        except asyncio.CancelledError:
+            pass
+        self._rollover_task = None
+
+
+async def get_week_type(institution_id: int, date: Union[datetime, None] = None) -> Union[bool, None]:
     """
     Получает тип недели.
 
     Args:
         institution_id: id учебного заведения
+        date: дата, для которой нужен тип недели, по умолчанию текущая по местному времени
 
     Returns:
         bool: True - числитель, False - знаменатель
         None: не найдено учебное заведение с таким id
     """
-    from create_custom_objects import db
-
-    cur_week_num = int(datetime.now().strftime("%V"))
-    response = await db.sql(f"SELECT `invert_week_type` FROM `institution` WHERE `id` = '{institution_id}'")
-    if await is_empty(response): return None
-
-    if response[0]['invert_week_type']:
-        if cur_week_num % 2 == 0:
-            return False
-        return True
-    if cur_week_num % 2 == 0:
-        return True
-    return False
+    from create_custom_objects import week_types
+
+    return await week_types.get(institution_id, date)
+
+
+async def get_week_types(date: Union[datetime, None] = None) -> dict:
+    """
+    Получает типы недели всех учебных заведений.
+
+    Args:
+        date: дата, для которой нужны типы недели, по умолчанию текущая по местному времени
+
+    Returns:
+        dict: словарь вида {id_учебного_заведения: тип_недели}
+    """
+    from create_custom_objects import week_types
+
+    return await week_types.get_all(date)
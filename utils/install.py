@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Состояние установки бота."""
+import asyncio
+import os
+from typing import Union
+
+
+class InstallState:
+    """
+    Класс состояния установки, хранит в памяти наличие служебного файла bot_installed.txt.
+
+    Установку может выполнить другой процесс-обработчик, поэтому пока бот не установлен, check перепроверяет файл
+    при каждом обращении. После установки проверка выполняется только в памяти.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        init метод.
+
+        Args:
+            path: путь к служебному файлу установки
+        """
+        self.path = path
+        self.is_installed = os.path.exists(path)
+        self._recheck_task: Union[asyncio.Task, None] = None
+
+    async def mark_installed(self, text: str) -> None:
+        """
+        Создаёт служебный файл и отмечает бота установленным.
+
+        Args:
+            text: текст служебного файла
+
+        Returns:
+            None
+        """
+
+        def write() -> None:
+            with open(self.path, 'w', encoding='utf-8') as file:
+                file.write(text)
+
+        await asyncio.get_running_loop().run_in_executor(None, write)
+        self.is_installed = True
+
+    async def check(self) -> bool:
+        """
+        Проверяет, установлен ли бот, если в памяти бот ещё не установлен - перепроверяет служебный файл.
+
+        Returns:
+            bool: True - бот установлен, False - нет
+        """
+        return self.is_installed or await self.refresh()
+
+    async def refresh(self) -> bool:
+        """
+        Перепроверяет наличие служебного файла вне event loop.
+
+        Returns:
+            bool: True - бот установлен, False - нет
+        """
+        self.is_installed = await asyncio.get_running_loop().run_in_executor(None, os.path.exists, self.path)
+        return self.is_installed
+
+    async def _recheck(self, interval: float) -> None:
+        """
+        Периодически перепроверяет наличие служебного файла.
+
+        Args:
+            interval: интервал в секундах
+
+        Returns:
+            None
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
+
+    def start_recheck(self, interval: float) -> None:
+        """
+        Запускает фоновую перепроверку, нужна если служебный файл могут удалить вручную.
+
+        Args:
+            interval: интервал в секундах, 0 - перепроверка отключена
+
+        Returns:
+            None
+        """
+        if interval <= 0 or self._recheck_task is not None: return
+        self._recheck_task = asyncio.create_task(self._recheck(interval))
+
+    async def stop_recheck(self) -> None:
+        """
+        Останавливает фоновую перепроверку.
+
+        Returns:
+            None
+        """
+        if self._recheck_task is None: return
+        self._recheck_task.cancel()
+        try:
+            await self._recheck_task
+        except asyncio.CancelledError:
+            pass
+        self._recheck_task = None
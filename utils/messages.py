@@ -9,19 +9,87 @@
 # ======================================================================================================================
 
 """Модуль для работы с сообщениями."""
-from typing import Union
+import time
+from typing import Union, Callable, Awaitable
 
+from aiogram.dispatcher.handler import current_handler
 from aiogram.types import Message, CallbackQuery
 
+from audit import audit_log, get_handler_name, DIRECTION_OUT
+
 from config import OWNER_ID, STICKERS, ADMIN_GROUP_ID, SUPPORT_GROUP_ID, API_TOKEN, LINE_BREAK_SYMBOL, MAX_MESSAGE_LEN
 from create_bot import bot, gettext as _
 from loggers import errors_logger, warnings_logger, messages_logger
+from metrics import MESSAGES_SENT_TOTAL
+from utils.attachments import BroadcastAttachments
+from utils.broadcast import BroadcastSession, BroadcastReport
+from utils.broadcast_jobs import is_persistable_files
 from utils.functions import is_empty
 
 
 class MessagesManager:
     """Класс для работы с сообщениями."""
 
+    @staticmethod
+    def _record_outgoing(telegram_id: Union[int, None],
+                         chat_id: Union[int, None],
+                         messages_array: list,
+                         started_at: float,
+                         source: str = 'reply') -> None:
+        """
+        Записывает отправленное сообщение в журнал сообщений и в метрики.
+
+        Args:
+            telegram_id: telegram id получателя
+            chat_id: id чата
+            messages_array: отправленные части сообщения
+            started_at: время начала отправки по time.monotonic()
+            source: reply - ответ из обработчика, broadcast - рассылка
+
+        Returns:
+            None
+        """
+        MESSAGES_SENT_TOTAL.inc(source, amount=len(messages_array))
+        handler = source if source == 'broadcast' else get_handler_name(current_handler.get(None))
+        audit_log.write(DIRECTION_OUT, telegram_id, chat_id, handler, time.monotonic() - started_at,
+                        sum(len(x) for x in messages_array), parts=len(messages_array))
+
+    async def render_message_parts(self,
+                                   message: str,
+                                   deny_none: bool = True,
+                                   ignore_line_break_symbol: bool = False) -> list:
+        """
+        Подготавливает текст к отправке: скрывает токен, добавляет префикс и делит на части по MAX_MESSAGE_LEN.
+
+        Args:
+            message: текст сообщения
+            deny_none: запретить слово "None"
+            ignore_line_break_symbol: игнорировать символ переноса строки
+
+        Returns:
+            list: список частей сообщения
+        """
+        from create_custom_objects import db
+        if message is None:
+            message = _('Пустое сообщение')
+        if type(message) != str:
+            message = str(message)
+
+        message = message.replace(API_TOKEN, _('[HIDDEN]'))
+        if deny_none: message = message.replace('None', '---')
+
+        ALL_MESSAGES_PREFIX = await db.get_all_messages_prefix()
+        if not ignore_line_break_symbol:
+            message_text = f"{ALL_MESSAGES_PREFIX}{message}".replace(LINE_BREAK_SYMBOL, "\n")
+        else:
+            message_text = f"{ALL_MESSAGES_PREFIX}{message}"
+
+        # Разделение сообщений на части по MAX_MESSAGE_LEN символов, и отправка каждой части по отдельности
+        messages_array = []
+        for x in range(0, len(message_text), MAX_MESSAGE_LEN):
+            messages_array.append(message_text[x:x + MAX_MESSAGE_LEN])
+        return messages_array
+
     async def send_message(self,
                            message: str = _('Пустое сообщение'),
                            message_object: Message = None,
@@ -51,25 +119,8 @@ class MessagesManager:
             list: Список ответов полученных при отправке частей сообщения
             bool: False - ошибка при отправке сообщения
         """
-        from create_custom_objects import db
-        if message is None:
-            message = _('Пустое сообщение')
-        if type(message) != str:
-            message = str(message)
-
-        message = message.replace(API_TOKEN, _('[HIDDEN]'))
-        if deny_none: message = message.replace('None', '---')
-
-        ALL_MESSAGES_PREFIX = await db.get_all_messages_prefix()
-        if not ignore_line_break_symbol:
-            message_text = f"{ALL_MESSAGES_PREFIX}{message}".replace(LINE_BREAK_SYMBOL, "\n")
-        else:
-            message_text = f"{ALL_MESSAGES_PREFIX}{message}"
-
-        # Разделение сообщений на части по MAX_MESSAGE_LEN символов, и отправка каждой части по отдельности
-        messages_array = []
-        for x in range(0, len(message), MAX_MESSAGE_LEN):
-            messages_array.append(message_text[x:x + MAX_MESSAGE_LEN])
+        messages_array = await self.render_message_parts(message, deny_none, ignore_line_break_symbol)
+        started_at = time.monotonic()
 
         # Если чат id не указан, но передан объект сообщения или callback
         if chat_id is None and (message_object or callback):
@@ -95,28 +146,25 @@ class MessagesManager:
             try:
                 if sticker_id and message_object:
                     await message_object.answer_sticker(sticker_id)
-                    messages_logger.info(_(
-                        'Ответный стикер: message: True | callback: False | id: "%s"' % str(sticker_id))
-                    )
+                    messages_logger.info('Ответный стикер: message: True | callback: False | id: "%s"', sticker_id)
                 elif sticker_id and callback:
                     await callback.message.answer_sticker(sticker_id)
-                    messages_logger.info(
-                        _('Ответный стикер: message: False | callback: True | id: "%s"' % str(sticker_id)))
+                    messages_logger.info('Ответный стикер: message: False | callback: True | id: "%s"', sticker_id)
                 elif sticker_id and chat_id:
                     await callback.message.answer_sticker(sticker_id)
-                    messages_logger.info(
-                        _(
-                            'Ответный стикер: chat_id: "%s" | message: False | callback: True | id: "%s"' % (
-                                chat_id, str(sticker_id)
-                            )
-                        )
-                    )
+                    messages_logger.info('Ответный стикер: chat_id: "%s" | message: False | callback: True | id: "%s"',
+                                         chat_id, sticker_id)
             except Exception:
-                errors_logger.exception(_('стикер не отправлен, id стикера: "%s' % sticker_id))
+                errors_logger.exception('стикер не отправлен, id стикера: "%s"', sticker_id)
                 await self.send_notify(OWNER_ID,
                                        _('Ошибка при отправке стикера'),
                                        'Error')
-            messages_logger.info(_('Ответное сообщение: text: "%s"' % message))
+            if message_object:
+                self._record_outgoing(message_object.from_user.id if message_object.from_user else None,
+                                      message_object.chat.id, messages_array, started_at)
+            else:
+                self._record_outgoing(callback.from_user.id, callback.message.chat.id, messages_array, started_at)
+            messages_logger.info('Ответное сообщение: text: "%s"', message)
             return messages_responses
         elif chat_id:
             messages_responses = []
@@ -124,12 +172,12 @@ class MessagesManager:
                 from create_bot import bot
                 messages_responses.append(
                     await bot.send_message(chat_id, message_part, reply_markup=reply_markup, parse_mode=parse_mode))
-            messages_logger.info(_('Ответное сообщение: chat_id: "%s" | text: "%s"' % (chat_id, message)))
+            self._record_outgoing(chat_id, chat_id, messages_array, started_at)
+            messages_logger.info('Ответное сообщение: chat_id: "%s" | text: "%s"', chat_id, message)
             return messages_responses
         else:
-            errors_logger.error(
-                _('Ответное сообщение: error: Не передан chat_id, объект message или callback | text: "%s"' % message)
-            )
+            errors_logger.error('Ответное сообщение: error: Не передан chat_id, объект message или callback | '
+                                'text: "%s"', message)
             return False
 
     async def send_message_to_owner(self,
@@ -153,7 +201,7 @@ class MessagesManager:
             if sticker_key in STICKERS.keys():
                 await bot.send_sticker(OWNER_ID, STICKERS[sticker_key])
             else:
-                errors_logger.error(_('Стикера с ключём "%s" не существует!' % sticker_key))
+                errors_logger.error('Стикера с ключём "%s" не существует!', sticker_key)
                 await bot.send_message(OWNER_ID, _('[ERROR] smto -> Стикера с ключём "%s" не найдено!' % sticker_key))
 
     async def send_notify(self,
@@ -192,7 +240,7 @@ class MessagesManager:
         }
 
         if not level in wrappers.keys():
-            warnings_logger.warning(f'Передан не существующий уровень важности сообщения-уведомления: "{level}"')
+            warnings_logger.warning('Передан не существующий уровень важности сообщения-уведомления: "%s"', level)
             level = 'None'
         wrapper = wrappers[level]
 
@@ -210,7 +258,7 @@ class MessagesManager:
                                            parse_mode=parse_mode,
                                            deny_none=deny_none)
         except Exception:
-            errors_logger.exception(_('уведомление не отправлено, текст уведомления: "%s"' % message))
+            errors_logger.exception('уведомление не отправлено, текст уведомления: "%s"', message)
             return False
 
     async def make_spoiler_text(self, text: str) -> str:
@@ -273,6 +321,46 @@ class MessagesManager:
                                        reply_markup=reply_markup,
                                        sticker_id=sticker_id)
 
+    async def make_broadcast_deliver(self,
+                                     messages_array: list,
+                                     parse_mode: str = 'HTML',
+                                     sticker_id: str = None,
+                                     files: dict = None,
+                                     reply_markup=None) -> Callable[[BroadcastSession, int], Awaitable]:
+        """
+        Создаёт корутину отправки рассылки одному получателю для движка рассылок.
+
+        Args:
+            messages_array: части сообщения, полученные из render_message_parts
+            parse_mode: режим парсинга сообщения
+            sticker_id: id стикера
+            files: словарь вида {'photo': файл_или_список, 'video': ..., 'doc': ...}, каждый файл загружается
+                   в Telegram один раз, остальные получатели получают его по file_id
+            reply_markup: Клавиатура
+
+        Returns:
+            Callable: корутина вида deliver(session, telegram_id)
+        """
+        from create_custom_objects import file_ids_cache
+
+        attachments = None
+        if files:
+            attachments = BroadcastAttachments(files, file_ids_cache)
+            await attachments.prepare()
+
+        async def deliver(session: BroadcastSession, telegram_id: int) -> None:
+            started_at = time.monotonic()
+            for message_part in messages_array:
+                await session.call(telegram_id, bot.send_message, telegram_id, message_part,
+                                   reply_markup=reply_markup, parse_mode=parse_mode)
+            if sticker_id:
+                await session.call(telegram_id, bot.send_sticker, telegram_id, sticker_id)
+            if attachments:
+                await attachments.send(session, telegram_id)
+            self._record_outgoing(telegram_id, telegram_id, messages_array, started_at, 'broadcast')
+
+        return deliver
+
     async def spam(self,
                    telegram_ids: list,
                    message_text: str = _('Пустое сообщение для рассылки'),
@@ -282,9 +370,15 @@ class MessagesManager:
                    return_only_counters: bool = True,
                    files: dict = None,
                    deny_none: bool = True,
-                   reply_markup=None) -> Union[str, dict, None]:
+                   reply_markup=None,
+                   report_chat_id: Union[int, str, None] = OWNER_ID) -> Union[int, str, dict, None]:
         """
-        Рассылает сообщение на указанные telegram_id.
+        Рассылает сообщение на указанные telegram_id через движок рассылок с ограничением скорости.
+
+        Рассылка сохраняется заданием в MYSQL и сразу возвращается id задания, задание выполняет фоновый обработчик
+        заданий рассылки, в том числе после перезапуска бота, и по завершении отправляет отчёт в report_chat_id.
+        Задание хранит только file_id и ссылки, поэтому рассылка с файлами, ещё не загруженными в Telegram,
+        выполняется в памяти, как раньше, и возвращает отчёт.
 
         Args:
             telegram_ids: список telegram id
@@ -293,66 +387,64 @@ class MessagesManager:
             parse_mode: режим парсинга сообщения
             render_log: True - вернуть логи в виде телеграм сообщения, False - вернуть логи в виде списков
             return_only_counters: True - Вернуть только количество отправленных сообщений, False - вернёт render_log
-            files: словарь с файлами для рассылки
+            files: словарь вида {'photo': файл_или_список, 'video': ..., 'doc': ...}
             deny_none: запретить слово "None"
             reply_markup: Клавиатура
+            report_chat_id: чат, в который фоновый обработчик отправит отчёт о задании, None - не отправлять
 
         Returns:
-            str: отчёт о рассылке
-            dict: словарь с логом успешных отправок и ошибок
+            int: id задания рассылки
+            str: отчёт о рассылке в памяти
+            dict: словарь с логом успешных отправок и ошибок и скоростью рассылки в сообщениях в секунду
             None: передан пустой список telegram id
         """
         if await is_empty(telegram_ids): return None
-        success_log, errors_log = [], []
-
-        for telegram_id in telegram_ids:
-            not_telegram_id_message = _('"%s" - не является id' % telegram_id)
-            if type(telegram_id) == str:
-                if not telegram_id.isdigit():
-                    errors_log.append(not_telegram_id_message)
-                    continue
-            elif type(telegram_id) == int:
-                pass
-            else:
-                errors_log.append(not_telegram_id_message)
-                continue
+        from create_custom_objects import broadcaster, broadcast_jobs
 
-            try:
-                await self.send_message(message=message_text,
-                                        chat_id=telegram_id,
-                                        reply_markup=reply_markup,
-                                        sticker_id=sticker_id,
-                                        parse_mode=parse_mode,
-                                        deny_none=deny_none)
-                if files:
-                    from create_bot import bot
-                    for key, file in files.items():
-                        if key == 'photo':
-                            await bot.send_photo(telegram_id, file)
-                        elif key == 'video':
-                            await bot.send_video(telegram_id, file)
-                        elif key == 'doc':
-                            await bot.send_document(telegram_id, file)
-                success_log.append(_('"%s" - Успех') % telegram_id)
-            except Exception as e:
-                errors_logger.exception(
-                    _(
-                        'рассылка: Ошибка при отправке сообщения: text: "%s" | '
-                        'telegram_id: "%s"' % (message_text, telegram_id)
-                    )
-                )
-                errors_log.append(_('telegram_id: "%s" - Ошибка: "%s"' % (telegram_id, e)))
-        if return_only_counters:
-            return _('Рассылка завершена, сообщения получили %s/%s:\n\n' \
-                     '- Успешно отправлено: %s\n- Ошибка отправки: %s' % (len(success_log), len(telegram_ids),
-                                                                              len(success_log), len(errors_log)))
-        if render_log:
-            s_msg = '\n'.join(success_log)
-            e_msg = '\n'.join(errors_log)
-            return _('Успех (%s):\n\n%s\n\nОшибка отправки(%s):\n\n%s' % (
-                len(success_log),
-                s_msg if len(errors_log) != 0 else '---',
-                len(errors_log),
-                e_msg if len(errors_log) != 0 else '---')
-                    )
-        return {'errors_list': errors_log, 'success_list': success_log}
+        if is_persistable_files(files):
+            return await broadcast_jobs.create_job(list(telegram_ids), message_text, sticker_id, parse_mode, files,
+                                                   deny_none, reply_markup, report_chat_id,
+                                                   render_log and not return_only_counters)
+
+        messages_array = await self.render_message_parts(message_text, deny_none)
+        deliver = await self.make_broadcast_deliver(messages_array, parse_mode, sticker_id, files, reply_markup)
+
+        def on_error(telegram_id: Union[int, str], error: Exception) -> None:
+            errors_logger.exception('рассылка: Ошибка при отправке сообщения: text: "%s" | telegram_id: "%s"',
+                                    message_text, telegram_id)
+
+        report = await broadcaster.run(telegram_ids, deliver, on_error)
+        messages_logger.info('Рассылка: получателей: "%s" | скорость: "%.1f" сообщ./сек. | text: "%s"',
+                             len(telegram_ids), report.throughput, message_text)
+
+        if return_only_counters or render_log:
+            return self.render_broadcast_report(report, len(telegram_ids), not return_only_counters)
+        return {'errors_list': report.errors_log, 'success_list': report.success_log,
+                'throughput': report.throughput}
+
+    @staticmethod
+    def render_broadcast_report(report: BroadcastReport, recipients_count: int, render_log: bool = False) -> str:
+        """
+        Собирает текст отчёта о рассылке.
+
+        Args:
+            report: результат рассылки
+            recipients_count: количество получателей
+            render_log: True - отчёт со списками успешных отправок и ошибок, False - только количество
+
+        Returns:
+            str: отчёт о рассылке
+        """
+        success_log, errors_log = report.success_log, report.errors_log
+        if not render_log:
+            return _('Рассылка завершена, сообщения получили %s/%s:\n\n'
+                     '- Успешно отправлено: %s\n- Ошибка отправки: %s\n- Скорость: %.1f сообщ./сек.') % (
+                len(success_log), recipients_count, len(success_log), len(errors_log), report.throughput)
+        s_msg = '\n'.join(success_log)
+        e_msg = '\n'.join(errors_log)
+        return _('Успех (%s):\n\n%s\n\nОшибка отправки(%s):\n\n%s\n\nСкорость: %.1f сообщ./сек.') % (
+            len(success_log),
+            s_msg if len(success_log) != 0 else '---',
+            len(errors_log),
+            e_msg if len(errors_log) != 0 else '---',
+            report.throughput)
@@ -11,7 +11,9 @@
 """Функции для работы с разрешениями."""
 from typing import Union
 
+from data_base.queries import QUERIES
 from utils import is_empty
+from utils.cache_versions import CACHE_PERMS
 from utils.users import get_user_roles_by_telegram_id
 
 
@@ -27,8 +29,7 @@ async def get_roles_priority(return_role_id_priority: bool = False) -> Union[dic
     """
     from create_custom_objects import db
 
-    sql_request = f"SELECT * FROM `bot_role` ORDER BY `priority` DESC"
-    response = await db.sql(sql_request)
+    response = await db.query('bot_role.select_all')
     if await is_empty(response): return None
     roles_priority = {}
     for item in response:
@@ -50,112 +51,10 @@ async def get_perms_by_telegram_id(telegram_id: int) -> Union[list, None]:
         list: Список разрешенных команд
         None: ничего не найдено
     """
-    from create_custom_objects import db
+    from create_custom_objects import perms_engine
 
-    bot_user_id = await db.telegram_id_to_bot_user_id(telegram_id)
-    roles_ids = await get_user_roles_by_telegram_id(telegram_id, return_only_ids=True)
-    roles_priority = await get_roles_priority(return_role_id_priority=True)
-    perms = await db.sql(f"SELECT * FROM `permission`")
-
-    if (await is_empty(bot_user_id)) or (await is_empty(roles_ids)) \
-            or (await is_empty(roles_priority)) or (await is_empty(perms)): return None
-
-    always_allow, always_deny = [], []
-    roles_allow, roles_deny = {}, {}
-
-    for line in perms:
-        # Если разрешение персонально для пользователя
-        if line['for_bot_user_id'] == bot_user_id:
-            # Если поле deny_command не пустое - добавить команду в список всегда запрещённых
-            if not (line['deny_command'] is None or line['deny_command'] == ""):
-                always_deny.append(line['deny_command'])
-            # Иначе добавить в список всегда разрешенных команд
-            else:
-                always_allow.append(line['allow_command'])
-        # Иначе, если разрешение для роли
-        else:
-            # Если роль не принадлежит пользователю - новая итерация
-            if not line['for_bot_role_id'] in roles_ids:
-                continue
-            # Если роль принадлежит пользователю - получаем её приоритет
-            role_priority = roles_priority[line['for_bot_role_id']]
-            # Если поле deny_command не пустое
-            if not (line['deny_command'] is None or line['deny_command'] == ""):
-                # Если в словаре запрещено_для_роли нет ключа role_priority
-                if not role_priority in roles_deny:
-                    # Добавляем ключ role_priority: [запрещенная_команда, ]
-                    roles_deny.update({role_priority: [line['deny_command'], ]})
-                # Если ключ есть -
-                else:
-                    # добавляем команду в список запрещённых для роли
-                    roles_deny[role_priority].append(line['deny_command'])
-                # Проверим разрешено_для_роли, если нет такого ключа role_priority - добавим
-                if not role_priority in roles_allow:
-                    roles_allow.update({role_priority: []})
-            # Если поле deny_command пустое, то поле allow_command заполнено
-            else:
-                # Если в словаре разрешено_для_роли нет ключа role_priority
-                if not role_priority in roles_allow:
-                    # Добавляем ключ role_priority: [разрешенная_команда, ]
-                    roles_allow.update({role_priority: [line['allow_command'], ]})
-                # Если ключ есть -
-                else:
-                    # Добавляем команду в список разрешенных для роли
-                    roles_allow[role_priority].append(line['allow_command'])
-                # Проверим запрещено_для_роли, если нет такого ключа role_priority - добавим
-                if not role_priority in roles_deny:
-                    roles_deny.update({role_priority: []})
-
-    # Проходим приоритет, разрешенная_команда в разрешено_для_роли
-    for role_priority, item in roles_allow.items():
-        # Проходим индекс, разрешенная_команда в enumerate(item)
-        for index, command in enumerate(item):
-            # Если команда_разрешена_для_роли есть в списке всегда_запрещено - удаляем из разрешенных
-            if command in always_deny:
-                del roles_allow[role_priority][index]
-
-    # Проходим приоритет, запрещенная_команда в запрещено_для_роли
-    for role_priority, item in roles_deny.items():
-        # Проходим индекс, запрещенная_команда в enumerate(item)
-        for index, command in enumerate(item):
-            # Если команда_запрещена_для_роли есть в списке всегда_разрешено - удаляем из запрещенных
-            if command in always_allow:
-                del roles_deny[role_priority][index]
-
-    # Получаем сортированный по убыванию список приоритетов ролей
-    roles_allow_keys = sorted(roles_allow.keys(), reverse=True)
-
-    # финальные списки
-    final_allow_commands, final_deny_commands = [], []
-
-    # Проходим индекс, приоритет в enumerate(roles_allow_keys)
-    for index, role_priority in enumerate(roles_allow_keys):
-        # Если индекс == 0, то есть самая высокая роль пользователя
-        if index == 0:
-            # Добавляем все разрешенные самой высокой ролью команды в финальный список разрешенных
-            final_allow_commands.extend(roles_allow[role_priority])
-            # Добавляем все запрещенные самой высокой ролью команды в финальный список запрещенных
-            final_deny_commands.extend(roles_deny[role_priority])
-        # Иначе, если не самая высокая роль пользователя
-        else:
-            # Проходим запрещенная_команда в запрещено_для_роли[приоритет_текущей_роли]
-            for command in roles_deny[role_priority]:
-                # Если запрещенная_команда есть в финальном списке разрешенных - новая итерация
-                if command in final_allow_commands:
-                    continue
-                # Если команда не разрешена на более высоком уровне - добавляем в финальный список запрещённых
-                else:
-                    final_deny_commands.append(command)
-
-            # Проходим разрешенная_команда в разрешено_для_роли[приоритет_текущей_роли]
-            for command in roles_allow[role_priority]:
-                # Если разрешенная_команда есть в финальном списке запрещенных - новая итерация
-                if command in final_deny_commands:
-                    continue
-                # Если команда не запрещена на более высоком уровне - добавляем в финальный список разрешенных
-                else:
-                    final_allow_commands.append(command)
-    return list(set(final_allow_commands))
+    allowed_commands = await perms_engine.get_allowed_commands(telegram_id)
+    return None if allowed_commands is None else list(allowed_commands)
 
 
 async def check_user_access(telegram_id: int, command_name: str) -> Union[bool, None]:
@@ -170,13 +69,10 @@ async def check_user_access(telegram_id: int, command_name: str) -> Union[bool,
         bool: True - доступ разрешен, False - Доступ запрещён
         None: команда не найдена
     """
-    if await is_empty(command_name): return None
-
-    allow_commands_list = await get_perms_by_telegram_id(telegram_id)
-    if await is_empty(allow_commands_list): return None
+    from create_custom_objects import perms_engine
 
-    if ("all" in allow_commands_list) or (command_name in allow_commands_list): return True
-    return False
+    if await is_empty(command_name): return None
+    return await perms_engine.check_access(telegram_id, command_name)
 
 
 async def compare_access_by_ids(telegram_id_1: int, telegram_id_2: int) -> Union[int, bool, None]:
@@ -219,14 +115,13 @@ async def system_add_user_roles_by_telegram_id(telegram_id: int, roles_ids: list
         bool: False - пользователь не найден
         None: функция полностью выполнилась
     """
-    from create_custom_objects import db
+    from create_custom_objects import db, cache_versions
 
     bot_user_id = await db.telegram_id_to_bot_user_id(telegram_id)
     if await is_empty(bot_user_id): return False
 
-    sql_requests = []
-    for role_id in roles_ids:
-        sql_request = f"INSERT INTO `bot_user_bot_role`(`bot_user_id`, `bot_role_id`) VALUES " \
-                      f"('{bot_user_id}', '{role_id}')"
-        sql_requests.append(sql_request)
-    await db.sql_transaction(sql_requests)
+    sql_requests = [(QUERIES['bot_user_bot_role.insert'], (bot_user_id, role_id)) for role_id in roles_ids]
+    try:
+        await db.sql_transaction(sql_requests)
+    finally:
+        await cache_versions.publish(CACHE_PERMS)
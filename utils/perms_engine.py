@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Движок разрешений: таблицы разрешений и ролей загружаются в память, итоговые разрешения кэшируются."""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Union
+
+from config import PERMS_CACHE_SIZE, PERMS_CACHE_TTL
+
+_EMPTY = frozenset()
+
+
+class PermsEngine:
+    """Класс движка разрешений."""
+
+    def __init__(self, db, cache_size: int = PERMS_CACHE_SIZE, ttl: float = PERMS_CACHE_TTL) -> None:
+        """
+        init метод.
+
+        Args:
+            db: объект базы данных с методом query
+            cache_size: максимальное количество пользователей в кэше итоговых разрешений
+            ttl: время в секундах, через которое таблицы будут перечитаны
+        """
+        self._db = db
+        self._cache_size = cache_size
+        self._ttl = ttl
+        self._lock = asyncio.Lock()
+        self._expires_at = 0.0
+        self._loaded = False
+        self._version = 0
+        self._clear()
+
+    def _clear(self) -> None:
+        """
+        Очищает индексы и кэши.
+
+        Returns:
+            None
+        """
+        # {id_роли: приоритет_роли}
+        self._roles_priority = {}
+        # {id_роли: (разрешённые_команды, запрещённые_команды)}
+        self._roles_rules = {}
+        # {id_пользователя_бота: (всегда_разрешённые_команды, всегда_запрещённые_команды)}
+        self._users_rules = {}
+        # {telegram_id: (id_пользователя_бота, frozenset(id_ролей))}
+        self._users_roles = {}
+        # {frozenset(id_ролей): разрешённые_команды}
+        self._combinations = {}
+        # {telegram_id: разрешённые_команды}, LRU
+        self._users_cache = OrderedDict()
+
+    def invalidate(self) -> None:
+        """
+        Сбрасывает загруженные таблицы, вызывается после изменения ролей или разрешений.
+
+        Returns:
+            None
+        """
+        self._version += 1
+        self._loaded = False
+
+    async def _ensure_loaded(self) -> None:
+        """
+        Загружает таблицы, если они ещё не загружены, сброшены или устарели.
+
+        Returns:
+            None
+        """
+        if self._loaded and time.monotonic() < self._expires_at: return
+
+        async with self._lock:
+            if self._loaded and time.monotonic() < self._expires_at: return
+
+            version = self._version
+            roles = await self._db.query('bot_role.select_priorities')
+            users_roles = await self._db.query('bot_user_bot_role.select_all')
+            perms = await self._db.query('permission.select_all')
+            self.load(roles, users_roles, perms)
+            # Если во время загрузки таблицы были изменены - при следующем обращении загрузим их ещё раз
+            self._loaded = version == self._version
+
+    def load(self, roles: list, users_roles: list, perms: list) -> None:
+        """
+        Строит индексы по строкам таблиц bot_role, bot_user_bot_role и permission.
+
+        Args:
+            roles: строки вида {'id': id_роли, 'priority': приоритет}
+            users_roles: строки вида {'bot_user_id': id, 'telegram_id': telegram_id, 'bot_role_id': id_роли}
+            perms: строки таблицы permission
+
+        Returns:
+            None
+        """
+        self._clear()
+        self._roles_priority = {int(x['id']): int(x['priority']) for x in roles}
+
+        users_roles_ids = {}
+        for line in users_roles:
+            key = (int(line['telegram_id']), line['bot_user_id'])
+            users_roles_ids.setdefault(key, set()).add(int(line['bot_role_id']))
+        self._users_roles = {telegram_id: (bot_user_id, frozenset(roles_ids))
+                             for (telegram_id, bot_user_id), roles_ids in users_roles_ids.items()}
+
+        roles_rules, users_rules = {}, {}
+        for line in perms:
+            # Разрешение персонально для пользователя, иначе - для роли
+            if line['for_bot_user_id'] is not None:
+                allow, deny = users_rules.setdefault(line['for_bot_user_id'], (set(), set()))
+            elif line['for_bot_role_id'] is not None:
+                allow, deny = roles_rules.setdefault(int(line['for_bot_role_id']), (set(), set()))
+            else:
+                continue
+            # Если поле deny_command не пустое - команда запрещена, иначе разрешена
+            if not (line['deny_command'] is None or line['deny_command'] == ""):
+                deny.add(line['deny_command'])
+            else:
+                allow.add(line['allow_command'])
+        self._roles_rules = {k: (frozenset(a), frozenset(d)) for k, (a, d) in roles_rules.items()}
+        self._users_rules = {k: (frozenset(a), frozenset(d)) for k, (a, d) in users_rules.items()}
+
+        # Итоговые разрешения для каждой встречающейся комбинации ролей считаются один раз
+        for _, roles_ids in self._users_roles.values():
+            if roles_ids not in self._combinations:
+                self._combinations[roles_ids] = self._merge(roles_ids)
+
+        self._expires_at = time.monotonic() + self._ttl
+        self._loaded = True
+
+    def _merge(self,
+               roles_ids: frozenset,
+               always_allow: frozenset = _EMPTY,
+               always_deny: frozenset = _EMPTY) -> frozenset:
+        """
+        Объединяет разрешения ролей с учётом их приоритета и персональных разрешений.
+
+        Результат совпадает с прежним алгоритмом get_perms_by_telegram_id. Уровень с более высоким приоритетом
+        перекрывает решения уровней ниже, уровни образуют только роли, у которых есть строки в permission. На верхнем
+        уровне команда, которую одна роль разрешает, а другая запрещает, остаётся разрешённой, на остальных уровнях
+        запрет сильнее разрешения того же уровня. Персональный запрет убирает команду из разрешений ролей,
+        персональное разрешение только отменяет запреты ролей и само доступа не даёт.
+
+        Args:
+            roles_ids: id ролей пользователя
+            always_allow: всегда разрешённые пользователю команды
+            always_deny: всегда запрещённые пользователю команды
+
+        Returns:
+            frozenset: разрешённые команды
+        """
+        # {приоритет: (разрешено_для_уровня, запрещено_для_уровня)}
+        levels = {}
+        for role_id in roles_ids:
+            if (role_id not in self._roles_priority) or (role_id not in self._roles_rules): continue
+            allow, deny = levels.setdefault(self._roles_priority[role_id], (set(), set()))
+            role_allow, role_deny = self._roles_rules.get(role_id, (_EMPTY, _EMPTY))
+            allow |= role_allow - always_deny
+            deny |= role_deny - always_allow
+
+        final_allow, final_deny = set(), set()
+        for index, role_priority in enumerate(sorted(levels.keys(), reverse=True)):
+            allow, deny = levels[role_priority]
+            if index == 0:
+                final_allow |= allow
+                final_deny |= deny
+            else:
+                # Команды, решённые на более высоком уровне, не меняются
+                final_deny |= deny - final_allow
+                final_allow |= allow - final_deny
+        return frozenset(final_allow)
+
+    async def get_allowed_commands(self, telegram_id: int) -> Union[frozenset, None]:
+        """
+        Получает набор разрешённых команд пользователя.
+
+        Args:
+            telegram_id: telegram id
+
+        Returns:
+            frozenset: разрешённые команды
+            None: у пользователя нет ролей или таблица разрешений пуста
+        """
+        await self._ensure_loaded()
+        telegram_id = int(telegram_id)
+
+        if telegram_id in self._users_cache:
+            self._users_cache.move_to_end(telegram_id)
+            return self._users_cache[telegram_id]
+
+        if (telegram_id not in self._users_roles) or ((not self._roles_rules) and (not self._users_rules)):
+            allowed = None
+        else:
+            bot_user_id, roles_ids = self._users_roles[telegram_id]
+            if bot_user_id in self._users_rules:
+                allowed = self._merge(roles_ids, *self._users_rules[bot_user_id])
+            else:
+                allowed = self._combinations[roles_ids]
+
+        self._users_cache[telegram_id] = allowed
+        if len(self._users_cache) > self._cache_size:
+            self._users_cache.popitem(last=False)
+        return allowed
+
+    async def check_access(self, telegram_id: int, command_name: str) -> Union[bool, None]:
+        """
+        Проверяет доступ пользователя к команде.
+
+        Args:
+            telegram_id: telegram id
+            command_name: имя запрошенной команды
+
+        Returns:
+            bool: True - доступ разрешен, False - Доступ запрещён
+            None: у пользователя нет разрешённых команд
+        """
+        allowed = await self.get_allowed_commands(telegram_id)
+        if not allowed: return None
+        return ("all" in allowed) or (command_name in allowed)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Расписание групп: расписание группы загружается одним запросом и отдаётся из памяти."""
+import asyncio
+import time
+from datetime import datetime, timedelta, time as day_time
+from typing import Union
+
+from config import SCHEDULE_CACHE_TTL
+from utils.date_time import get_current_time, get_week_type
+
+# Сколько дней вперёд искать следующую пару
+_NEXT_PAIR_SEARCH_DAYS = 14
+
+
+def _to_time(value: Union[timedelta, day_time]) -> day_time:
+    """
+    Приводит значение столбца TIME к datetime.time, драйвер MYSQL возвращает TIME как timedelta.
+
+    Args:
+        value: значение столбца
+
+    Returns:
+        datetime.time: время
+    """
+    if isinstance(value, timedelta):
+        return (datetime.min + value).time()
+    return value
+
+
+class SchedulePair:
+    """Класс пары в расписании группы."""
+
+    __slots__ = ('schedule_id', 'day_number', 'week_type', 'number', 'name', 'lecturer_first_name',
+                 'lecturer_last_name', 'cabinet', 'start_time', 'close_time')
+
+    def __init__(self, row: dict) -> None:
+        """
+        init метод.
+
+        Args:
+            row: строка запроса расписания
+        """
+        self.schedule_id = row['schedule_id']
+        self.day_number = int(row['day_number'])
+        self.week_type = bool(row['week_type'])
+        # Порядковый номер пары в дне, проставляется после сортировки по времени начала
+        self.number = 0
+        self.name = row['pair_name']
+        self.lecturer_first_name = row['lecturer_first_name']
+        self.lecturer_last_name = row['lecturer_last_name']
+        self.cabinet = row['cabinet_name']
+        self.start_time = _to_time(row['pair_start_time'])
+        self.close_time = _to_time(row['pair_close_time'])
+
+    @property
+    def lecturer(self) -> str:
+        """
+        Имя преподавателя.
+
+        Returns:
+            str: фамилия и имя
+        """
+        return f'{self.lecturer_last_name} {self.lecturer_first_name}'
+
+
+class ScheduleService:
+    """
+    Класс сервиса расписания.
+
+    Расписание группы загружается одним запросом с пар, преподавателей и кабинетов, раскладывается по ключам
+    (id_группы, тип_недели) и хранится ttl секунд или до сброса через invalidate.
+    """
+
+    def __init__(self, db, ttl: float = SCHEDULE_CACHE_TTL) -> None:
+        """
+        init метод.
+
+        Args:
+            db: объект базы данных с методом query
+            ttl: время жизни расписания группы в кэше в секундах
+        """
+        self._db = db
+        self._ttl = ttl
+        # {(id_группы, тип_недели): {номер_дня: [SchedulePair]}}
+        self._schedules = {}
+        # {id_группы: (id_учебного_заведения или None, время_устаревания)}
+        self._groups = {}
+        # {id_группы: версия}, увеличивается при сбросе
+        self._versions = {}
+        # Увеличивается при сбросе расписания всех групп
+        self._global_version = 0
+        self._locks = {}
+
+    def invalidate(self, students_group_id: int = None) -> None:
+        """
+        Сбрасывает расписание группы, вызывается после изменения таблицы schedule.
+
+        Args:
+            students_group_id: id группы, None - сбросить расписание всех групп
+
+        Returns:
+            None
+        """
+        if students_group_id is None:
+            self._global_version += 1
+        groups_ids = [students_group_id] if students_group_id is not None else list(self._groups)
+        for group_id in groups_ids:
+            self._versions[group_id] = self._versions.get(group_id, 0) + 1
+            self._groups.pop(group_id, None)
+            self._schedules.pop((group_id, True), None)
+            self._schedules.pop((group_id, False), None)
+
+    def get_version(self, students_group_id: int) -> tuple:
+        """
+        Получает версию расписания группы, меняется при каждом сбросе, используется кэшами производных данных.
+
+        Args:
+            students_group_id: id группы
+
+        Returns:
+            tuple: версия
+        """
+        return self._global_version, self._versions.get(students_group_id, 0)
+
+    def _is_loaded(self, students_group_id: int) -> bool:
+        """
+        Загружено ли актуальное расписание группы.
+
+        Args:
+            students_group_id: id группы
+
+        Returns:
+            bool: True - загружено
+        """
+        group = self._groups.get(students_group_id)
+        return group is not None and time.monotonic() < group[1]
+
+    async def _ensure_loaded(self, students_group_id: int) -> Union[int, None]:
+        """
+        Загружает расписание группы, если оно ещё не загружено, сброшено или устарело.
+
+        Args:
+            students_group_id: id группы
+
+        Returns:
+            int: id учебного заведения группы
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        if self._is_loaded(students_group_id): return self._groups[students_group_id][0]
+
+        lock = self._locks.setdefault(students_group_id, asyncio.Lock())
+        async with lock:
+            if self._is_loaded(students_group_id): return self._groups[students_group_id][0]
+
+            version = self.get_version(students_group_id)
+            rows = await self._db.query('schedule.select_by_students_group_id', (students_group_id,))
+            if not rows: return None
+
+            institution_id = rows[0]['institution_id']
+            schedules = {True: {}, False: {}}
+            seen = set()
+            for row in rows:
+                # Строки без расписания и повторы из-за нескольких учебных заведений группы
+                if row['schedule_id'] is None or row['schedule_id'] in seen: continue
+                seen.add(row['schedule_id'])
+                pair = SchedulePair(row)
+                day = schedules[pair.week_type].setdefault(pair.day_number, [])
+                day.append(pair)
+                pair.number = len(day)
+
+            # Если во время загрузки расписание было изменено - при следующем обращении загрузим его ещё раз
+            if version == self.get_version(students_group_id):
+                self._schedules[(students_group_id, True)] = schedules[True]
+                self._schedules[(students_group_id, False)] = schedules[False]
+                self._groups[students_group_id] = (institution_id, time.monotonic() + self._ttl)
+            return institution_id
+
+    async def get_week(self, students_group_id: int, date: datetime = None) -> Union[dict, None]:
+        """
+        Получает расписание группы на неделю.
+
+        Args:
+            students_group_id: id группы
+            date: любая дата недели, по умолчанию текущая
+
+        Returns:
+            dict: словарь вида {номер_дня: [SchedulePair]}, номер дня - 1 для понедельника
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        institution_id = await self._ensure_loaded(students_group_id)
+        if institution_id is None: return None
+
+        date = date if date else await get_current_time()
+        week_type = await get_week_type(institution_id, date)
+        if week_type is None: return None
+        return self._schedules.get((students_group_id, week_type), {})
+
+    async def get_day_info(self, students_group_id: int, date: datetime = None) -> Union[tuple, None]:
+        """
+        Получает расписание группы на день вместе с типом недели.
+
+        Args:
+            students_group_id: id группы
+            date: дата, по умолчанию текущая
+
+        Returns:
+            tuple: (тип_недели, пары дня в порядке начала)
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        institution_id = await self._ensure_loaded(students_group_id)
+        if institution_id is None: return None
+
+        date = date if date else await get_current_time()
+        week_type = await get_week_type(institution_id, date)
+        if week_type is None: return None
+        return week_type, self._schedules.get((students_group_id, week_type), {}).get(date.isoweekday(), [])
+
+    async def get_day(self, students_group_id: int, date: datetime = None) -> Union[list, None]:
+        """
+        Получает расписание группы на день.
+
+        Args:
+            students_group_id: id группы
+            date: дата, по умолчанию текущая
+
+        Returns:
+            list: пары дня в порядке начала
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        day_info = await self.get_day_info(students_group_id, date)
+        if day_info is None: return None
+        return day_info[1]
+
+    async def get_today(self, students_group_id: int) -> Union[list, None]:
+        """
+        Получает расписание группы на сегодня.
+
+        Args:
+            students_group_id: id группы
+
+        Returns:
+            list: пары дня в порядке начала
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        return await self.get_day(students_group_id, await get_current_time())
+
+    async def get_tomorrow(self, students_group_id: int) -> Union[list, None]:
+        """
+        Получает расписание группы на завтра.
+
+        Args:
+            students_group_id: id группы
+
+        Returns:
+            list: пары дня в порядке начала
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        return await self.get_day(students_group_id, await get_current_time() + timedelta(days=1))
+
+    async def get_next_pair(self, students_group_id: int, now: datetime = None) -> Union[tuple, None]:
+        """
+        Получает ближайшую ещё не начавшуюся пару группы.
+
+        Args:
+            students_group_id: id группы
+            now: момент, от которого ищется пара, по умолчанию текущее время
+
+        Returns:
+            tuple: (дата, SchedulePair)
+            None: пар в ближайшие две недели нет или группа не найдена
+        """
+        now = now if now else await get_current_time()
+        for days in range(_NEXT_PAIR_SEARCH_DAYS):
+            date = now + timedelta(days=days)
+            pairs = await self.get_day(students_group_id, date)
+            if pairs is None: return None
+            for pair in pairs:
+                if days or pair.start_time > now.time():
+                    return date, pair
+        return None
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Публикация изменений расписания студентам затронутых групп."""
+import json
+from typing import AsyncIterator
+
+from config import SCHEDULE_CHANGES_FILE_LIMIT
+from create_bot import gettext as _
+from loggers import messages_logger
+from utils.cache_versions import CACHE_SCHEDULE_MESSAGES
+
+
+async def _iter_recipients(students_groups_ids: list, institution_id: int) -> AsyncIterator[list]:
+    """
+    Отдаёт частями telegram id студентов групп и учебного заведения, каждый студент попадает в ответ один раз.
+
+    Args:
+        students_groups_ids: список id групп
+        institution_id: id учебного заведения или None
+
+    Yields:
+        list: часть списка telegram id
+    """
+    from create_custom_objects import db
+
+    if institution_id is None:
+        async for chunk in db.iter_telegram_ids_by_students_groups_ids(students_groups_ids):
+            yield chunk
+        return
+
+    seen = set()
+    if students_groups_ids:
+        async for chunk in db.iter_telegram_ids_by_students_groups_ids(students_groups_ids):
+            seen.update(chunk)
+            yield chunk
+    async for chunk in db.iter_telegram_ids_by_institution(institution_id, only_students=True):
+        # Студенты, уже попавшие в ответ по группам, повторно не добавляются
+        chunk = [x for x in chunk if x not in seen]
+        if chunk: yield chunk
+
+
+async def publish_schedule_change(photo_ids: list,
+                                  students_groups_ids: list = None,
+                                  institution_id: int = None,
+                                  message_text: str = None) -> int:
+    """
+    Сохраняет изменение расписания и создаёт задание рассылки его студентам затронутых групп.
+
+    Получатели всех групп получаются одним запросом и читаются частями, студент нескольких групп получит сообщение
+    один раз. Фото отправляются альбомом по file_id, поэтому в Telegram ничего повторно не загружается, а задание
+    рассылки выполняется фоновым обработчиком с ограничением скорости отправки и продолжается после перезапуска бота.
+
+    Args:
+        photo_ids: список file_id фото с изменениями
+        students_groups_ids: список id затронутых групп
+        institution_id: id учебного заведения, если изменение касается всех его групп
+        message_text: текст сообщения, по умолчанию стандартный
+
+    Returns:
+        int: id задания рассылки
+
+    Raises:
+        ValueError: нет фото, фото больше SCHEDULE_CHANGES_FILE_LIMIT или не указаны получатели
+    """
+    from create_custom_objects import db, broadcast_jobs, cache_versions
+
+    if not photo_ids:
+        raise ValueError(_('Не переданы фото изменений расписания'))
+    if len(photo_ids) > SCHEDULE_CHANGES_FILE_LIMIT:
+        raise ValueError(_('Фото изменений расписания не может быть больше %s') % SCHEDULE_CHANGES_FILE_LIMIT)
+    if not students_groups_ids and institution_id is None:
+        raise ValueError(_('Не указаны группы или учебное заведение для изменений расписания'))
+
+    await db.query('schedule_change.insert', (json.dumps(list(photo_ids)),))
+    # Сообщения с расписанием на день больше не актуальны
+    await cache_versions.publish(CACHE_SCHEDULE_MESSAGES)
+
+    job_id = await broadcast_jobs.create_job(_iter_recipients(students_groups_ids or [], institution_id),
+                                             message_text if message_text else _('<b>Изменения в расписании</b>'),
+                                             files={'photo': list(photo_ids)})
+    messages_logger.info('Изменения расписания: задание рассылки: "%s" | групп: "%s" | учебное заведение: "%s"',
+                         job_id, len(students_groups_ids or []), institution_id)
+    return job_id
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Кэш готовых сообщений с расписанием: сообщение группы на день собирается один раз для всех её студентов."""
+import asyncio
+import html
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Union
+
+from config import SCHEDULE_MESSAGES_CACHE_SIZE, SCHEDULE_PREWARM_LEAD, DAYS_START_PHRASES, EMOJI_NUMBERS
+from create_bot import i18n, gettext as _
+from loggers import errors_logger
+from utils.date_time import get_current_time
+from utils.schedule import ScheduleService
+
+
+class ScheduleMessages:
+    """
+    Класс кэша сообщений с расписанием на день.
+
+    Ключ кэша - (id_группы, дата, тип_недели, язык). Запись устаревает при сбросе расписания группы в ScheduleService,
+    при изменении префикса сообщений и при вызове invalidate, например после публикации изменений расписания.
+    """
+
+    def __init__(self, schedule_service: ScheduleService, size: int = SCHEDULE_MESSAGES_CACHE_SIZE) -> None:
+        """
+        init метод.
+
+        Args:
+            schedule_service: сервис расписания
+            size: максимальное количество сообщений в кэше
+        """
+        self._schedule_service = schedule_service
+        self._size = size
+        # {(id_группы, дата, тип_недели, язык): (версия_расписания, версия_кэша, префикс, части_сообщения)}
+        self._messages = OrderedDict()
+        # Увеличивается при вызове invalidate
+        self._version = 0
+        self._prewarm_task: Union[asyncio.Task, None] = None
+
+    def invalidate(self) -> None:
+        """
+        Сбрасывает все готовые сообщения.
+
+        Returns:
+            None
+        """
+        self._version += 1
+        self._messages.clear()
+
+    def render_day(self, date: datetime, week_type: bool, pairs: list) -> str:
+        """
+        Собирает текст расписания на день, названия из базы данных экранируются для parse_mode HTML.
+
+        Args:
+            date: дата
+            week_type: тип недели, True - числитель, False - знаменатель
+            pairs: пары дня из ScheduleService
+
+        Returns:
+            str: текст сообщения в HTML
+        """
+        week_type_name = _('числитель') if week_type else _('знаменатель')
+        lines = [_('<b>%s, %s (%s):</b>') % (_(DAYS_START_PHRASES[date.isoweekday() - 1]),
+                                             date.strftime('%d.%m.%Y'), week_type_name)]
+        if not pairs:
+            lines.append(_('Пар нет'))
+        for pair in pairs:
+            lines.append('')
+            lines.append(f"{EMOJI_NUMBERS.get(str(pair.number), str(pair.number))} "
+                         f"<b>{pair.start_time.strftime('%H:%M')} - {pair.close_time.strftime('%H:%M')}</b> "
+                         f"{html.escape(pair.name)}")
+            lines.append(_('Преподаватель: %s') % html.escape(pair.lecturer))
+            if pair.cabinet:
+                lines.append(_('Кабинет: %s') % html.escape(pair.cabinet))
+        return '\n'.join(lines)
+
+    async def get_day_message(self, students_group_id: int, date: datetime = None) -> Union[list, None]:
+        """
+        Получает готовое сообщение с расписанием группы на день на языке текущего пользователя.
+
+        Args:
+            students_group_id: id группы
+            date: дата, по умолчанию текущая
+
+        Returns:
+            list: части сообщения для отправки, префикс сообщений уже добавлен
+            None: группа не найдена или не привязана к учебному заведению
+        """
+        from create_custom_objects import db, mm
+
+        date = date if date else await get_current_time()
+        # Версия берётся до чтения расписания: если его сбросят во время чтения, запись сразу станет устаревшей
+        schedule_version = self._schedule_service.get_version(students_group_id)
+        day_info = await self._schedule_service.get_day_info(students_group_id, date)
+        if day_info is None: return None
+        week_type, pairs = day_info
+
+        key = (students_group_id, date.date(), week_type, i18n.ctx_locale.get() or i18n.default)
+        prefix = await db.get_all_messages_prefix()
+
+        cached = self._messages.get(key)
+        if cached is not None and cached[:3] == (schedule_version, self._version, prefix):
+            self._messages.move_to_end(key)
+            return cached[3]
+
+        version = self._version
+        messages_array = await mm.render_message_parts(self.render_day(date, week_type, pairs))
+        if version == self._version:
+            self._messages[key] = (schedule_version, version, prefix, messages_array)
+            self._messages.move_to_end(key)
+            if len(self._messages) > self._size:
+                self._messages.popitem(last=False)
+        return messages_array
+
+    async def prewarm(self, date: datetime = None) -> int:
+        """
+        Собирает сообщения всех групп на день на языке по умолчанию.
+
+        Args:
+            date: дата, по умолчанию текущая
+
+        Returns:
+            int: количество собранных сообщений
+        """
+        from create_custom_objects import db
+
+        date = date if date else await get_current_time()
+        i18n.ctx_locale.set(i18n.default)
+        count = 0
+        for group in await db.query('students_group.select_ids'):
+            if await self.get_day_message(group['id'], date) is not None:
+                count += 1
+        return count
+
+    async def _get_first_pair_start(self, date: datetime) -> Union[datetime, None]:
+        """
+        Получает время начала самой ранней пары дня среди всех групп.
+
+        Args:
+            date: дата
+
+        Returns:
+            datetime: время начала
+            None: в этот день пар нет
+        """
+        from create_custom_objects import db
+
+        starts = []
+        for group in await db.query('students_group.select_ids'):
+            pairs = await self._schedule_service.get_day(group['id'], date)
+            if pairs:
+                starts.append(pairs[0].start_time)
+        if not starts: return None
+        return date.replace(hour=min(starts).hour, minute=min(starts).minute, second=0, microsecond=0)
+
+    async def _prewarm_loop(self) -> None:
+        """
+        Каждый день собирает сообщения за SCHEDULE_PREWARM_LEAD минут до первой пары.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import install_state
+
+        while True:
+            try:
+                if await install_state.check():
+                    now = await get_current_time()
+                    first_pair_start = await self._get_first_pair_start(now)
+                    if first_pair_start is not None and now < first_pair_start:
+                        await asyncio.sleep(max((first_pair_start - timedelta(minutes=SCHEDULE_PREWARM_LEAD)
+                                                 - now).total_seconds(), 0))
+                        await self.prewarm(first_pair_start)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                errors_logger.exception('Ошибка подготовки сообщений с расписанием')
+
+            # Следующая проверка - в начале следующего дня
+            now = await get_current_time()
+            next_day = (now + timedelta(days=1)).replace(hour=0, minute=0, second=1, microsecond=0)
+            await asyncio.sleep((next_day - now).total_seconds())
+
+    def start_prewarm(self) -> None:
+        """
+        Запускает ежедневную подготовку сообщений, если она включена.
+
+        Returns:
+            None
+        """
+        if SCHEDULE_PREWARM_LEAD <= 0 or self._prewarm_task is not None: return
+        self._prewarm_task = asyncio.create_task(self._prewarm_loop())
+
+    async def stop_prewarm(self) -> None:
+        """
+        Останавливает ежедневную подготовку сообщений.
+
+        Returns:
+            None
+        """
+        if self._prewarm_task is None: return
+        self._prewarm_task.cancel()
+        try:
+            await self._prewarm_task
+        except asyncio.CancelledError:
+            pass
+        self._prewarm_task = None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Ежедневная рассылка студентам расписания на следующий день."""
+from datetime import datetime, timedelta
+
+from create_bot import i18n
+from loggers import messages_logger
+
+
+async def _push_group(students_group_id: int, telegram_ids: list, day: datetime) -> bool:
+    """
+    Создаёт задание рассылки расписания группы на день, сообщение собирается один раз для всей группы.
+
+    Args:
+        students_group_id: id группы
+        telegram_ids: telegram id студентов группы
+        day: дата
+
+    Returns:
+        bool: True - задание создано, False - у группы в этот день нет пар
+    """
+    from create_custom_objects import schedule_service, schedule_messages, broadcast_jobs
+
+    day_info = await schedule_service.get_day_info(students_group_id, day)
+    if day_info is None or not day_info[1]: return False
+    week_type, pairs = day_info
+    await broadcast_jobs.create_job(telegram_ids, schedule_messages.render_day(day, week_type, pairs))
+    return True
+
+
+async def push_tomorrow_schedule(scheduled_at: datetime) -> int:
+    """
+    Рассылает расписание на следующий день всем зарегистрированным студентам групп.
+
+    Сообщение группы собирается один раз, каждой группе создаётся одно задание рассылки, задания выполняются фоновым
+    обработчиком с ограничением скорости отправки. Группам, у которых на следующий день нет пар, сообщение не
+    отправляется.
+
+    Args:
+        scheduled_at: запланированное время запуска, расписание берётся на следующий после него день
+
+    Returns:
+        int: количество созданных заданий рассылки
+    """
+    from create_custom_objects import db
+
+    day = scheduled_at + timedelta(days=1)
+    i18n.ctx_locale.set(i18n.default)
+
+    groups_count = 0
+    jobs_count = 0
+    students_group_id, telegram_ids = None, []
+    # Строки отсортированы по группе, поэтому в памяти хранятся получатели только одной группы
+    async for rows in db.query_pages('bot_user_students_group.select_registered_telegram_ids', None,
+                                     ('students_group_id', 'bot_user_id')):
+        for row in rows:
+            if row['students_group_id'] != students_group_id:
+                if telegram_ids and await _push_group(students_group_id, telegram_ids, day):
+                    jobs_count += 1
+                groups_count += 1
+                students_group_id, telegram_ids = row['students_group_id'], []
+            telegram_ids.append(row['telegram_id'])
+    if telegram_ids and await _push_group(students_group_id, telegram_ids, day):
+        jobs_count += 1
+
+    messages_logger.info('Рассылка расписания на %s: групп: "%s" | заданий: "%s"',
+                         day.strftime('%d.%m.%Y'), groups_count, jobs_count)
+    return jobs_count
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Планировщик ежедневных задач, время следующего запуска хранится в MYSQL и переживает перезапуск бота."""
+import asyncio
+from datetime import datetime, timedelta, time as day_time
+from typing import Awaitable, Callable, Union
+
+from config import SCHEDULER_POLL_INTERVAL, SCHEDULER_MISFIRE_GRACE
+from loggers import errors_logger, messages_logger
+from utils.date_time import get_current_time
+
+SCHEDULER_TABLES_SQL = [
+    'CREATE TABLE IF NOT EXISTS scheduled_task (id BIGINT NOT NULL AUTO_INCREMENT, name VARCHAR(256) NOT NULL, '
+    'next_run_at DATETIME NOT NULL, last_run_at DATETIME, last_status VARCHAR(32), last_error TEXT, '
+    'PRIMARY KEY (id), UNIQUE(id), CONSTRAINT u_scheduled_task_name UNIQUE(name))',
+]
+
+TASK_DONE = 'done'
+TASK_ERROR = 'error'
+TASK_MISSED = 'missed'
+
+
+class Scheduler:
+    """
+    Класс планировщика ежедневных задач.
+
+    Время в таблице scheduled_task - местное время TIMEZONE. Перед запуском задачи в базу данных записывается время
+    следующего запуска, поэтому задача выполняется не больше одного раза за день, даже если бот упал во время её
+    выполнения. Задача, пропущенная из-за остановки бота больше чем на misfire_grace секунд, не выполняется.
+    """
+
+    def __init__(self,
+                 poll_interval: float = SCHEDULER_POLL_INTERVAL,
+                 misfire_grace: float = SCHEDULER_MISFIRE_GRACE) -> None:
+        """
+        init метод.
+
+        Args:
+            poll_interval: интервал проверки задач в секундах
+            misfire_grace: на сколько секунд задача может опоздать, чтобы всё ещё быть выполненной
+        """
+        self._poll_interval = poll_interval
+        self._misfire_grace = misfire_grace
+        # {имя_задачи: (время_запуска, функция)}
+        self._tasks = {}
+        self._task: Union[asyncio.Task, None] = None
+
+    def add_daily(self, name: str, run_time: str, callback: Callable[[datetime], Awaitable]) -> None:
+        """
+        Регистрирует ежедневную задачу.
+
+        Args:
+            name: уникальное имя задачи
+            run_time: время запуска в формате ЧЧ:ММ по местному времени
+            callback: асинхронная функция, принимает запланированное время запуска
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: неверный формат времени
+        """
+        self._tasks[name] = (datetime.strptime(run_time, '%H:%M').time(), callback)
+
+    @staticmethod
+    def get_next_run(run_time: day_time, after: datetime) -> datetime:
+        """
+        Вычисляет время следующего запуска ежедневной задачи.
+
+        Args:
+            run_time: время запуска
+            after: момент, после которого ищется запуск
+
+        Returns:
+            datetime: время следующего запуска
+        """
+        next_run = datetime.combine(after.date(), run_time)
+        return next_run if next_run > after else next_run + timedelta(days=1)
+
+    @staticmethod
+    async def _get_now() -> datetime:
+        """
+        Получает текущее местное время без часового пояса, в таком виде оно хранится в таблице.
+
+        Returns:
+            datetime: текущее время
+        """
+        return (await get_current_time()).replace(tzinfo=None, microsecond=0)
+
+    async def ensure_tables(self) -> None:
+        """
+        Создаёт таблицу задач, если бот был установлен до её появления.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        for sql_request in SCHEDULER_TABLES_SQL:
+            await db.sql(sql_request)
+
+    async def _sync_tasks(self) -> None:
+        """
+        Добавляет в таблицу новые задачи и переносит будущие запуски задач, у которых изменилось время запуска.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        now = await self._get_now()
+        rows = {x['name']: x['next_run_at'] for x in await db.query('scheduled_task.select_all')}
+        for name, (run_time, callback) in self._tasks.items():
+            next_run_at = rows.get(name)
+            if next_run_at is None:
+                await db.query('scheduled_task.insert', (name, self.get_next_run(run_time, now)))
+            elif next_run_at > now and next_run_at.time() != run_time:
+                await db.query('scheduled_task.update_next_run_at', (self.get_next_run(run_time, now), name))
+
+    async def _run_due(self) -> None:
+        """
+        Выполняет задачи, время запуска которых наступило.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import db
+
+        now = await self._get_now()
+        rows = await db.query('scheduled_task.select_due', (now,))
+        for row in rows:
+            task = self._tasks.get(row['name'])
+            if task is None: continue
+            run_time, callback = task
+            scheduled_at = row['next_run_at']
+
+            await db.query('scheduled_task.update_started', (self.get_next_run(run_time, now), now, row['name']))
+
+            if (now - scheduled_at).total_seconds() > self._misfire_grace:
+                messages_logger.info('Задача "%s" пропущена, запланированное время: "%s"', row['name'], scheduled_at)
+                status, error = TASK_MISSED, None
+            else:
+                try:
+                    await callback(scheduled_at)
+                    status, error = TASK_DONE, None
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    errors_logger.exception('Ошибка выполнения задачи "%s"', row['name'])
+                    status, error = TASK_ERROR, str(e)
+            await db.query('scheduled_task.update_result', (status, error, row['name']))
+
+    async def _run(self) -> None:
+        """
+        Цикл планировщика.
+
+        Returns:
+            None
+        """
+        from create_custom_objects import install_state
+
+        # До установки бота таблиц ещё нет
+        while not await install_state.check():
+            await asyncio.sleep(self._poll_interval)
+
+        await self.ensure_tables()
+        await self._sync_tasks()
+        while True:
+            try:
+                await self._run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                errors_logger.exception('Ошибка планировщика задач')
+            await asyncio.sleep(self._poll_interval)
+
+    def start(self) -> None:
+        """
+        Запускает планировщик, если зарегистрирована хотя бы одна задача.
+
+        Returns:
+            None
+        """
+        if not self._tasks or self._task is not None: return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает планировщик.
+
+        Returns:
+            None
+        """
+        if self._task is None: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Хранилища антиспама: в памяти процесса или в хранилище FSM диспетчера."""
+import time
+from collections import OrderedDict
+from typing import Union
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.storage import DELTA, EXCEEDED_COUNT, LAST_CALL, RATE_LIMIT, RESULT
+from aiogram.utils.exceptions import Throttled
+
+from config import THROTTLING_MAX_KEYS, THROTTLING_IDLE_TTL
+
+
+def _get_current_ids(user_id: Union[int, None], chat_id: Union[int, None]) -> tuple:
+    """
+    Получает id пользователя и чата из текущего обновления, если они не переданы явно.
+
+    Args:
+        user_id: id пользователя
+        chat_id: id чата
+
+    Returns:
+        tuple: (user_id, chat_id)
+    """
+    if user_id is None and chat_id is None:
+        chat = types.Chat.get_current()
+        user = types.User.get_current()
+        return user.id if user else None, chat.id if chat else None
+    return user_id, chat_id
+
+
+class StorageThrottling:
+    """Класс антиспама в хранилище FSM диспетчера, состояние общее для всех экземпляров бота."""
+
+    async def throttle(self, key: str, rate: float, user_id: int = None, chat_id: int = None) -> bool:
+        """
+        Отмечает вызов и проверяет лимит.
+
+        Args:
+            key: ключ лимита
+            rate: минимальный интервал между вызовами в секундах
+            user_id: id пользователя, по умолчанию из текущего обновления
+            chat_id: id чата, по умолчанию из текущего обновления
+
+        Returns:
+            bool: True - лимит не превышен
+
+        Raises:
+            Throttled: лимит превышен
+        """
+        return await Dispatcher.get_current().throttle(key, rate=rate, user_id=user_id, chat_id=chat_id)
+
+    async def check_key(self, key: str, user_id: int = None, chat_id: int = None) -> Throttled:
+        """
+        Получает состояние лимита без отметки вызова.
+
+        Args:
+            key: ключ лимита
+            user_id: id пользователя, по умолчанию из текущего обновления
+            chat_id: id чата, по умолчанию из текущего обновления
+
+        Returns:
+            Throttled: состояние лимита
+        """
+        return await Dispatcher.get_current().check_key(key, user_id=user_id, chat_id=chat_id)
+
+
+class MemoryThrottling:
+    """
+    Класс антиспама в памяти процесса для бота, запущенного на одном сервере.
+
+    Повторяет поведение Dispatcher.throttle: вызов проходит, если с предыдущего вызова по этому ключу прошло не
+    меньше rate секунд, время вызова обновляется при каждом вызове. Ключи хранятся в порядке последнего вызова,
+    поэтому простаивающие ключи удаляются с начала словаря, а при превышении max_keys удаляются самые старые.
+    """
+
+    def __init__(self, max_keys: int = THROTTLING_MAX_KEYS, idle_ttl: float = THROTTLING_IDLE_TTL) -> None:
+        """
+        init метод.
+
+        Args:
+            max_keys: максимальное количество хранимых ключей
+            idle_ttl: время в секундах, после которого ключ без вызовов удаляется, не меньше rate ключа
+        """
+        self._max_keys = max_keys
+        self._idle_ttl = idle_ttl
+        # {(chat_id, user_id, key): {LAST_CALL, RATE_LIMIT, DELTA, EXCEEDED_COUNT, RESULT}}
+        self._buckets = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        """
+        Удаляет простаивающие ключи и ключи сверх лимита.
+
+        Args:
+            now: текущее время
+
+        Returns:
+            None
+        """
+        buckets = self._buckets
+        while buckets:
+            data = next(iter(buckets.values()))
+            if now - data[LAST_CALL] < max(self._idle_ttl, data[RATE_LIMIT]) and len(buckets) <= self._max_keys:
+                break
+            buckets.popitem(last=False)
+
+    async def throttle(self, key: str, rate: float, user_id: int = None, chat_id: int = None) -> bool:
+        """
+        Отмечает вызов и проверяет лимит.
+
+        Args:
+            key: ключ лимита
+            rate: минимальный интервал между вызовами в секундах
+            user_id: id пользователя, по умолчанию из текущего обновления
+            chat_id: id чата, по умолчанию из текущего обновления
+
+        Returns:
+            bool: True - лимит не превышен
+
+        Raises:
+            Throttled: лимит превышен
+        """
+        user_id, chat_id = _get_current_ids(user_id, chat_id)
+        now = time.time()
+        bucket_key = (chat_id, user_id, key)
+
+        data = self._buckets.get(bucket_key)
+        if data is None:
+            data = self._buckets[bucket_key] = {EXCEEDED_COUNT: 0}
+        else:
+            self._buckets.move_to_end(bucket_key)
+
+        delta = now - data.get(LAST_CALL, now)
+        result = delta >= rate or delta <= 0
+        data[RESULT] = result
+        data[RATE_LIMIT] = rate
+        data[LAST_CALL] = now
+        data[DELTA] = delta
+        data[EXCEEDED_COUNT] = 1 if result else data[EXCEEDED_COUNT] + 1
+
+        self._evict(now)
+
+        if not result:
+            raise Throttled(key=key, chat=chat_id, user=user_id, **data)
+        return result
+
+    async def check_key(self, key: str, user_id: int = None, chat_id: int = None) -> Throttled:
+        """
+        Получает состояние лимита без отметки вызова.
+
+        Args:
+            key: ключ лимита
+            user_id: id пользователя, по умолчанию из текущего обновления
+            chat_id: id чата, по умолчанию из текущего обновления
+
+        Returns:
+            Throttled: состояние лимита
+        """
+        user_id, chat_id = _get_current_ids(user_id, chat_id)
+        data = self._buckets.get((chat_id, user_id, key), {})
+        return Throttled(key=key, chat=chat_id, user=user_id, **data)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fileencoding=utf-8
+
+# ======================================================================================================================
+#   Copyright (c) 2023.
+#   Сайт: https://catdeveloper.com
+#   Разработчик: https://catdeveloper.com/kontakty
+# ======================================================================================================================
+
+"""Контекст пользователя, загружаемый одним запросом на каждое входящее обновление."""
+from typing import Union
+
+from data_base.queries import GROUP_CONCAT_FIELDS_SEPARATOR, GROUP_CONCAT_ITEMS_SEPARATOR
+from utils.functions import is_empty
+
+
+class UserContext:
+    """Класс с данными пользователя: строка bot_user, роли с приоритетами и группы пользователя."""
+
+    def __init__(self, row: dict) -> None:
+        """
+        init метод.
+
+        Args:
+            row: строка ответа на запрос из get_user_context_by_telegram_id
+        """
+        self.bot_user_id = row['id']
+        self.telegram_id = int(row['telegram_id'])
+        self.telegram_username = row['telegram_username']
+        self.first_name = row['first_name']
+        self.last_name = row['last_name']
+        self.gender = row['gender']
+        self.is_registered = bool(row['is_registered'])
+        self.terms_agree = bool(row['terms_agree'])
+
+        # {id_роли: {'name': название_роли, 'priority': приоритет_роли}}
+        self.roles = {}
+        if row['roles']:
+            for item in row['roles'].split(GROUP_CONCAT_ITEMS_SEPARATOR):
+                role_id, priority, name = item.split(GROUP_CONCAT_FIELDS_SEPARATOR, 2)
+                self.roles.update({int(role_id): {'name': name, 'priority': int(priority)}})
+
+        self.students_groups_ids = [int(x) for x in row['students_groups_ids'].split(',')] \
+            if row['students_groups_ids'] else []
+
+    @property
+    def roles_ids(self) -> list:
+        """
+        Список id ролей пользователя.
+
+        Returns:
+            list: список id ролей
+        """
+        return list(self.roles.keys())
+
+    @property
+    def roles_names(self) -> list:
+        """
+        Список названий ролей пользователя.
+
+        Returns:
+            list: список названий ролей
+        """
+        return [x['name'] for x in self.roles.values()]
+
+    @property
+    def roles_priority(self) -> dict:
+        """
+        Роли пользователя с их приоритетом, аналог get_user_roles_by_telegram_id(with_roles_priority=True).
+
+        Returns:
+            dict: словарь вида {приоритет_роли:название_роли}
+        """
+        return {x['priority']: x['name'] for x in self.roles.values()}
+
+
+async def get_user_context_by_telegram_id(telegram_id: int) -> Union[UserContext, None]:
+    """
+    Получает контекст пользователя по telegram id одним запросом.
+
+    Args:
+        telegram_id: telegram id
+
+    Returns:
+        UserContext: контекст пользователя
+        None: пользователь не найден
+    """
+    from create_custom_objects import db
+
+    response = await db.query('bot_user.select_context_by_telegram_id', (str(telegram_id),))
+    if await is_empty(response): return None
+
+    return UserContext(response[0])
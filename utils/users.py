@@ -26,8 +26,7 @@ async def register_bot_user_by_telegram_id(telegram_id: int) -> None:
     """
     from create_custom_objects import db
 
-    sql_request = f"UPDATE `bot_user` SET `is_registered` = TRUE WHERE `telegram_id` = '{telegram_id}'"
-    await db.sql(sql_request)
+    await db.query('bot_user.update_is_registered_by_telegram_id', (True, str(telegram_id)))
 
 
 async def get_user_roles_by_telegram_id(telegram_id: int,
@@ -48,23 +47,14 @@ async def get_user_roles_by_telegram_id(telegram_id: int,
     """
     from create_custom_objects import db
 
-    roles_ids_request = f"SELECT `bot_role_id` FROM `bot_user_bot_role` WHERE `bot_user_id`=(SELECT `id` FROM " \
-                        f"`bot_user` WHERE `telegram_id`='{telegram_id}')"
-    roles_ids_response = await db.sql(roles_ids_request)
-    if await is_empty(roles_ids_response): return None
-
-    roles_ids = [str(x['bot_role_id']) for x in roles_ids_response]
-    if return_only_ids: return roles_ids
-
-    args = "','".join(roles_ids)
-    sql_request = f"SELECT `name`, `priority` FROM `bot_role` WHERE `id` IN ('{args}')"
-    response = await db.sql(sql_request)
-
+    response = await db.query('bot_role.select_by_telegram_id', (str(telegram_id),))
     if await is_empty(response): return None
 
+    if return_only_ids: return [str(x['id']) for x in response]
+
     if with_roles_priority:
         user_roles = {}
-        for item in response['data']:
+        for item in response:
             user_roles.update({item['priority']: item['name']})
     else:
         user_roles = []